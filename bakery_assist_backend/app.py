@@ -1,19 +1,117 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-import json
-import re
-from helpers.customer_helper import CustomerHelper
-from helpers.customer_verification import CustomerVerificationHelper
-from templates.prompt import SYSTEM_PROMPT_TEMPLATE, TOOL_DESCRIPTIONS_TEXT, RESPONSE_PROMPT_TEMPLATE
-from helpers.ollama_helper import call_ollama, parse_function_call
+import logging
+import time
+from helpers.customer_helper import CustomerHelper, CustomerPageQuery
+from helpers.analytics_refresher import get_analytics_refresher
+from helpers.customer_index import get_customer_index
+from helpers.customer_verification import CustomerVerificationHelper, canonical_customer_number
+from helpers.agent_loop import EMPTY_REPLY, AgentError, AgentLoop, AgentRun
+from helpers.conversation_memory import get_conversation_store, is_valid_session_id, new_session_id
+from helpers.intent_router import get_intent_router
+from helpers.llm_dispatcher import BUSY_REPLY, LLMOverloadedError
+from helpers.response_cache import get_response_cache
+from helpers.stream_helper import format_sse
 from function_calling.function_registry import FunctionRegistry
+from function_calling.tool_retriever import get_tool_retriever
+from utils import config, tracing
+from utils.logging_setup import configure_logging
+from utils.metrics import METRICS, PROMETHEUS_CONTENT_TYPE
+from utils.tracing import span
 
 
 # --- Flask App Initialization ---
+configure_logging()
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 function_registry = FunctionRegistry()
 TOOL_REGISTRY = function_registry.tool_registry()
+if config.CUSTOMER_INDEX_ENABLED:
+    get_customer_index()  # start loading customer ids now rather than on the first chat
+if config.ANALYTICS_BACKGROUND_REFRESH:
+    get_analytics_refresher()
+if config.TOOL_RETRIEVAL_ENABLED:
+    get_tool_retriever().build()  # index the tool descriptions before the first chat
+
+CHAT_STREAM_TTFB_SECONDS = METRICS.histogram("chat_stream_ttfb_seconds", "Time from request arrival to the first streamed reply token")
+
+
+# --- Request Tracing ---
+
+@app.before_request
+def start_trace():
+    """Starts the request's trace under the client's X-Request-ID (or a new id)."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace = tracing.start_request(request.headers.get("X-Request-ID"), route, request.method)
+
+@app.after_request
+def finish_trace(response):
+    """Echoes the request id; streamed bodies finish their trace in stream_reply() instead."""
+    trace = g.get("trace")
+    if trace is not None:
+        response.headers["X-Request-ID"] = trace.request_id
+        if not response.is_streamed:
+            trace.finish(response.status_code)
+    return response
+
+
+# --- Streaming Helpers ---
+
+def wants_stream():
+    """True if the client asked for a Server-Sent Events reply (?stream=true or Accept: text/event-stream)."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_response(events):
+    """Wraps an SSE generator in a non-buffered streaming response."""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(events, mimetype="text/event-stream", headers=headers)
+
+def stream_reply(chunks, request_started, trace, on_complete=None, done_fields=None):
+    """
+    Forwards visible reply chunks (<think> spans already dropped by the agent loop) to the
+    client as SSE.
+    Emits a 'token' message per visible chunk and a final 'done' event with the full reply
+    (plus `done_fields`, e.g. the session id), which is also handed to `on_complete` (e.g.
+    to cache it) once the stream finished cleanly. The body is produced after the view has
+    returned, so the request's `trace` is made current around it and finished at the end.
+    """
+    reply_parts = []
+    first_token_sent = False
+    try:
+        with tracing.activate(trace):
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if not first_token_sent:
+                    CHAT_STREAM_TTFB_SECONDS.observe(time.monotonic() - request_started)
+                    first_token_sent = True
+                reply_parts.append(chunk)
+                yield format_sse({"token": chunk})
+            reply = "".join(reply_parts).strip()
+            if on_complete and reply:
+                on_complete(reply)
+            yield format_sse({"reply": reply, **(done_fields or {})}, event="done")
+    except LLMOverloadedError as e:
+        yield format_sse({"error": BUSY_REPLY, "retry_after": e.retry_after}, event="error")
+    except Exception:
+        logger.exception("Error while streaming reply")
+        yield format_sse({"error": "Failed to get final response from language model"}, event="error")
+    finally:
+        trace.finish(200)
+
+
+def conditional_json(payload, last_modified=None):
+    """JSON response with ETag/Last-Modified validators; answers 304 when the client's copy is current."""
+    response = jsonify(payload)
+    response.add_etag()
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # cache, but revalidate on every use
+    return response.make_conditional(request)
 
 
 # --- Routes ---
@@ -23,22 +121,42 @@ def home():
     """Serves the default home page."""
     return "Welcome to Bake Assist chatbot"
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposes all counters, gauges and histograms in the Prometheus text format."""
+    return Response(METRICS.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    """Fetches and returns a list of key customer details."""
-    customer_helper = CustomerHelper()
-    customers = customer_helper.get_all_customers()
+    """
+    Returns one page of customers: ?after=<customer_pk>&limit=<n>, optionally filtered
+    by ?q=<name substring> and ?group=<customer_group>, projected with ?fields=a,b.
+    Pass the returned `next_after` as `after` to fetch the next page.
+    """
+    try:
+        page_query = CustomerPageQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if customers is None:
+    customer_helper = CustomerHelper()
+    page = customer_helper.get_customers_page(page_query)
+    if page is None:
         return jsonify({"error": "Failed to retrieve customer data"}), 500
-    elif not customers:
-        return jsonify([]), 200
-    else:
-        return jsonify(customers), 200
+
+    payload, last_modified = page
+    return conditional_json(payload, last_modified)
     
 @app.route('/api/chat', methods=['POST'])
 def chat_handler():
-    """Handles incoming chat messages for a specific customer."""
+    """
+    Handles incoming chat messages for a specific customer.
+
+    JSON body: {"message": ..., "session_id": optional}. Replies carry the `session_id` to
+    send with the next message so follow-ups see the earlier turns; without one, a new
+    session is started.
+    """
+    request_started = time.monotonic()
+    stream_mode = wants_stream()
     try:
         # 1. Get data from request
         customer_number = request.args.get('customer_number') # Get from query param
@@ -46,10 +164,17 @@ def chat_handler():
         # Check if customer_number is provided
         if not customer_number:
             return jsonify({"error": "Missing 'customer_number' query parameter"}), 400
+        # Caches, tools and sessions are keyed by the canonical number, as cache invalidation is:
+        # "00123" and "123" must hit the same entries or a change notification misses one of them
+        customer_number = canonical_customer_number(customer_number)
+        if customer_number is None:
+            return jsonify({"error": "Invalid 'customer_number'"}), 400
         
         #1. Check if customer_number is valid
         customer_verification_helper = CustomerVerificationHelper()
-        if not customer_verification_helper.is_valid_customer(customer_number):
+        with span("customer_verification"):
+            valid_customer = customer_verification_helper.is_valid_customer(customer_number)
+        if not valid_customer:
             return jsonify({"error": "Invalid 'customer_number'"}), 400
         
 
@@ -58,101 +183,90 @@ def chat_handler():
         if not data or 'message' not in data:
             return jsonify({"error": "Missing 'message' in JSON body"}), 400
         user_message = data['message']
+        session_id = data.get('session_id')
+        if session_id is not None and not is_valid_session_id(session_id):
+            return jsonify({"error": "Invalid 'session_id'"}), 400
 
-        # 2. First LLM Call (Check for Tool Use)
-        # Provide BOTH placeholders expected by the template string
-        initial_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-            TOOL_DESCRIPTIONS=TOOL_DESCRIPTIONS_TEXT,
-            customer_number=customer_number
-        ) + f"\n\nUser Query: {user_message}"
+        # 1a. Load the session's earlier turns (a new session when none was given)
+        conversation = None
+        session_fields = {}
+        if config.CONVERSATION_MEMORY_ENABLED:
+            conversation_store = get_conversation_store()
+            with span("conversation_load"):
+                conversation = conversation_store.get(session_id or new_session_id(), customer_number)
+            session_fields = {"session_id": conversation.session_id}
 
-        llm_response_content = call_ollama(initial_prompt)
-        if llm_response_content is None:
-            return jsonify({"error": "Failed to get response from language model"}), 500
-        
-        # 3. Parse for Function Call
-        function_call_data = parse_function_call(llm_response_content)
-
-        print("----function call data------")
-        print(function_call_data)
-        print("----end function call data------")
-
-        if function_call_data:
-            # 4. Execute Function if requested
-            tool_name = function_call_data.get("name")
-            tool_args = function_call_data.get("arguments", {})
-
-            if tool_name in TOOL_REGISTRY:
-                tool_function = TOOL_REGISTRY[tool_name]
-                try:
-                    # IMPORTANT: Ensure arguments match the function signature.
-                    # For simplicity here, we pass the dict. More robust parsing/validation needed for production.
-                    # Ensure customer_number from context is used if not provided by LLM or override if needed.
-                    #if 'customer_number' not in tool_args:
-                    tool_args['customer_number'] = customer_number # Inject if missing
-                    
-                    # Call the actual Python function associated with the tool name
-                    function_result_str = tool_function(**tool_args)
-                    print("----function response------")
-                    print(function_result_str)
-                    print("----end function response------")
-                    
-                except TypeError as e:
-                     print(f"Argument mismatch calling tool {tool_name}: {e}")
-                     function_result_str = json.dumps({"error": f"Internal error: Incorrect arguments provided for tool {tool_name}."})
-                except Exception as e:
-                     print(f"Error executing tool {tool_name}: {e}")
-                     function_result_str = json.dumps({"error": f"Error executing tool {tool_name}."})
-
-                # 5. Second LLM Call (Generate Final Response using Tool Result)
-
-                # Step 5a: Format the response-specific part using the template
-                response_task_prompt = RESPONSE_PROMPT_TEMPLATE.format(
-                    function_result=function_result_str, # Pass the actual result string
-                    user_message=user_message           # Pass the original user message
-                )
-
-                # Step 5c: Combine system context and the response task
-                final_prompt = "" + "\n\n" + response_task_prompt
-                # --- END CORRECTION ---
-
-
-                # Step 5d: Call Ollama with the combined final prompt
-                final_llm_response = call_ollama(final_prompt)
-                if final_llm_response is None:
-                    return jsonify({"error": "Failed to get final response from language model after tool use"}), 500
+        def remember(reply):
+            if conversation is not None:
+                conversation_store.record(conversation, user_message, reply)
 
+        # 1b. Serve repeated questions from the response cache (only without history: follow-ups depend on it)
+        cache_lookup = None
+        if config.RESPONSE_CACHE_ENABLED and (conversation is None or conversation.empty):
+            response_cache = get_response_cache()
+            with span("response_cache") as cache_span:
+                cache_lookup = response_cache.lookup(customer_number, user_message)
+                cache_span.set(hit=cache_lookup.hit)
+            if cache_lookup.hit:
+                remember(cache_lookup.reply)
+                if stream_mode:
+                    return sse_response(stream_reply([cache_lookup.reply], request_started, g.trace,
+                                                     done_fields=session_fields))
+                return jsonify({"reply": cache_lookup.reply, **session_fields}), 200
+
+        # 2. Route obvious intents straight to a tool, skipping the tool-detection LLM call
+        first_calls = None
+        on_detection = None
+        if config.INTENT_ROUTER_ENABLED:
+            intent_router = get_intent_router()
+            with span("intent_routing") as routing_span:
+                route = intent_router.route(user_message, known_tools=TOOL_REGISTRY)
+                routing_span.set(routed_to=route.tool_name if route else None)
+            if route:
+                logger.info("Intent router chose '%s' (%s, confidence %.2f)", route.tool_name, route.source,
+                            route.confidence)
+                first_calls = [route.as_function_call()]
             else:
-                # LLM tried to call a function that doesn't exist
-                print(f"Error: LLM requested unknown tool '{tool_name}'")
-                bot_reply = f"Sorry, I encountered an issue trying to use an internal tool ('{tool_name}'). Please try rephrasing your request."
+                on_detection = lambda calls, llm_seconds: intent_router.record_llm_decision(
+                    user_message, calls[0] if calls else None, llm_seconds)
 
+        # 3. Agent loop: LLM -> tools -> LLM ... until an answer, within the step/token/time budget
+        agent_run = AgentRun(customer_number, user_message, first_calls=first_calls, on_detection=on_detection,
+                             history=conversation.history_messages() if conversation is not None else None)
+        agent_loop = AgentLoop(TOOL_REGISTRY)
+
+        # 3a. In streaming mode, forward the final answer token by token
+        if stream_mode:
+            def store_reply(reply):
+                remember(reply)
+                if agent_run.cacheable and cache_lookup:
+                    response_cache.store(cache_lookup, reply)
+            return sse_response(stream_reply(agent_loop.reply_chunks(agent_run, stream=True), request_started,
+                                             g.trace, store_reply, session_fields))
+
+        # 3b. Otherwise run the loop to completion
+        try:
+            bot_reply = "".join(agent_loop.reply_chunks(agent_run)).strip()
+        except AgentError as e:
+            return jsonify({"error": str(e)}), 500
+        except LLMOverloadedError as e:
+            return jsonify({"error": BUSY_REPLY}), 503, {"Retry-After": str(e.retry_after)}
+        if not bot_reply:
+            bot_reply = EMPTY_REPLY
         else:
-            # 6. No Function Call Needed - Use initial response directly
-            bot_reply = "bot ain't working"
-
-        # 7. Clean the final response (remove think block and trim whitespace)
-        bot_reply = final_llm_response # Start with the potentially unclean response
-        if isinstance(bot_reply, str): # Ensure it's a string before cleaning
-            think_pattern = r"<think>.*?</think>"
-            # Use re.sub to replace the pattern with an empty string
-            # Flags: re.DOTALL to match across newlines, re.IGNORECASE for case-insensitivity
-            cleaned_reply = re.sub(think_pattern, "", bot_reply, flags=re.DOTALL | re.IGNORECASE)
-            # Strip leading/trailing whitespace that might remain after removal
-            bot_reply = cleaned_reply.strip()
-        else:
-            # Handle cases where the response wasn't a string (e.g., None)
-             bot_reply = "Sorry, I encountered an unexpected issue generating a response."
-        
-        # 7. Return Final Reply
-        return jsonify({"reply": bot_reply}), 200
-        
+            remember(bot_reply)
+            if agent_run.cacheable and cache_lookup:
+                response_cache.store(cache_lookup, bot_reply)
+
+        # 4. Return Final Reply (with per-step timings and the request's spans when ?trace=1)
+        if request.args.get('trace', '').lower() in ('1', 'true', 'yes'):
+            trace = {**agent_run.trace(), "request": g.trace.as_dict()}
+            return jsonify({"reply": bot_reply, **session_fields, "trace": trace}), 200
+        return jsonify({"reply": bot_reply, **session_fields}), 200
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+    except Exception:
         # Catch other potential errors like JSON decoding errors, etc.
-        print(f"An unexpected error occurred in chat handler: {e}")
+        logger.exception("An unexpected error occurred in chat handler")
         return jsonify({"error": "An unexpected server error occurred"}), 500
 
 # --- Run the App ---
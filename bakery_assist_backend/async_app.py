@@ -0,0 +1,289 @@
+"""
+Asyncio serving mode for Bake Assist.
+
+Exposes the same routes as app.py, but every request runs as a coroutine: Ollama is
+called through a shared httpx.AsyncClient and Postgres through an asyncpg pool, so an
+in-flight chat does not tie up a worker thread while it waits on I/O.
+
+Run with:
+    hypercorn async_app:app --bind 127.0.0.1:5000
+The synchronous Flask app (python app.py) keeps working unchanged.
+"""
+import asyncio
+import logging
+import time
+
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+from helpers.async_ollama_helper import close_async_client
+from helpers.customer_helper import CustomerHelper, CustomerPageQuery
+from helpers.analytics_refresher import get_analytics_refresher
+from helpers.customer_index import get_customer_index
+from helpers.customer_verification import CustomerVerificationHelper, canonical_customer_number
+from helpers.agent_loop import EMPTY_REPLY, AgentError, AgentLoop, AgentRun
+from helpers.conversation_memory import get_conversation_store, is_valid_session_id, new_session_id
+from helpers.intent_router import get_intent_router
+from helpers.llm_dispatcher import BUSY_REPLY, LLMOverloadedError
+from helpers.response_cache import get_response_cache
+from helpers.stream_helper import format_sse
+from function_calling.function_registry import FunctionRegistry
+from function_calling.tool_retriever import get_tool_retriever
+from utils import config, tracing
+from utils.async_db_connection import close_async_pool
+from utils.logging_setup import configure_logging
+from utils.metrics import METRICS, PROMETHEUS_CONTENT_TYPE
+from utils.tracing import span
+
+
+# --- Quart App Initialization ---
+configure_logging()
+logger = logging.getLogger(__name__)
+app = cors(Quart(__name__), allow_origin="*")
+function_registry = FunctionRegistry()
+ASYNC_TOOL_REGISTRY = function_registry.async_tool_registry()
+
+CHAT_STREAM_TTFB_SECONDS = METRICS.histogram("chat_stream_ttfb_seconds", "Time from request arrival to the first streamed reply token")
+
+
+@app.before_serving
+async def startup():
+    """Starts the background customer index loader and analytics refresher, and builds the tool retrieval index."""
+    if config.CUSTOMER_INDEX_ENABLED:
+        get_customer_index()
+    if config.ANALYTICS_BACKGROUND_REFRESH:
+        get_analytics_refresher()
+    if config.TOOL_RETRIEVAL_ENABLED:
+        get_tool_retriever().build()
+
+
+@app.after_serving
+async def shutdown():
+    """Releases the shared HTTP client and DB pool of the serving loop."""
+    await close_async_client()
+    await close_async_pool()
+
+
+# --- Request Tracing ---
+
+@app.before_request
+async def start_trace():
+    """Starts the request's trace under the client's X-Request-ID (or a new id)."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace = tracing.start_request(request.headers.get("X-Request-ID"), route, request.method)
+
+@app.after_request
+async def finish_trace(response):
+    """Echoes the request id; streamed bodies finish their trace in stream_reply() instead."""
+    trace = g.get("trace")
+    if trace is not None:
+        response.headers["X-Request-ID"] = trace.request_id
+        if response.mimetype != "text/event-stream":
+            trace.finish(response.status_code)
+    return response
+
+
+# --- Streaming Helpers ---
+
+def wants_stream():
+    """True if the client asked for a Server-Sent Events reply (?stream=true or Accept: text/event-stream)."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_response(events):
+    """Wraps an async SSE generator in a non-buffered streaming response."""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(events, mimetype="text/event-stream", headers=headers)
+
+async def stream_reply(chunks, request_started, trace, on_complete=None, done_fields=None):
+    """Async twin of app.stream_reply: forwards visible reply chunks as SSE; `on_complete` is a coroutine function."""
+    reply_parts = []
+    first_token_sent = False
+    try:
+        with tracing.activate(trace):
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if not first_token_sent:
+                    CHAT_STREAM_TTFB_SECONDS.observe(time.monotonic() - request_started)
+                    first_token_sent = True
+                reply_parts.append(chunk)
+                yield format_sse({"token": chunk})
+            reply = "".join(reply_parts).strip()
+            if on_complete and reply:
+                await on_complete(reply)
+            yield format_sse({"reply": reply, **(done_fields or {})}, event="done")
+    except LLMOverloadedError as e:
+        yield format_sse({"error": BUSY_REPLY, "retry_after": e.retry_after}, event="error")
+    except Exception:
+        logger.exception("Error while streaming reply")
+        yield format_sse({"error": "Failed to get final response from language model"}, event="error")
+    finally:
+        trace.finish(200)
+
+async def single_chunk(text):
+    """Adapts an already complete reply to the async chunk interface of stream_reply."""
+    yield text
+
+
+async def conditional_json(payload, last_modified=None):
+    """Async twin of app.conditional_json."""
+    response = jsonify(payload)
+    await response.add_etag()
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return await response.make_conditional(request)
+
+
+# --- Routes ---
+
+@app.route('/')
+async def home():
+    """Serves the default home page."""
+    return "Welcome to Bake Assist chatbot"
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Exposes all counters, gauges and histograms in the Prometheus text format."""
+    return Response(METRICS.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/customers', methods=['GET'])
+async def get_customers():
+    """Returns one keyset-paginated page of customers; same parameters as app.get_customers."""
+    try:
+        page_query = CustomerPageQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    customer_helper = CustomerHelper()
+    page = await customer_helper.get_customers_page_async(page_query)
+    if page is None:
+        return jsonify({"error": "Failed to retrieve customer data"}), 500
+
+    payload, last_modified = page
+    return await conditional_json(payload, last_modified)
+
+@app.route('/api/chat', methods=['POST'])
+async def chat_handler():
+    """Handles incoming chat messages for a specific customer without blocking the event loop."""
+    request_started = time.monotonic()
+    stream_mode = wants_stream()
+    try:
+        # 1. Validate the customer and the message
+        customer_number = request.args.get('customer_number')
+        if not customer_number:
+            return jsonify({"error": "Missing 'customer_number' query parameter"}), 400
+        # Caches, tools and sessions are keyed by the canonical number, as cache invalidation is:
+        # "00123" and "123" must hit the same entries or a change notification misses one of them
+        customer_number = canonical_customer_number(customer_number)
+        if customer_number is None:
+            return jsonify({"error": "Invalid 'customer_number'"}), 400
+
+        customer_verification_helper = CustomerVerificationHelper()
+        with span("customer_verification"):
+            valid_customer = await customer_verification_helper.is_valid_customer_async(customer_number)
+        if not valid_customer:
+            return jsonify({"error": "Invalid 'customer_number'"}), 400
+
+        data = await request.get_json()
+        if not data or 'message' not in data:
+            return jsonify({"error": "Missing 'message' in JSON body"}), 400
+        user_message = data['message']
+        session_id = data.get('session_id')
+        if session_id is not None and not is_valid_session_id(session_id):
+            return jsonify({"error": "Invalid 'session_id'"}), 400
+
+        # 1a. Load the session's earlier turns (a new session when none was given)
+        conversation = None
+        session_fields = {}
+        if config.CONVERSATION_MEMORY_ENABLED:
+            conversation_store = get_conversation_store()
+            # A session may have to come back from the spill tier (SQLite/Postgres I/O)
+            with span("conversation_load"):
+                conversation = await asyncio.to_thread(
+                    conversation_store.get, session_id or new_session_id(), customer_number)
+            session_fields = {"session_id": conversation.session_id}
+
+        async def remember(reply):
+            # Recording may spill sessions to SQLite/Postgres, like loading; keep it off the loop too
+            if conversation is not None:
+                await asyncio.to_thread(conversation_store.record, conversation, user_message, reply)
+
+        # 1b. Serve repeated questions from the response cache (only without history: follow-ups depend on it)
+        cache_lookup = None
+        if config.RESPONSE_CACHE_ENABLED and (conversation is None or conversation.empty):
+            response_cache = get_response_cache()
+            with span("response_cache") as cache_span:
+                if response_cache.semantic:
+                    # Semantic lookups embed the message over blocking HTTP; keep that off the loop
+                    cache_lookup = await asyncio.to_thread(response_cache.lookup, customer_number, user_message)
+                else:
+                    cache_lookup = response_cache.lookup(customer_number, user_message)
+                cache_span.set(hit=cache_lookup.hit)
+            if cache_lookup.hit:
+                await remember(cache_lookup.reply)
+                if stream_mode:
+                    return sse_response(stream_reply(single_chunk(cache_lookup.reply), request_started, g.trace,
+                                                     done_fields=session_fields))
+                return jsonify({"reply": cache_lookup.reply, **session_fields}), 200
+
+        # 2. Route obvious intents straight to a tool, skipping the tool-detection LLM call
+        first_calls = None
+        on_detection = None
+        if config.INTENT_ROUTER_ENABLED:
+            intent_router = get_intent_router()
+            with span("intent_routing") as routing_span:
+                route = intent_router.route(user_message, known_tools=ASYNC_TOOL_REGISTRY)
+                routing_span.set(routed_to=route.tool_name if route else None)
+            if route:
+                logger.info("Intent router chose '%s' (%s, confidence %.2f)", route.tool_name, route.source,
+                            route.confidence)
+                first_calls = [route.as_function_call()]
+            else:
+                on_detection = lambda calls, llm_seconds: intent_router.record_llm_decision(
+                    user_message, calls[0] if calls else None, llm_seconds)
+
+        # 3. Agent loop: LLM -> tools -> LLM ... until an answer, within the step/token/time budget
+        agent_run = AgentRun(customer_number, user_message, first_calls=first_calls, on_detection=on_detection,
+                             history=conversation.history_messages() if conversation is not None else None)
+        agent_loop = AgentLoop(ASYNC_TOOL_REGISTRY)
+
+        # 3a. In streaming mode, forward the final answer token by token
+        if stream_mode:
+            async def store_reply(reply):
+                await remember(reply)
+                if agent_run.cacheable and cache_lookup:
+                    response_cache.store(cache_lookup, reply)
+            return sse_response(stream_reply(agent_loop.reply_chunks_async(agent_run, stream=True), request_started,
+                                             g.trace, store_reply, session_fields))
+
+        # 3b. Otherwise run the loop to completion
+        try:
+            bot_reply = "".join([chunk async for chunk in agent_loop.reply_chunks_async(agent_run)]).strip()
+        except AgentError as e:
+            return jsonify({"error": str(e)}), 500
+        except LLMOverloadedError as e:
+            return jsonify({"error": BUSY_REPLY}), 503, {"Retry-After": str(e.retry_after)}
+        if not bot_reply:
+            bot_reply = EMPTY_REPLY
+        else:
+            await remember(bot_reply)
+            if agent_run.cacheable and cache_lookup:
+                response_cache.store(cache_lookup, bot_reply)
+
+        # 4. Return Final Reply (with per-step timings and the request's spans when ?trace=1)
+        if request.args.get('trace', '').lower() in ('1', 'true', 'yes'):
+            trace = {**agent_run.trace(), "request": g.trace.as_dict()}
+            return jsonify({"reply": bot_reply, **session_fields, "trace": trace}), 200
+        return jsonify({"reply": bot_reply, **session_fields}), 200
+
+    except Exception:
+        logger.exception("An unexpected error occurred in chat handler")
+        return jsonify({"error": "An unexpected server error occurred"}), 500
+
+# --- Run the App ---
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
@@ -0,0 +1,97 @@
+"""
+Compares live aggregation against the precomputed analytics summaries for each analytics tool.
+
+For a random sample of customers, every tool query runs twice per customer:
+  - live:        aggregates invoices/invoice_items on the spot (LIVE_* queries);
+  - precomputed: reads the summary tables from bakery_assist_data/invoice_analytics.sql.
+Both variants must return the same rows; mismatches are counted and reported, since a
+summary that drifted from the invoices is a bug, not a speed-up.
+
+Needs the analytics SQL applied to a populated database (see bulk_generate_bakery_data.py):
+
+    python benchmarks/analytics_benchmark.py --customers 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from function_calling.analytics_declaration import (  # noqa: E402
+    LIVE_OPEN_BALANCE_SQL,
+    LIVE_ORDER_FREQUENCY_SQL,
+    LIVE_SPEND_BY_PERIOD_SQL,
+    OPEN_BALANCE_SQL,
+    ORDER_FREQUENCY_SQL,
+    SPEND_BY_PERIOD_SQL,
+    top_products_sql,
+)
+from utils.db_connection import DataBaseConnection  # noqa: E402
+
+# tool -> (live sql, precomputed sql, params builder)
+QUERIES = {
+    "get_spend_by_period": (LIVE_SPEND_BY_PERIOD_SQL, SPEND_BY_PERIOD_SQL, lambda pk: ("month", pk, 12)),
+    "get_outstanding_balance": (LIVE_OPEN_BALANCE_SQL, OPEN_BALANCE_SQL, lambda pk: (pk,)),
+    "get_top_products": (top_products_sql("quantity", live=True), top_products_sql("quantity"), lambda pk: (pk, 5)),
+    "get_order_frequency": (LIVE_ORDER_FREQUENCY_SQL, ORDER_FREQUENCY_SQL, lambda pk: (pk,)),
+}
+
+
+def timed_fetch(cur, sql, params):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    return rows, (time.perf_counter() - started) * 1000
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(durations_ms):
+    return {
+        "mean_ms": round(statistics.fmean(durations_ms), 3),
+        "p50_ms": round(statistics.median(durations_ms), 3),
+        "p95_ms": round(percentile(durations_ms, 0.95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=200, help="customers sampled per tool")
+    args = parser.parse_args()
+
+    with DataBaseConnection().connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT refresh_dirty_customer_analytics(1000000)")  # compare against fresh summaries
+        cur.execute("SELECT customer_pk FROM customers ORDER BY random() LIMIT %s", (args.customers,))
+        customers = [row[0] for row in cur.fetchall()]
+        print(f"{len(customers)} customers sampled")
+
+        for tool, (live_sql, precomputed_sql, params_for) in QUERIES.items():
+            live_ms, precomputed_ms, mismatches = [], [], 0
+            for customer_pk in customers:
+                params = params_for(customer_pk)
+                # Alternate the order so neither variant always runs against a warmer cache
+                if customer_pk % 2:
+                    live_rows, live_time = timed_fetch(cur, live_sql, params)
+                    precomputed_rows, precomputed_time = timed_fetch(cur, precomputed_sql, params)
+                else:
+                    precomputed_rows, precomputed_time = timed_fetch(cur, precomputed_sql, params)
+                    live_rows, live_time = timed_fetch(cur, live_sql, params)
+                live_ms.append(live_time)
+                precomputed_ms.append(precomputed_time)
+                mismatches += live_rows != precomputed_rows
+
+            live, precomputed = summarize(live_ms), summarize(precomputed_ms)
+            speedup = live["mean_ms"] / precomputed["mean_ms"] if precomputed["mean_ms"] else float("inf")
+            print(f"{tool:<24} live {live}  precomputed {precomputed}  "
+                  f"speedup x{speedup:.1f}  mismatches {mismatches}")
+        cur.close()
+
+
+if __name__ == "__main__":
+    main()
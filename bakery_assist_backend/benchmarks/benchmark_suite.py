@@ -0,0 +1,500 @@
+"""
+End-to-end benchmark suite: /api/chat and /api/customers under load, per dataset scale.
+
+For each --dataset (a manifest written by the data generators, see
+bakery_assist_data/dataset_manifest.py) the suite
+  1. optionally reloads it (--load runs bulk_generate_bakery_data.py --from-manifest
+     --truncate, so only that generator's manifests can be reloaded) and checks the database against the manifest's checksums;
+  2. samples customers and their latest invoice numbers from the database with --seed,
+     so every run and every target replays the same request sequence;
+  3. starts the servers under test (--serve sync / --serve async) against a fake Ollama
+     (benchmarks/fake_ollama.py, started by the suite unless --ollama-url is given), or
+     uses already running --target servers;
+  4. runs each --scenario at each --concurrency level and records requests/sec,
+     p50/p95/p99/max latency and errors, time to first token for streamed chats, and
+     the server's mean time per chat stage (from the /metrics chat_stage_seconds histogram).
+Without --dataset the suite runs once against whatever the database holds.
+
+Results are written as JSON (--output) together with the git commit, the settings and the
+dataset manifests. --compare prints the change against an earlier results file and exits
+non-zero when p95 latency or throughput got worse by more than --max-regression percent.
+
+Two scales, both serving modes, the fake Ollama generating 40 tokens/s:
+    python benchmarks/benchmark_suite.py --dataset small=small_manifest.json \\
+        --dataset large=large_manifest.json --load --serve sync --serve async \\
+        --concurrency 1 8 32 --requests 200 --output results.json
+Against a running server, compared with an earlier run:
+    python benchmarks/benchmark_suite.py --target dev=http://127.0.0.1:5000 \\
+        --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCHMARKS_DIR, "..")
+DATA_DIR = os.path.join(BACKEND_DIR, "..", "bakery_assist_data")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, DATA_DIR)
+
+from fake_ollama import add_settings_arguments, settings_from_args  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+SCENARIOS = ("chat", "chat_stream", "customers")
+
+CHAT_MESSAGES = (
+    "Show me my last {n} invoices",
+    "What items were on invoice {invoice}?",
+    "Compare invoices {invoice} and {other_invoice}",
+    "How much did I spend per {period}?",
+    "What do I still owe you?",
+    "Which products do I order most?",
+    "How often do I order?",
+    "Hi, what can you do for me?",
+)
+
+SAMPLE_CUSTOMERS_SQL = """
+    SELECT c.customer_number,
+           ARRAY(SELECT i.invoice_number FROM invoices i WHERE i.customer_fk = c.customer_pk
+                 ORDER BY i.invoice_date DESC, i.invoice_pk DESC LIMIT 3)
+    FROM customers c
+    WHERE c.customer_pk = ANY(%s)
+    ORDER BY c.customer_pk
+"""
+
+SERVE_COMMANDS = {
+    "sync": lambda port: [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port),
+                          "--no-reload", "--no-debugger", "--with-threads"],
+    "async": lambda port: [sys.executable, "-m", "hypercorn", "async_app:app", "--bind", f"127.0.0.1:{port}"],
+}
+
+_STAGE_SAMPLE = re.compile(r'^chat_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+# --- Workload ---
+
+class Workload:
+    """The customers (with invoice numbers) and groups requests are drawn from."""
+
+    def __init__(self, customers, groups, max_customer_pk):
+        self.customers = customers
+        self.groups = groups
+        self.max_customer_pk = max_customer_pk
+
+    @classmethod
+    def from_database(cls, count, seed):
+        from utils.db_connection import DataBaseConnection
+
+        rng = random.Random(seed)
+        with DataBaseConnection().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COALESCE(MAX(customer_pk), 0) FROM customers")
+                max_pk = cur.fetchone()[0]
+                if not max_pk:
+                    raise SystemExit("The customers table is empty; load a dataset first.")
+                cur.execute(SAMPLE_CUSTOMERS_SQL, (rng.sample(range(1, max_pk + 1), min(count, max_pk)),))
+                customers = [(number, list(invoices)) for number, invoices in cur.fetchall()]
+                cur.execute("SELECT DISTINCT customer_group FROM customers WHERE customer_group IS NOT NULL")
+                groups = sorted(row[0] for row in cur.fetchall())
+            conn.commit()
+        return cls(customers, groups, max_pk)
+
+    @classmethod
+    def from_customer_numbers(cls, numbers):
+        return cls([(number, []) for number in numbers], [], 0)
+
+    def chat_requests(self, count, rng):
+        """(query params, JSON body) per chat; invoice questions only for customers that have invoices."""
+        plan = []
+        for _ in range(count):
+            customer_number, invoices = rng.choice(self.customers)
+            templates = CHAT_MESSAGES if invoices else [t for t in CHAT_MESSAGES if "{invoice}" not in t]
+            message = rng.choice(templates).format(
+                n=rng.randint(2, 5), period=rng.choice(["month", "quarter", "year"]),
+                invoice=invoices[0] if invoices else "", other_invoice=invoices[-1] if invoices else "")
+            plan.append(({"customer_number": customer_number}, {"message": message}))
+        return plan
+
+    def customer_page_requests(self, count, rng):
+        """Query params per /api/customers page: random cursors, some with a name or group filter."""
+        plan = []
+        for _ in range(count):
+            params = {"limit": rng.choice([20, 50, 100])}
+            if self.max_customer_pk:
+                params["after"] = rng.randint(0, self.max_customer_pk)
+            roll = rng.random()
+            if roll < 0.2 and self.groups:
+                params["group"] = rng.choice(self.groups)
+            elif roll < 0.35:
+                params["q"] = rng.choice(["bak", "cafe", "inc", "and", "son"])
+            plan.append((params, None))
+        return plan
+
+
+# --- Processes ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url, process, log_path, timeout=90.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}; see {log_path}")
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s; see {log_path}")
+
+
+class ManagedProcess:
+    """A subprocess (fake Ollama or a backend server), ready once `base_url + ready_path` answers."""
+
+    def __init__(self, name, command, base_url, log_dir, ready_path="/", cwd=None, env=None):
+        self.name = name
+        self.command = command
+        self.base_url = base_url
+        self.ready_url = base_url + ready_path
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self.cwd = cwd
+        self.env = env
+        self.process = None
+
+    def __enter__(self):
+        log = open(self.log_path, "ab")
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        try:
+            wait_until_ready(self.ready_url, self.process, self.log_path)
+        except RuntimeError:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def check_reloadable(manifest_path):
+    """Refuses a manifest the bulk generator cannot reproduce (one written by generate_bakery_data.py)."""
+    with open(manifest_path, encoding="utf-8") as f:
+        generator = json.load(f).get("generator")
+    if generator != "bulk_generate_bakery_data.py":
+        raise SystemExit(f"--load reloads through bulk_generate_bakery_data.py, but {manifest_path} "
+                         f"was written by {generator}; load it with that generator and run without --load.")
+
+
+def load_dataset(manifest_path, log_dir):
+    """Reloads the dataset a manifest describes, writing the reproduced manifest next to the logs."""
+    command = [sys.executable, "bulk_generate_bakery_data.py", "--from-manifest", os.path.abspath(manifest_path),
+               "--truncate", "--manifest", os.path.join(log_dir, "reloaded_manifest.json")]
+    print(f"Loading {manifest_path} ...", flush=True)
+    subprocess.run(command, cwd=DATA_DIR, check=True)
+
+
+def verify_dataset(manifest):
+    from dataset_manifest import verify_manifest
+    from utils.db_connection import DataBaseConnection
+
+    with DataBaseConnection().connection() as conn:
+        return verify_manifest(conn, manifest)
+
+
+# --- Measurement ---
+
+async def send(client, base_url, scenario, params, body):
+    """Sends one request; returns (ok, seconds to first streamed token or None)."""
+    if scenario == "customers":
+        response = await client.get(f"{base_url}/api/customers", params=params)
+        return response.status_code == 200, None
+    if scenario == "chat":
+        response = await client.post(f"{base_url}/api/chat", params=params, json=body)
+        return response.status_code == 200, None
+
+    started = time.perf_counter()
+    first_token = None
+    done = False
+    async with client.stream("POST", f"{base_url}/api/chat", params={**params, "stream": "true"}, json=body) as response:
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("data:"):
+                first_token = time.perf_counter() - started
+            elif line == "event: done":
+                done = True
+    return response.status_code == 200 and done, first_token
+
+
+async def scrape_stages(client, base_url):
+    """{stage: (seconds, count)} from the server's chat_stage_seconds histogram; empty if /metrics is missing."""
+    try:
+        response = await client.get(f"{base_url}/metrics")
+    except httpx.HTTPError:
+        return {}
+    if response.status_code != 200:
+        return {}
+    stages = {}
+    for kind, stage, value in _STAGE_SAMPLE.findall(response.text):
+        seconds, count = stages.get(stage, (0.0, 0))
+        stages[stage] = (seconds + float(value), count) if kind == "sum" else (seconds, count + int(float(value)))
+    return stages
+
+
+def stage_means(before, after):
+    means = {}
+    for stage, (seconds, count) in after.items():
+        old_seconds, old_count = before.get(stage, (0.0, 0))
+        if count > old_count:
+            means[stage] = round((seconds - old_seconds) / (count - old_count) * 1000, 2)
+    return means
+
+
+async def run_scenario(base_url, scenario, plan, concurrency, warmup, timeout):
+    """
+    Sends the first `warmup` requests of `plan` one by one, then replays the rest with at most
+    `concurrency` requests in flight and summarizes the latencies.
+    """
+    latencies = []
+    first_tokens = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        for params, body in plan[:warmup]:
+            try:
+                await send(client, base_url, scenario, params, body)
+            except httpx.HTTPError:
+                pass
+        stages_before = await scrape_stages(client, base_url)
+        pending = iter(plan[warmup:])
+
+        async def worker():
+            nonlocal errors
+            for params, body in pending:
+                started = time.perf_counter()
+                try:
+                    ok, first_token = await send(client, base_url, scenario, params, body)
+                except httpx.HTTPError:
+                    ok, first_token = False, None
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stages = stage_means(stages_before, await scrape_stages(client, base_url)) if scenario != "customers" else {}
+
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        **{f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 2) for pct in (50, 95, 99)},
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+    }
+    if first_tokens:
+        result.update({f"ttft_p{pct}_ms": round(percentile(first_tokens, pct) * 1000, 2) for pct in (50, 95)})
+    if stages:
+        result["stage_mean_ms"] = stages
+    return result
+
+
+# --- Results ---
+
+def run_metadata(args, fake_settings):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "server_env": dict(args.env),
+        "fake_ollama": fake_settings.as_dict() if fake_settings else None,
+    }
+
+
+def run_key(run):
+    return run["dataset"], run["target"], run["scenario"], run["concurrency"]
+
+
+def compare(baseline, results, max_regression):
+    """Prints current vs baseline per run; returns the number of regressions beyond `max_regression` percent."""
+    previous = {run_key(run): run for run in baseline["runs"]}
+    regressions = 0
+    print(f"\n{'dataset/target/scenario/conc':<44} {'rps':>17} {'p95 ms':>21}")
+    for run in results["runs"]:
+        old = previous.get(run_key(run))
+        if old is None:
+            continue
+        rps_change = (run["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+        p95_change = (run["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0.0
+        worse = rps_change < -max_regression or p95_change > max_regression
+        regressions += worse
+        label = "/".join(str(part) for part in run_key(run))
+        print(f"{label:<44} {old['throughput_rps']:>7}->{run['throughput_rps']:<7} "
+              f"{old['p95_ms']:>9}->{run['p95_ms']:<9} {rps_change:+6.1f}% {p95_change:+6.1f}%"
+              f"{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+# --- Driver ---
+
+def parse_pairs(values, what):
+    pairs = []
+    for value in values or []:
+        name, sep, rest = value.partition("=")
+        if not sep or not name or not rest:
+            raise SystemExit(f"--{what} expects NAME=VALUE, got {value!r}")
+        pairs.append((name, rest))
+    return pairs
+
+
+async def benchmark_targets(targets, workload, dataset, args, results):
+    for scenario in args.scenario:
+        rng = random.Random(f"{args.seed}:{scenario}")
+        count = args.requests + args.warmup
+        plan = workload.customer_page_requests(count, rng) if scenario == "customers" else workload.chat_requests(count, rng)
+        for concurrency in args.concurrency:
+            for target, base_url in targets:
+                print(f"[{dataset}] {target} {scenario} x{args.requests} at concurrency {concurrency} ...", flush=True)
+                run = await run_scenario(base_url, scenario, plan, concurrency, args.warmup, args.timeout)
+                run = {"dataset": dataset, "target": target, "scenario": scenario, "concurrency": concurrency, **run}
+                results["runs"].append(run)
+                print(f"    {run['throughput_rps']} req/s, p50 {run['p50_ms']} ms, p95 {run['p95_ms']} ms, "
+                      f"p99 {run['p99_ms']} ms, {run['errors']} errors", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", action="append", help="NAME=MANIFEST_PATH, repeatable (one run per scale)")
+    parser.add_argument("--load", action="store_true", help="reload each dataset from its manifest before running")
+    parser.add_argument("--serve", action="append", choices=sorted(SERVE_COMMANDS),
+                        help="start this serving mode for each dataset, repeatable")
+    parser.add_argument("--target", action="append", help="NAME=BASE_URL of an already running server, repeatable")
+    parser.add_argument("--ollama-url", help="Ollama the started servers use (default: start the fake one)")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to started servers, repeatable")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario and concurrency")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests sent first")
+    parser.add_argument("--customers", type=int, default=200, help="customers sampled per dataset")
+    parser.add_argument("--customer-number", action="append",
+                        help="use these customers instead of sampling the database (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="percent tolerated by --compare")
+    parser.add_argument("--log-dir", help="server and loader logs (default: a temporary directory)")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    args.env = parse_pairs(args.env, "env")
+    targets = parse_pairs(args.target, "target")
+    datasets = parse_pairs(args.dataset, "dataset") or [("current", None)]
+    if not targets and not args.serve:
+        parser.error("give --serve and/or --target")
+    if args.load:
+        for _, manifest_path in datasets:
+            if manifest_path:
+                check_reloadable(manifest_path)
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="bakery_bench_")
+    os.makedirs(log_dir, exist_ok=True)
+
+    fake_settings = settings_from_args(args) if args.serve and not args.ollama_url else None
+    results = {"meta": run_metadata(args, fake_settings), "datasets": {}, "runs": []}
+
+    with contextlib.ExitStack() as processes:
+        ollama_url = args.ollama_url
+        if fake_settings:
+            port = free_port()
+            command = [sys.executable, os.path.join(BENCHMARKS_DIR, "fake_ollama.py"), "--port", str(port)]
+            for option, value in fake_settings.as_dict().items():
+                command += [f"--{option.replace('_', '-')}", str(value)]
+            ollama_url = processes.enter_context(ManagedProcess(
+                "fake_ollama", command, f"http://127.0.0.1:{port}", log_dir, ready_path="/api/version")).base_url
+        env = {**os.environ, "BAKERY_OLLAMA_BASE_URL": ollama_url or "", "BAKERY_LOG_LEVEL": "WARNING", **dict(args.env)}
+
+        for dataset, manifest_path in datasets:
+            manifest = None
+            if manifest_path:
+                if args.load:
+                    load_dataset(manifest_path, log_dir)
+                with open(manifest_path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+            if args.customer_number:
+                workload = Workload.from_customer_numbers(args.customer_number)
+                differences = None
+            else:
+                workload = Workload.from_database(args.customers, args.seed)
+                differences = verify_dataset(manifest) if manifest else None
+            if differences:
+                print(f"[{dataset}] database does NOT match {manifest_path}: {'; '.join(differences)}")
+            results["datasets"][dataset] = {
+                "manifest": manifest_path,
+                "seed": manifest and manifest["seed"],
+                "parameters": manifest and manifest["parameters"],
+                "tables": manifest and manifest["tables"],
+                "verified": None if differences is None else not differences,
+                "sampled_customers": len(workload.customers),
+            }
+
+            # Fresh servers per dataset: the customer index and caches must not outlive the data
+            with contextlib.ExitStack() as servers:
+                run_targets = []
+                for mode in args.serve or []:
+                    port = free_port()
+                    server = servers.enter_context(ManagedProcess(
+                        f"{dataset}_{mode}", SERVE_COMMANDS[mode](port), f"http://127.0.0.1:{port}", log_dir,
+                        cwd=BACKEND_DIR, env=env))
+                    run_targets.append((mode, server.base_url))
+                asyncio.run(benchmark_targets(run_targets + targets, workload, dataset, args, results))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Results written to {args.output}")
+    print(f"Logs in {log_dir}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.max_regression)
+        if regressions:
+            print(f"FAIL: {regressions} run(s) regressed by more than {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Measures conversation memory: bytes per active session, history tokens per prompt,
+and the cost of spilling sessions to SQLite and loading them back.
+
+Synthetic sessions of bakery-style turns (questions with invoice numbers, multi-line
+answers) are recorded through helpers/conversation_memory.py ConversationStore. For each
+turn count it reports:
+  - traced_bytes_per_session: tracemalloc growth per session, i.e. the real footprint;
+  - estimated_bytes_per_session: what the store accounts (Conversation.size_bytes);
+  - history_tokens: tokens sent with the next message, against the tokens of the full
+    transcript that resending everything would cost.
+The script exits non-zero if the history goes over BAKERY_CONVERSATION_MAX_TOKENS or the
+accounted size is off from the traced one by more than 2x.
+
+No database or Ollama is needed:
+
+    python benchmarks/conversation_memory_benchmark.py --sessions 2000 --turns 2 10 40
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from helpers.conversation_memory import ConversationStore, SQLiteConversationSpill, new_session_id  # noqa: E402
+from utils import config  # noqa: E402
+from utils.token_estimator import estimate_text_tokens  # noqa: E402
+
+QUESTIONS = [
+    "Show me my last {n} invoices",
+    "What items were on invoice INV2024{i:07d}?",
+    "How much did I spend last quarter?",
+    "And the one before that?",
+    "What do I still owe you?",
+    "Which products do I order most often?",
+]
+ANSWER_LINES = [
+    "Invoice INV2024{i:07d} from 2024-03-{d:02d} totals {a:.2f} EUR and is {s}.",
+    "It contains {q} x Sourdough Loaf, {q2} x Butter Croissant and {q3} x Rye Bread.",
+    "Your open balance is {a:.2f} EUR across {q} invoices; the oldest is due on 2024-04-{d:02d}.",
+    "You spent {a:.2f} EUR in that period, {q} invoices in total.",
+]
+
+
+def synthetic_turn(rng):
+    question = rng.choice(QUESTIONS).format(n=rng.randint(2, 5), i=rng.randint(1, 9_999_999))
+    lines = [rng.choice(ANSWER_LINES).format(i=rng.randint(1, 9_999_999), d=rng.randint(1, 28),
+                                             a=rng.uniform(20, 900), s=rng.choice(["paid", "open", "overdue"]),
+                                             q=rng.randint(1, 40), q2=rng.randint(1, 40), q3=rng.randint(1, 40))
+             for _ in range(rng.randint(1, 4))]
+    return question, " ".join(lines)
+
+
+def run_turns(session_count, turns, rng):
+    store = ConversationStore(ttl=3600, max_sessions=session_count + 1, max_bytes=1 << 40)
+    transcripts = []
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for n in range(session_count):
+        conversation = store.get(new_session_id(), f"CUST{100000 + n}")
+        transcript_tokens = 0
+        for _ in range(turns):
+            question, answer = synthetic_turn(rng)
+            transcript_tokens += estimate_text_tokens(question) + estimate_text_tokens(answer)
+            store.record(conversation, question, answer)
+        transcripts.append(transcript_tokens)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    conversations = list(store._sessions.values())
+    history = [conversation.history_tokens() for conversation in conversations]
+    traced = (after - before) / session_count
+    estimated = store.stats()["bytes_per_session"]
+    return store, {
+        "turns": turns,
+        "sessions": session_count,
+        "traced_bytes_per_session": round(traced),
+        "estimated_bytes_per_session": estimated,
+        "history_tokens_mean": round(statistics.fmean(history)),
+        "history_tokens_max": max(history),
+        "full_transcript_tokens_mean": round(statistics.fmean(transcripts)),
+        "estimate_within_2x": traced / 2 <= estimated <= traced * 2,
+    }
+
+
+def spill_round_trip(store, count):
+    """Seconds per session to spill to SQLite and load back."""
+    with tempfile.TemporaryDirectory() as directory:
+        spill = SQLiteConversationSpill(os.path.join(directory, "sessions.sqlite3"))
+        conversations = list(store._sessions.values())[:count]
+        started = time.perf_counter()
+        for conversation in conversations:
+            spill.save(conversation)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        restored = [spill.take(conversation.session_id) for conversation in conversations]
+        loaded = time.perf_counter() - started
+        spill._conn.close()
+    intact = all(r is not None and r.history_messages() == c.history_messages()
+                 for r, c in zip(restored, conversations))
+    return {"spilled": len(conversations), "save_ms_per_session": round(saved / len(conversations) * 1000, 3),
+            "load_ms_per_session": round(loaded / len(conversations) * 1000, 3), "intact": intact}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, nargs="+", default=[2, 10, 40], help="turns recorded per session")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failed = False
+    store = None
+    for turns in args.turns:
+        store, result = run_turns(args.sessions, turns, rng)
+        print(result)
+        failed |= result["history_tokens_max"] > config.CONVERSATION_MAX_TOKENS or not result["estimate_within_2x"]
+    spill = spill_round_trip(store, min(500, args.sessions))
+    print(spill)
+    failed |= not spill["intact"]
+    if failed:
+        print("FAIL: history over its token budget, size accounting off, or spill round trip lost data")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
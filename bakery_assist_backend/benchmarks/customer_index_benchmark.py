@@ -0,0 +1,104 @@
+"""
+Measures memory and lookup latency of the in-memory customer index against the
+alternatives it replaced or could have used, for synthetic customer id sets.
+
+For each size it builds:
+  - bitmap:     helpers/customer_index.py CustomerIdIndex (1 bit per id up to the highest id);
+  - python_set: a plain set of ints, the obvious "compact int set" baseline;
+and reports bytes per million customers plus the mean membership test time for
+hits and misses. The script exits non-zero if the index gives a wrong answer or
+uses more memory than the documented budget (bitmap bytes <= max_id / 8 + 1).
+
+No database or Ollama is needed:
+
+    python benchmarks/customer_index_benchmark.py --sizes 100000 1000000 10000000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from helpers.customer_index import CustomerIdIndex  # noqa: E402
+
+LOOKUPS = 200_000
+
+
+def customer_ids(count, deleted_fraction):
+    """Dense SERIAL-like ids 1..n with a fraction removed, as after deletes."""
+    ids = list(range(1, count + 1))
+    random.shuffle(ids)
+    return ids[int(count * deleted_fraction):]
+
+
+def measure(build):
+    """Returns (object, bytes allocated while building it)."""
+    tracemalloc.start()
+    obj = build()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def build_bitmap(ids, max_id):
+    index = CustomerIdIndex(max_bytes=1 << 40)
+    index.replace(ids, max_id)  # what the startup load does with the ids streamed from Postgres
+    return index
+
+
+def lookup_ns(contains, keys):
+    timer = timeit.Timer(lambda: [contains(k) for k in keys])
+    return min(timer.repeat(repeat=3, number=1)) / len(keys) * 1e9
+
+
+def run_size(count, deleted_fraction):
+    ids = customer_ids(count, deleted_fraction)
+    present = set(ids)
+    max_id = count
+    hits = random.sample(ids, min(LOOKUPS, len(ids)))
+    misses = [max_id + 1 + i for i in range(len(hits) // 2)] + \
+             [k for k in range(1, max_id + 1) if k not in present][:len(hits) // 2]
+
+    index, bitmap_bytes = measure(lambda: build_bitmap(ids, max_id))
+    id_set, set_bytes = measure(lambda: set(ids))
+
+    wrong = sum(1 for k in hits if not index.contains(k)) + sum(1 for k in misses if index.contains(k))
+    budget = max_id // 8 + 1
+    per_million = 1_000_000 / max(1, len(ids))
+    return {
+        "customers": len(ids),
+        "bitmap_bytes": index.memory_bytes(),
+        "bitmap_bytes_per_1M": round(index.memory_bytes() * per_million),
+        "bitmap_traced_bytes": bitmap_bytes,
+        "set_bytes_per_1M": round(set_bytes * per_million),
+        "bitmap_hit_ns": round(lookup_ns(index.contains, hits), 1),
+        "bitmap_miss_ns": round(lookup_ns(index.contains, misses), 1) if misses else None,
+        "set_hit_ns": round(lookup_ns(id_set.__contains__, hits), 1),
+        "wrong_answers": wrong,
+        "within_budget": index.memory_bytes() <= budget,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--deleted-fraction", type=float, default=0.02, help="share of ids removed before measuring")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    failed = False
+    for count in args.sizes:
+        result = run_size(count, args.deleted_fraction)
+        print(result)
+        failed |= result["wrong_answers"] > 0 or not result["within_budget"]
+    if failed:
+        print("FAIL: wrong membership answers or bitmap over its memory budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
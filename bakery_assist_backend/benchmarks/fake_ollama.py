@@ -0,0 +1,347 @@
+"""
+A deterministic stand-in for the Ollama HTTP API, so the backend can be benchmarked
+without a GPU or a pulled model.
+
+It answers POST /api/chat (streamed NDJSON or a single JSON object) and /api/embed the
+way Ollama does, including the timing fields (prompt_eval_count/duration, eval_count/
+duration, load_duration). Replies depend only on the request, never on chance:
+  - a tool-detection prompt (the system prompt carries the tool-calling instructions and
+    no <function_response> has been sent yet) gets a <think> block followed by a
+    <function_call> tag, picked from the user query with keyword rules and restricted to
+    the tools listed in the prompt, and --epilogue-tokens words of prose after it (models
+    often explain the call they just made); queries no rule matches get a direct answer;
+  - any other prompt gets a <think> block and a plain answer of --answer-tokens words.
+Requests with "think": false get no <think> block, and requests with a "format" get the
+calls as a bare JSON array ([] when no rule matches); options.num_predict and
+options.stop are honoured.
+
+Timing is simulated per request: --load-latency, then prompt tokens at
+--prompt-tokens-per-second, then completion tokens at --tokens-per-second. Like Ollama's
+KV cache, the part of a prompt shared with one of the last --parallel prompts is not
+evaluated again, so a stable system prefix pays off here too. At most --parallel
+requests generate at once (like OLLAMA_NUM_PARALLEL); the others queue.
+
+    python benchmarks/fake_ollama.py --port 11435 --tokens-per-second 40 --parallel 4
+    BAKERY_OLLAMA_BASE_URL=http://127.0.0.1:11435 python app.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "fresh sourdough croissant rye butter flour oven batch delivery invoice total order "
+    "weekly morning bakery loaf pastry baguette crust dough proof bake shelf customer"
+).split()
+EMBEDDING_DIMENSIONS = 64
+
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+_INVOICE_PATTERN = re.compile(r"\bINV\d+\b", re.IGNORECASE)
+_CUSTOMER_PATTERN = re.compile(r"Number:\s*([A-Za-z0-9_-]+)")
+_NUMBER_PATTERN = re.compile(r"\b(\d{1,2})\b")
+_TOOL_PROMPT_MARKER = "<function_call>"
+_FUNCTION_RESPONSE_MARKER = "<function_response"
+
+
+def tokenize(text):
+    """Splits text into word-ish tokens (each keeps its trailing whitespace), roughly one per LLM token."""
+    return _TOKEN_PATTERN.findall(text)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def filler(seed_text, count):
+    """`count` words chosen deterministically from `seed_text`."""
+    digest = hashlib.sha256(seed_text.encode("utf-8")).digest()
+    return " ".join(WORDS[(digest[i % len(digest)] + i) % len(WORDS)] for i in range(count))
+
+
+# --- Tool Decisions ---
+
+def _invoice_call(query, offered):
+    invoices = [number.upper() for number in _INVOICE_PATTERN.findall(query)]
+    if len(invoices) > 1 and "get_multiple_invoice_details" in offered:
+        return "get_multiple_invoice_details", {"invoice_numbers": invoices}
+    if invoices and "get_invoice_details" in offered:
+        return "get_invoice_details", {"invoice_number": invoices[0]}
+    return None
+
+def _spend_arguments(query):
+    return {"period": next((p for p in ("year", "quarter", "month") if p in query), "month")}
+
+def _invoices_arguments(query):
+    count = _NUMBER_PATTERN.search(query)
+    return {"limit": int(count.group(1)) if count else 5}
+
+def _no_arguments(query):
+    return {}
+
+# (keywords, tool, argument builder): checked in order, the first match among the offered tools wins
+TOOL_RULES = (
+    (("owe", "outstanding", "balance", "unpaid", "overdue"), "get_outstanding_balance", _no_arguments),
+    (("spend", "spent", "spending"), "get_spend_by_period", _spend_arguments),
+    (("often", "frequency", "regularly"), "get_order_frequency", _no_arguments),
+    (("product", "most", "top", "best"), "get_top_products", _no_arguments),
+    (("invoice", "bill", "order"), "get_customer_invoices", _invoices_arguments),
+)
+
+
+def decide_tool_call(query, prompt_text):
+    """Returns (name, arguments) for the query, or None to answer directly."""
+    offered = set(re.findall(r"\b(get_[a-z_]+)\b", prompt_text))
+    call = _invoice_call(query, offered)
+    if call:
+        return call
+    lowered = query.lower()
+    for keywords, name, build in TOOL_RULES:
+        if name in offered and any(keyword in lowered for keyword in keywords):
+            return name, build(lowered)
+    return None
+
+
+# --- Replies ---
+
+class FakeOllamaSettings:
+    def __init__(self, tokens_per_second=40.0, prompt_tokens_per_second=2000.0, load_latency=0.02,
+                 think_tokens=24, answer_tokens=60, parallel=4, epilogue_tokens=0):
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.load_latency = load_latency
+        self.think_tokens = think_tokens
+        self.answer_tokens = answer_tokens
+        self.parallel = parallel
+        self.epilogue_tokens = epilogue_tokens
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def reply_text(messages, settings, think=True, structured=False):
+    """The full completion for a chat request, before num_predict/stop are applied."""
+    system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user_messages = [m.get("content", "") for m in messages if m.get("role") == "user"]
+    last_user = user_messages[-1] if user_messages else ""
+    prompt_text = system + "\n" + last_user
+    query = last_user.rsplit("User Query:", 1)[-1].split("\n\n", 1)[0].strip()
+
+    detecting = _TOOL_PROMPT_MARKER in system and _FUNCTION_RESPONSE_MARKER not in last_user
+    call = decide_tool_call(query, prompt_text) if detecting else None
+    if call:
+        name, arguments = call
+        customer = _CUSTOMER_PATTERN.search(last_user)
+        if customer:
+            arguments = {"customer_number": customer.group(1), **arguments}
+    if structured:
+        # The output is constrained to the schema from its first token: no <think>, no prose
+        return json.dumps([{"name": name, "arguments": arguments}] if call else [])
+
+    parts = []
+    if think and settings.think_tokens:
+        parts.append(f"<think>\n{filler('think' + last_user, settings.think_tokens)}\n</think>\n\n")
+    if call:
+        parts.append(f'<function_call>{json.dumps({"name": name, "arguments": arguments})}</function_call>')
+        if settings.epilogue_tokens:
+            parts.append("\n\n" + filler("epilogue" + last_user, settings.epilogue_tokens) + ".")
+    else:
+        answered = re.findall(r'<function_response name="([^"]+)"', last_user)
+        lead = f"Based on {', '.join(answered)}: " if answered else "Happy to help! "
+        parts.append(lead + filler("answer" + last_user, settings.answer_tokens) + ".")
+    return "".join(parts)
+
+
+def apply_limits(tokens, options):
+    """Applies options.num_predict and options.stop; returns (tokens, done_reason)."""
+    done_reason = "stop"
+    num_predict = options.get("num_predict")
+    if isinstance(num_predict, int) and 0 <= num_predict < len(tokens):
+        tokens, done_reason = tokens[:num_predict], "length"
+    stops = options.get("stop") or []
+    if isinstance(stops, str):
+        stops = [stops]
+    text = "".join(tokens)
+    cut = min((text.find(stop) for stop in stops if stop and stop in text), default=-1)
+    if cut >= 0:
+        return tokenize(text[:cut]), "stop"
+    return tokens, done_reason
+
+
+# --- HTTP Server ---
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive and chunked streaming, like Ollama
+
+    def log_message(self, format, *args):  # the default logs every request to stderr
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ("/", "/api/version"):
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        try:
+            request = self._read_json()
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, 400)
+            return
+        if self.path == "/api/chat":
+            try:
+                self._chat(request)
+            except (BrokenPipeError, ConnectionResetError):  # client gave up; Ollama stops generating too
+                self.close_connection = True
+        elif self.path == "/api/embed":
+            self._embed(request)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _embed(self, request):
+        inputs = request.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        embeddings = []
+        for text in inputs:
+            digest = hashlib.sha256(text.lower().encode("utf-8")).digest() * 2
+            embeddings.append([(byte - 127.5) / 127.5 for byte in digest[:EMBEDDING_DIMENSIONS]])
+        self._send_json({"model": request.get("model", ""), "embeddings": embeddings})
+
+    def _chat(self, request):
+        settings = self.server.settings
+        messages = request.get("messages") or []
+        options = request.get("options") or {}
+        text = reply_text(messages, settings, request.get("think", True) is not False, request.get("format") is not None)
+        tokens, done_reason = apply_limits(tokenize(text), options)
+        prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+        prompt_tokens = estimate_tokens(prompt[self.server.cached_prefix(prompt):])
+        model = request.get("model", "fake")
+
+        with self.server.slots:  # queued requests wait here, like Ollama beyond OLLAMA_NUM_PARALLEL
+            started = time.perf_counter()
+            time.sleep(settings.load_latency)
+            load_seconds = time.perf_counter() - started
+            prompt_seconds = prompt_tokens / settings.prompt_tokens_per_second if settings.prompt_tokens_per_second else 0.0
+            time.sleep(prompt_seconds)
+            token_seconds = 1.0 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+            eval_started = time.perf_counter()
+
+            if request.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(token_seconds)
+                    self._send_chunk({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+            else:
+                time.sleep(token_seconds * len(tokens))
+
+        stats = {
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int((time.perf_counter() - eval_started) * 1e9),
+        }
+        if request.get("stream", True):
+            self._send_chunk({"model": model, "message": {"role": "assistant", "content": ""}, **stats})
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send_json({"model": model, "message": {"role": "assistant", "content": "".join(tokens)}, **stats})
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # accept bursts of concurrent connections without resets
+
+    def __init__(self, address, settings):
+        super().__init__(address, FakeOllamaHandler)
+        self.settings = settings
+        self.slots = threading.BoundedSemaphore(max(1, settings.parallel))
+        self._recent_prompts = deque(maxlen=max(1, settings.parallel))
+        self._recent_lock = threading.Lock()
+
+    def cached_prefix(self, prompt):
+        """Length of the longest prefix `prompt` shares with a recent prompt (then remembers `prompt`)."""
+        with self._recent_lock:
+            cached = max((len(os.path.commonprefix([prompt, previous])) for previous in self._recent_prompts), default=0)
+            self._recent_prompts.append(prompt)
+        return cached
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_thread(self):
+        """Serves from a daemon thread (for scripts that need the fake in-process); returns the base URL."""
+        threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True).start()
+        return self.base_url
+
+
+def add_settings_arguments(parser):
+    """Adds the FakeOllamaSettings options to `parser` (shared with benchmark_suite.py)."""
+    defaults = FakeOllamaSettings()
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help="completion tokens generated per second and request")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=defaults.prompt_tokens_per_second,
+                        help="prompt tokens evaluated per second (0: free)")
+    parser.add_argument("--load-latency", type=float, default=defaults.load_latency, help="seconds before prompt evaluation")
+    parser.add_argument("--think-tokens", type=int, default=defaults.think_tokens, help="words in each <think> block (0: none)")
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens, help="words in each plain answer")
+    parser.add_argument("--parallel", type=int, default=defaults.parallel, help="requests generating at once")
+    parser.add_argument("--epilogue-tokens", type=int, default=defaults.epilogue_tokens,
+                        help="words of prose after each <function_call> tag")
+
+
+def settings_from_args(args):
+    return FakeOllamaSettings(args.tokens_per_second, args.prompt_tokens_per_second, args.load_latency,
+                              args.think_tokens, args.answer_tokens, args.parallel, args.epilogue_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer((args.host, args.port), settings_from_args(args))
+    print(f"Fake Ollama listening on {server.base_url} ({json.dumps(server.settings.as_dict())})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Shows what the LLM dispatcher (helpers/llm_dispatcher.py) does under a burst of chats.
+
+A burst of --requests concurrent call_ollama() calls hits the fake Ollama server
+(benchmarks/fake_ollama.py, started in-process with --parallel slots) three times:
+  - unbounded: no dispatcher limit; every call goes straight to Ollama, which queues it,
+    and calls that wait too long fail only when --read-timeout expires;
+  - dispatched: at most --parallel calls reach Ollama, the rest wait in priority order
+    and give up after --queue-timeout (the apps answer those with 503 at once);
+  - single_flight: as dispatched, but the burst repeats --distinct prompts, so identical
+    calls in flight share one Ollama request.
+Half of the calls are FOLLOW_UP (answer after tool results) and half FIRST_TURN; the
+dispatched runs report the mean queue wait per priority.
+
+    python benchmarks/llm_dispatch_benchmark.py --requests 64 --parallel 2 --read-timeout 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_ollama import FakeOllamaServer, FakeOllamaSettings  # noqa: E402
+
+_server = FakeOllamaServer(("127.0.0.1", 0), FakeOllamaSettings(tokens_per_second=400, think_tokens=8, answer_tokens=40))
+os.environ["BAKERY_OLLAMA_BASE_URL"] = _server.base_url
+
+from helpers import llm_dispatcher, ollama_helper  # noqa: E402
+from helpers.llm_dispatcher import (  # noqa: E402
+    FIRST_TURN, FOLLOW_UP, PRIORITY_NAMES, QUEUE_WAIT_SECONDS, SHARED_CALLS, LLMDispatcher, LLMOverloadedError,
+)
+from load_test import percentile  # noqa: E402
+from utils import config  # noqa: E402
+
+
+def run_burst(requests, distinct):
+    """Fires `requests` calls at once; returns per-call (priority, seconds, outcome)."""
+    outcomes = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(requests)
+
+    def one_call(index):
+        priority = FOLLOW_UP if index % 2 else FIRST_TURN
+        prompt = [{"role": "user", "content": f"Summarize invoice batch {index % distinct}"}]
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            outcome = "ok" if ollama_helper.call_ollama(prompt, priority) is not None else "failed"
+        except LLMOverloadedError:
+            outcome = "rejected"
+        with lock:
+            outcomes.append((priority, time.perf_counter() - started, outcome))
+
+    threads = [threading.Thread(target=one_call, args=(i,)) for i in range(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def summarize(mode, outcomes, elapsed):
+    by_outcome = {kind: [seconds for _, seconds, outcome in outcomes if outcome == kind]
+                  for kind in ("ok", "failed", "rejected")}
+    ok = by_outcome["ok"]
+    result = {
+        "mode": mode,
+        "ok": len(ok),
+        "failed": len(by_outcome["failed"]),
+        "rejected": len(by_outcome["rejected"]),
+        "elapsed_s": round(elapsed, 2),
+        "ok_p50_s": round(percentile(ok, 50), 3),
+        "ok_p95_s": round(percentile(ok, 95), 3),
+    }
+    for kind in ("failed", "rejected"):
+        if by_outcome[kind]:
+            result[f"{kind}_after_mean_s"] = round(statistics.fmean(by_outcome[kind]), 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--parallel", type=int, default=2, help="Ollama slots (fake server and dispatcher)")
+    parser.add_argument("--read-timeout", type=float, default=3.0, help="client read timeout (stands in for the 90 s)")
+    parser.add_argument("--queue-timeout", type=float, default=1.5, help="dispatcher queue deadline")
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--distinct", type=int, default=6, help="distinct prompts in the single_flight burst")
+    args = parser.parse_args()
+
+    _server.settings.parallel = args.parallel
+    _server.slots = threading.BoundedSemaphore(args.parallel)
+    _server.start_in_thread()
+    ollama_helper._client = ollama_helper.OllamaClient(read_timeout=args.read_timeout, pool_size=args.requests,
+                                                       connect_retries=0)
+
+    modes = [
+        ("unbounded", 0, False, args.requests),
+        ("dispatched", args.parallel, False, args.requests),
+        ("single_flight", args.parallel, True, args.distinct),
+    ]
+    for mode, concurrency, single_flight, distinct in modes:
+        llm_dispatcher._dispatcher = LLMDispatcher(max_concurrency=concurrency, max_queue=args.max_queue,
+                                                   queue_timeout=args.queue_timeout)
+        config.LLM_SINGLE_FLIGHT = single_flight
+        waits_before = {p: (QUEUE_WAIT_SECONDS.total(priority=n), QUEUE_WAIT_SECONDS.count(priority=n))
+                        for p, n in PRIORITY_NAMES.items()}
+        shared_before = SHARED_CALLS.value()
+        started = time.perf_counter()
+        outcomes = run_burst(args.requests, distinct)
+        result = summarize(mode, outcomes, time.perf_counter() - started)
+        if concurrency:
+            for priority, name in PRIORITY_NAMES.items():
+                total, count = waits_before[priority]
+                waited = QUEUE_WAIT_SECONDS.count(priority=name) - count
+                if waited:
+                    result[f"{name}_wait_mean_s"] = round((QUEUE_WAIT_SECONDS.total(priority=name) - total) / waited, 3)
+        if single_flight:
+            result["shared_calls"] = SHARED_CALLS.value() - shared_before
+        print(result)
+        time.sleep(args.read_timeout)  # let abandoned calls drain from the fake server before the next burst
+
+    _server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
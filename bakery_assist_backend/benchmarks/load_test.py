@@ -0,0 +1,89 @@
+"""
+Concurrent-chat load test for the sync (app.py) and async (async_app.py) serving modes.
+
+Start each server first, e.g.
+    python app.py                                        # sync, port 5000
+    hypercorn async_app:app --bind 127.0.0.1:5001        # async, port 5001
+then compare them:
+    python benchmarks/load_test.py --target sync=http://127.0.0.1:5000 \
+        --target async=http://127.0.0.1:5001 --customer-number 1 --concurrency 32 --requests 256
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_target(name, base_url, customer_number, message, concurrency, total_requests, timeout):
+    """Fires `total_requests` chats with at most `concurrency` in flight and returns a summary."""
+    latencies = []
+    errors = 0
+    next_request = 0
+    url = f"{base_url.rstrip('/')}/api/chat"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors, next_request
+            while next_request < total_requests:
+                next_request += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, params={"customer_number": customer_number}, json={"message": message})
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "target": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "mean_s": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base_url, repeatable")
+    parser.add_argument("--customer-number", default="1")
+    parser.add_argument("--message", default="Show my last 3 invoices")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        print(f"Running {args.requests} chats against {name} ({base_url}) with concurrency {args.concurrency}...")
+        results.append(await run_target(name, base_url, args.customer_number, args.message,
+                                        args.concurrency, args.requests, args.timeout))
+
+    print(f"\n{'target':<10} {'reqs':>6} {'errors':>7} {'rps':>8} {'p50 s':>8} {'p95 s':>8} {'mean s':>8}")
+    for r in results:
+        print(f"{r['target']:<10} {r['requests']:>6} {r['errors']:>7} {r['throughput_rps']:>8} "
+              f"{r['p50_s']:>8} {r['p95_s']:>8} {r['mean_s']:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Measures Ollama prompt-eval time with and without system-prefix reuse.
+
+Both variants send the same text for a rotating set of customers:
+  - no_reuse:     per-customer context placed ahead of the tool descriptions, so every
+                  request starts with different tokens and nothing can be reused;
+  - prefix_reuse: templates/prompt_builder.py layout (static system message first,
+                  customer context and query in the trailing user message).
+Generation is capped at one token so the numbers reflect prompt evaluation only.
+
+    python benchmarks/prompt_prefix_benchmark.py --requests 20
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from helpers.ollama_helper import OllamaClient  # noqa: E402
+from templates.prompt_builder import PROMPT_BUILDER  # noqa: E402
+
+QUERY = "Show my last 3 invoices"
+
+
+def no_reuse_messages(customer_number):
+    context = PROMPT_BUILDER.tool_detection_messages(customer_number, QUERY)[1]["content"]
+    return [{"role": "user", "content": context + "\n\n" + PROMPT_BUILDER.system_prompt}]
+
+
+def run_variant(client, build_messages, requests):
+    durations_ms, token_counts = [], []
+    client.chat(build_messages(0))  # warm-up: load the model and fill the cache once
+    for i in range(requests):
+        response = client.chat(build_messages(1000 + i))
+        durations_ms.append(response.get("prompt_eval_duration", 0) / 1e6)
+        token_counts.append(response.get("prompt_eval_count", 0))
+    return {
+        "mean_prompt_eval_ms": round(statistics.fmean(durations_ms), 1),
+        "p50_prompt_eval_ms": round(statistics.median(durations_ms), 1),
+        # Ollama reports only the tokens it had to evaluate, so reuse shows up here too
+        "mean_prompt_eval_tokens": round(statistics.fmean(token_counts), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    client = OllamaClient(options={"num_predict": 1, "temperature": 0})
+    variants = {
+        "no_reuse": no_reuse_messages,
+        "prefix_reuse": lambda customer: PROMPT_BUILDER.tool_detection_messages(customer, QUERY),
+    }
+    print(f"Model: {client.model}, {args.requests} requests per variant")
+    for name, build_messages in variants.items():
+        print(f"{name:<14} {run_variant(client, build_messages, args.requests)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Microbenchmark for helpers/reply_parser.py, plus the latency saved by stopping early.
+
+Parsing: synthetic replies with a <think> block of each --think-words size, a
+<function_call> tag and --epilogue-words of prose after it are parsed by
+  - regex:       the previous pipeline on the finished reply (re.sub for <think>, a
+                 DOTALL regex per tag, code-fence stripping, json.loads with a greedy
+                 {...} fallback); it cannot run before the reply is complete;
+  - incremental: ReplyParser fed the whole reply at once;
+  - chunked:     ReplyParser fed --chunk-chars characters at a time, as a stream arrives.
+"calls_at" is the share of the reply read when the calls were known to be complete.
+
+Early stop (--early-stop): tool-detection steps are streamed from the in-process fake
+Ollama server (benchmarks/fake_ollama.py), whose calls are followed by --epilogue-words
+of prose, and read to the end or stopped once ReplySniffer.can_stop is set.
+
+    python benchmarks/reply_parser_benchmark.py --think-words 0 500 5000 --early-stop
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_ollama import WORDS, FakeOllamaServer, FakeOllamaSettings  # noqa: E402
+from helpers.reply_parser import ReplyParser, parse_reply  # noqa: E402
+
+_THINK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+_CALL_PATTERN = re.compile(r"<function_call>(.*?)</function_call>", re.DOTALL | re.IGNORECASE)
+
+
+def _strip_code_fences(text):
+    text = text.strip()
+    if text.startswith("```json"): text = text[7:]
+    if text.startswith("```"): text = text[3:]
+    if text.endswith("```"): text = text[:-3]
+    return text.strip()
+
+
+def regex_parse(reply):
+    """The regex pipeline ReplyParser replaced: returns (visible text, calls)."""
+    visible = _THINK_PATTERN.sub("", reply).strip()
+    calls = []
+    for block in _CALL_PATTERN.finditer(visible):
+        content = _strip_code_fences(block.group(1))
+        try:
+            call_data = json.loads(content)
+        except json.JSONDecodeError:
+            match = re.search(r"\{.*\}", content, re.DOTALL)
+            if not match:
+                continue
+            try:
+                call_data = json.loads(_strip_code_fences(match.group(0)))
+            except json.JSONDecodeError:
+                continue
+        for candidate in (call_data if isinstance(call_data, list) else [call_data]):
+            if isinstance(candidate, dict) and "name" in candidate and "arguments" in candidate:
+                calls.append(candidate)
+    return visible, calls
+
+
+def words(count, offset=0):
+    return " ".join(WORDS[(i * 7 + offset) % len(WORDS)] for i in range(count))
+
+
+def make_reply(think_words, epilogue_words):
+    call = {"name": "get_invoices", "arguments": {"customer_number": "100001", "limit": 3, "note": "a {brace} and \"quotes\""}}
+    think = f"<think>\n{words(think_words)}\n</think>\n\n" if think_words else ""
+    epilogue = f"\n\n{words(epilogue_words, 3)}." if epilogue_words else ""
+    return f"{think}<function_call>{json.dumps(call)}</function_call>{epilogue}"
+
+
+def parse_chunked(reply, chunk_chars):
+    parser = ReplyParser()
+    calls_at = None
+    for start in range(0, len(reply), chunk_chars):
+        parser.feed(reply[start:start + chunk_chars])
+        if calls_at is None and parser.calls_complete:
+            calls_at = min(start + chunk_chars, len(reply))
+    parser.finish()
+    return parser, calls_at
+
+
+def time_per_call(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def parse_benchmark(args):
+    for think_words in args.think_words:
+        reply = make_reply(think_words, args.epilogue_words)
+        expected = regex_parse(reply)[1]
+        parser, calls_at = parse_chunked(reply, args.chunk_chars)
+        assert parse_reply(reply).calls == expected == parser.calls, "parsers disagree"
+        repeat = max(10, args.repeat * 1000 // max(len(reply), 1000))
+        print({
+            "think_words": think_words,
+            "reply_chars": len(reply),
+            "regex_us": round(time_per_call(lambda: regex_parse(reply), repeat) * 1e6, 1),
+            "incremental_us": round(time_per_call(lambda: parse_reply(reply), repeat) * 1e6, 1),
+            "chunked_us": round(time_per_call(lambda: parse_chunked(reply, args.chunk_chars), repeat) * 1e6, 1),
+            "calls_at": round(calls_at / len(reply), 3) if calls_at else None,
+        })
+
+
+def early_stop_benchmark(args):
+    server = FakeOllamaServer(("127.0.0.1", 0), FakeOllamaSettings(
+        tokens_per_second=args.tokens_per_second, think_tokens=args.think_words[0], epilogue_tokens=args.epilogue_words))
+    os.environ["BAKERY_OLLAMA_BASE_URL"] = server.base_url
+    server.start_in_thread()
+    from helpers.agent_loop import ReplySniffer
+    from helpers.ollama_helper import call_ollama_stream
+    from templates.prompt_builder import PROMPT_BUILDER
+
+    messages = PROMPT_BUILDER.tool_detection_messages("100001", "Show my last 3 invoices")
+    for mode in ("read_to_end", "early_stop"):
+        seconds = []
+        for _ in range(args.steps):
+            sniffer = ReplySniffer(eager=True)
+            started = time.perf_counter()
+            chunks = call_ollama_stream(messages)
+            try:
+                for chunk in chunks:
+                    sniffer.feed(chunk)
+                    if mode == "early_stop" and sniffer.can_stop:
+                        break
+            finally:
+                chunks.close()
+            sniffer.finish()
+            assert sniffer.calls, "the fake server did not answer with a call"
+            seconds.append(time.perf_counter() - started)
+        print({"mode": mode, "steps": args.steps, "mean_step_s": round(statistics.fmean(seconds), 3),
+               "generated_chars": sniffer.raw_length})
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--think-words", type=int, nargs="+", default=[0, 500, 5000])
+    parser.add_argument("--epilogue-words", type=int, default=40, help="prose after the <function_call> tag")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="characters per streamed chunk (about a token)")
+    parser.add_argument("--repeat", type=int, default=2000, help="parses per variant for a 1 kB reply (scaled by size)")
+    parser.add_argument("--early-stop", action="store_true", help="also stream steps from the fake Ollama server")
+    parser.add_argument("--steps", type=int, default=5, help="streamed steps per early-stop mode")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="fake server generation speed")
+    args = parser.parse_args()
+
+    parse_benchmark(args)
+    if args.early_stop:
+        early_stop_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
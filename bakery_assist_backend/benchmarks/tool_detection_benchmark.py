@@ -0,0 +1,129 @@
+"""
+Compares latency and completion tokens of the tool-detection step under the limits of
+helpers/tool_detection.py.
+
+Each query runs through AgentRun's first model step (non-streamed, tools not executed)
+under each variant:
+  - baseline:      no limits (a full <think> chain, prose after the call);
+  - stop:          stop sequence on </function_call>;
+  - no_think:      "think": false (the default);
+  - no_think_stop: both;
+  - capped:        both, plus num_predict = --num-predict;
+  - json:          the calls as a JSON array (format = the registry's call schema).
+A capped or JSON step that finds no call is repeated without limits, as the agent loop
+does; its time and tokens are included, and "no_tool_s" / "model_calls" show what that
+costs the queries that need no tool. "agrees" counts the queries whose calls match the
+baseline's.
+
+Without --ollama-url the in-process fake server (benchmarks/fake_ollama.py) is used, with
+a long think block and prose after each call, like deepseek-r1. On a real model, also
+check that the answers of the no-think variants are still good enough.
+
+    python benchmarks/tool_detection_benchmark.py --think-tokens 200 --epilogue-tokens 30
+    python benchmarks/tool_detection_benchmark.py --ollama-url http://localhost:11434
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_ollama import FakeOllamaServer, add_settings_arguments, settings_from_args  # noqa: E402
+
+QUERIES = (
+    "Show my last 3 invoices",
+    "How much do I still owe you?",
+    "Which products do I buy most?",
+    "What did I spend this quarter?",
+    "What is on invoice INV-100234?",
+    "How often do I order?",
+    "Hello! Are you open on Sundays?",
+    "Thanks, that is all for today.",
+)
+
+
+def detection_step(agent_loop, agent_run):
+    """Runs model steps until the turn's tool decision is made; returns (seconds, completion tokens, calls)."""
+    from helpers.ollama_helper import call_ollama
+
+    seconds, tokens = 0.0, 0
+    while not agent_run.pending_calls and not agent_run.answered:
+        messages, tools_allowed, detecting = agent_run.next_prompt()
+        fields = agent_run.detection.request_fields(agent_loop.registry, agent_run.tool_selection.names) if detecting else None
+        sniffer = agent_run.new_sniffer(False, tools_allowed, detecting)
+        done = {}
+
+        def on_done(response_data):
+            sniffer.record_done(response_data)
+            done.update(response_data)
+
+        started = time.perf_counter()
+        sniffer.feed(call_ollama(messages, fields=fields, on_done=on_done) or "")
+        sniffer.finish()
+        step_seconds = time.perf_counter() - started
+        agent_run.record_llm_step(sniffer, step_seconds, detecting)
+        seconds += step_seconds
+        tokens += done.get("eval_count", 0)
+    return seconds, tokens, sorted(call_data["name"] for call_data in agent_run.pending_calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama-url", help="a running Ollama (default: start the fake one in-process)")
+    parser.add_argument("--num-predict", type=int, default=96, help="token cap of the capped variant")
+    parser.add_argument("--rounds", type=int, default=2, help="times each query is run per variant")
+    parser.add_argument("--customer-number", default="100001")
+    add_settings_arguments(parser)
+    parser.set_defaults(think_tokens=200, epilogue_tokens=30, tokens_per_second=80.0)
+    args = parser.parse_args()
+
+    server = None
+    if not args.ollama_url:
+        server = FakeOllamaServer(("127.0.0.1", 0), settings_from_args(args))
+        server.start_in_thread()
+    os.environ["BAKERY_OLLAMA_BASE_URL"] = args.ollama_url or server.base_url
+    os.environ["BAKERY_LLM_SINGLE_FLIGHT"] = "false"
+
+    from function_calling.function_registry import FunctionRegistry
+    from helpers.agent_loop import AgentLoop, AgentRun
+    from helpers.tool_detection import ToolDetection
+
+    variants = {
+        "baseline": ToolDetection(num_predict=0, stop=False, think=True, json_format=False),
+        "stop": ToolDetection(num_predict=0, stop=True, think=True, json_format=False),
+        "no_think": ToolDetection(num_predict=0, stop=False, think=False, json_format=False),
+        "no_think_stop": ToolDetection(num_predict=0, stop=True, think=False, json_format=False),
+        "capped": ToolDetection(num_predict=args.num_predict, stop=True, think=False, json_format=False),
+        "json": ToolDetection(num_predict=0, stop=False, think=True, json_format=True),
+    }
+    agent_loop = AgentLoop(FunctionRegistry().tool_registry())
+    baseline_calls = {}
+    for name, detection in variants.items():
+        seconds, tool_seconds, no_tool_seconds, tokens, model_calls, agrees = [], [], [], [], 0, 0
+        for _ in range(args.rounds):
+            for query in QUERIES:
+                agent_run = AgentRun(args.customer_number, query, detection=detection)
+                step_seconds, step_tokens, calls = detection_step(agent_loop, agent_run)
+                seconds.append(step_seconds)
+                (tool_seconds if calls else no_tool_seconds).append(step_seconds)
+                tokens.append(step_tokens)
+                model_calls += agent_run.llm_steps
+                agrees += baseline_calls.setdefault(query, calls) == calls
+        print({
+            "variant": name,
+            "mean_s": round(statistics.fmean(seconds), 3),
+            "tool_s": round(statistics.fmean(tool_seconds), 3) if tool_seconds else None,
+            "no_tool_s": round(statistics.fmean(no_tool_seconds), 3) if no_tool_seconds else None,
+            "mean_completion_tokens": round(statistics.fmean(tokens), 1),
+            "model_calls": round(model_calls / len(seconds), 2),
+            "agrees": f"{agrees}/{len(seconds)}",
+        })
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+import datetime
+import json
+import logging
+import re
+from decimal import Decimal
+
+import asyncpg
+import psycopg2
+from function_calling.tool_cache import cached_tool
+from function_calling.tool_registry import Param, async_tool, tool
+from utils import config
+from utils.async_db_connection import AsyncDataBaseConnection
+from utils.db_connection import DataBaseConnection
+
+logger = logging.getLogger(__name__)
+
+# --- Analytics Queries ---
+# Each tool reads the per-customer summary tables from bakery_assist_data/invoice_analytics.sql.
+# The LIVE_* twins compute the same answer straight from invoices/invoice_items; they are
+# kept for benchmarks/analytics_benchmark.py and as the reference the summaries must match.
+
+SPEND_PERIODS = ("month", "quarter", "year")
+TOP_PRODUCT_ORDERS = {"quantity": "quantity", "revenue": "revenue"}
+MAX_ANALYTICS_ROWS = 24
+
+REFRESH_IF_DIRTY_SQL = "SELECT refresh_customer_analytics_if_dirty(%s)"
+
+SPEND_BY_PERIOD_SQL = """
+    SELECT date_trunc(%s, month)::date AS period_start,
+           SUM(invoice_count)::int AS invoices,
+           SUM(total_amount) AS total_amount
+    FROM customer_monthly_spend
+    WHERE customer_fk = %s
+    GROUP BY 1
+    ORDER BY 1 DESC
+    LIMIT %s
+"""
+
+LIVE_SPEND_BY_PERIOD_SQL = """
+    SELECT date_trunc(%s, invoice_date)::date AS period_start,
+           COUNT(*)::int AS invoices,
+           SUM(total_amount) AS total_amount
+    FROM invoices
+    WHERE customer_fk = %s AND status <> 'Cancelled'
+    GROUP BY 1
+    ORDER BY 1 DESC
+    LIMIT %s
+"""
+
+# An Open invoice past its due date counts as overdue even before its status is updated
+OPEN_BALANCE_SQL = """
+    SELECT COALESCE(SUM(invoice_count), 0)::int AS open_invoices,
+           COALESCE(SUM(total_amount), 0) AS open_amount,
+           COALESCE(SUM(invoice_count) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE), 0)::int AS overdue_invoices,
+           COALESCE(SUM(total_amount) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE), 0) AS overdue_amount,
+           MIN(due_date) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE) AS oldest_overdue_due_date,
+           MIN(due_date) FILTER (WHERE status = 'Open' AND due_date >= CURRENT_DATE) AS next_due_date
+    FROM customer_open_balances
+    WHERE customer_fk = %s
+"""
+
+LIVE_OPEN_BALANCE_SQL = """
+    SELECT COUNT(*)::int AS open_invoices,
+           COALESCE(SUM(total_amount), 0) AS open_amount,
+           COUNT(*) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE)::int AS overdue_invoices,
+           COALESCE(SUM(total_amount) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE), 0) AS overdue_amount,
+           MIN(due_date) FILTER (WHERE status = 'Overdue' OR due_date < CURRENT_DATE) AS oldest_overdue_due_date,
+           MIN(due_date) FILTER (WHERE status = 'Open' AND due_date >= CURRENT_DATE) AS next_due_date
+    FROM invoices
+    WHERE customer_fk = %s AND status IN ('Open', 'Overdue')
+"""
+
+TOP_PRODUCTS_SQL = """
+    SELECT prod.product_name, totals.quantity, prod.base_unit_of_measure AS unit_of_measure,
+           totals.revenue, totals.invoice_count AS invoices, totals.last_invoice_date AS last_ordered
+    FROM customer_product_totals totals
+    JOIN products prod ON prod.product_pk = totals.product_fk
+    WHERE totals.customer_fk = %s
+    ORDER BY totals.{order_by} DESC, prod.product_name
+    LIMIT %s
+"""
+
+LIVE_TOP_PRODUCTS_SQL = """
+    SELECT prod.product_name, totals.quantity, prod.base_unit_of_measure AS unit_of_measure,
+           totals.revenue, totals.invoices, totals.last_ordered
+    FROM (
+        SELECT item.product_fk, SUM(item.quantity) AS quantity, SUM(item.item_total_amount) AS revenue,
+               COUNT(DISTINCT inv.invoice_pk) AS invoices, MAX(inv.invoice_date) AS last_ordered
+        FROM invoices inv
+        JOIN invoice_items item ON item.invoice_fk = inv.invoice_pk
+        WHERE inv.customer_fk = %s AND inv.status <> 'Cancelled'
+        GROUP BY item.product_fk
+    ) totals
+    JOIN products prod ON prod.product_pk = totals.product_fk
+    ORDER BY totals.{order_by} DESC, prod.product_name
+    LIMIT %s
+"""
+
+ORDER_FREQUENCY_SQL = """
+    SELECT COALESCE(SUM(invoice_count), 0)::int AS invoices,
+           MIN(first_invoice_date) AS first_order,
+           MAX(last_invoice_date) AS last_order,
+           COALESCE(SUM(invoice_count) FILTER (
+               WHERE month >= date_trunc('month', CURRENT_DATE) - INTERVAL '11 months'), 0)::int AS invoices_last_12_months
+    FROM customer_monthly_spend
+    WHERE customer_fk = %s
+"""
+
+LIVE_ORDER_FREQUENCY_SQL = """
+    SELECT COUNT(*)::int AS invoices,
+           MIN(invoice_date) AS first_order,
+           MAX(invoice_date) AS last_order,
+           COUNT(*) FILTER (
+               WHERE invoice_date >= date_trunc('month', CURRENT_DATE) - INTERVAL '11 months')::int AS invoices_last_12_months
+    FROM invoices
+    WHERE customer_fk = %s AND status <> 'Cancelled'
+"""
+
+
+def asyncpg_sql(sql):
+    """Rewrites psycopg2 `%s` placeholders as asyncpg's `$1, $2, ...`."""
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%s", lambda _match: f"${next(counter)}", sql)
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _row_dicts(colnames, rows):
+    return [{col: _json_value(val) for col, val in zip(colnames, row)} for row in rows]
+
+
+def _clamp_limit(limit, default):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_ANALYTICS_ROWS))
+
+
+def period_label(period, period_start):
+    """'2024-03', '2024-Q1' or '2024' for the first day of a month/quarter/year."""
+    if period == "month":
+        return period_start.strftime("%Y-%m")
+    if period == "quarter":
+        return f"{period_start.year}-Q{(period_start.month - 1) // 3 + 1}"
+    return str(period_start.year)
+
+
+def spend_rows(period, rows):
+    return [{"period": period_label(period, period_start), "invoices": invoices, "total_amount": str(total_amount)}
+            for period_start, invoices, total_amount in rows]
+
+
+def order_frequency(summary, today=None):
+    """Adds the average gap between orders and days since the last one to an ORDER_FREQUENCY_SQL row."""
+    invoices, first_order, last_order, invoices_last_12_months = summary
+    today = today or datetime.date.today()
+    return {
+        "invoices": invoices,
+        "first_order": _json_value(first_order),
+        "last_order": _json_value(last_order),
+        "invoices_last_12_months": invoices_last_12_months,
+        "average_days_between_orders": (round((last_order - first_order).days / (invoices - 1), 1)
+                                        if invoices > 1 else None),
+        "days_since_last_order": (today - last_order).days if last_order else None,
+    }
+
+
+def top_products_sql(order_by, live=False):
+    """TOP_PRODUCTS_SQL (or its live twin) ordered by a whitelisted column."""
+    return (LIVE_TOP_PRODUCTS_SQL if live else TOP_PRODUCTS_SQL).format(order_by=TOP_PRODUCT_ORDERS[order_by])
+
+
+def _refresh_if_dirty(cur, customer_pk):
+    if config.ANALYTICS_REFRESH_ON_READ:
+        cur.execute(REFRESH_IF_DIRTY_SQL, (customer_pk,))
+
+
+async def _refresh_if_dirty_async(conn, customer_pk):
+    if config.ANALYTICS_REFRESH_ON_READ:
+        await conn.execute(asyncpg_sql(REFRESH_IF_DIRTY_SQL), customer_pk)
+
+
+def _error(tool_name, message):
+    logger.warning("Invalid arguments for %s: %s", tool_name, message)
+    return json.dumps({"error": message})
+
+
+class AnalyticsDeclaration:
+    """
+    Per-customer invoice analytics tools. Each tool reads a few rows from the summary tables
+    (refreshing the customer first if its invoices changed) instead of aggregating invoices live.
+    """
+
+    def __init__(self):
+        pass
+
+    # --- Spend by Period ---
+
+    @staticmethod
+    @tool(
+        "get_spend_by_period",
+        "Totals the customer's spending (all non-cancelled invoices) per month, quarter or year, newest first.",
+        params=[
+            Param("period", str, "How to group the spending.", default="month", choices=SPEND_PERIODS),
+            Param("limit", int, "How many periods to return.", default=12, minimum=1, maximum=MAX_ANALYTICS_ROWS),
+        ],
+        returns="A JSON list of periods with invoice count and total amount, or an error message.",
+        keywords=("spent", "spend", "how much", "monthly", "yearly", "per month", "trend", "expenses"),
+    )
+    @cached_tool("get_spend_by_period", ttl=300)
+    def get_spend_by_period(customer_number: str, period: str = "month", limit: int = 12):
+        """
+        Body of the get_spend_by_period tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+            period (str): One of SPEND_PERIODS. Defaults to "month".
+            limit (int): How many periods to return, clamped to MAX_ANALYTICS_ROWS. Defaults to 12.
+        Returns:
+            str: A JSON list of periods with invoice count and total amount, or an error message.
+        """
+        logger.debug("Tool call: get_spend_by_period(customer_number=%s, period=%s, limit=%s)", customer_number, period, limit)
+        if period not in SPEND_PERIODS:
+            return _error("get_spend_by_period", f"period must be one of {', '.join(SPEND_PERIODS)}.")
+        try:
+            with DataBaseConnection().connection() as conn:
+                cur = conn.cursor()
+                _refresh_if_dirty(cur, customer_number)
+                cur.execute(SPEND_BY_PERIOD_SQL, (period, customer_number, _clamp_limit(limit, 12)))
+                rows = cur.fetchall()
+                cur.close()
+
+            if not rows:
+                return json.dumps({"message": f"No invoices found for customer {customer_number}."})
+            return json.dumps(spend_rows(period, rows))
+
+        except psycopg2.Error as e:
+            logger.error("Database error in get_spend_by_period: %s", e)
+            return json.dumps({"error": "Database error while fetching spending."})
+        except Exception as e:
+            logger.error("Unexpected error in get_spend_by_period: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    @async_tool("get_spend_by_period")
+    @cached_tool("get_spend_by_period", ttl=300)
+    async def get_spend_by_period_async(customer_number: str, period: str = "month", limit: int = 12):
+        """Async variant of get_spend_by_period."""
+        logger.debug("Tool call: get_spend_by_period_async(customer_number=%s, period=%s, limit=%s)", customer_number, period, limit)
+        if period not in SPEND_PERIODS:
+            return _error("get_spend_by_period", f"period must be one of {', '.join(SPEND_PERIODS)}.")
+        try:
+            customer_pk = int(customer_number)  # asyncpg does not cast text parameters implicitly
+            async with AsyncDataBaseConnection().connection() as conn:
+                await _refresh_if_dirty_async(conn, customer_pk)
+                rows = await conn.fetch(asyncpg_sql(SPEND_BY_PERIOD_SQL), period, customer_pk, _clamp_limit(limit, 12))
+
+            if not rows:
+                return json.dumps({"message": f"No invoices found for customer {customer_number}."})
+            return json.dumps(spend_rows(period, [tuple(row) for row in rows]))
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in get_spend_by_period_async: %s", e)
+            return json.dumps({"error": "Database error while fetching spending."})
+        except Exception as e:
+            logger.error("Unexpected error in get_spend_by_period_async: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    # --- Outstanding Balance ---
+
+    @staticmethod
+    @tool(
+        "get_outstanding_balance",
+        "Summarizes what the customer still owes: open and overdue invoice counts and amounts, "
+        "the oldest overdue due date and the next due date.",
+        returns="A JSON object with the balance summary, or an error message.",
+        keywords=("owe", "owed", "due", "unpaid", "overdue", "outstanding", "debt", "pay"),
+    )
+    @cached_tool("get_outstanding_balance", ttl=300)
+    def get_outstanding_balance(customer_number: str):
+        """
+        Body of the get_outstanding_balance tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+        Returns:
+            str: A JSON object with the balance summary, or an error message.
+        """
+        logger.debug("Tool call: get_outstanding_balance(customer_number=%s)", customer_number)
+        try:
+            with DataBaseConnection().connection() as conn:
+                cur = conn.cursor()
+                _refresh_if_dirty(cur, customer_number)
+                cur.execute(OPEN_BALANCE_SQL, (customer_number,))
+                row = cur.fetchone()
+                colnames = [desc[0] for desc in cur.description]
+                cur.close()
+
+            return json.dumps(_row_dicts(colnames, [row])[0])
+
+        except psycopg2.Error as e:
+            logger.error("Database error in get_outstanding_balance: %s", e)
+            return json.dumps({"error": "Database error while fetching the balance."})
+        except Exception as e:
+            logger.error("Unexpected error in get_outstanding_balance: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    @async_tool("get_outstanding_balance")
+    @cached_tool("get_outstanding_balance", ttl=300)
+    async def get_outstanding_balance_async(customer_number: str):
+        """Async variant of get_outstanding_balance."""
+        logger.debug("Tool call: get_outstanding_balance_async(customer_number=%s)", customer_number)
+        try:
+            customer_pk = int(customer_number)
+            async with AsyncDataBaseConnection().connection() as conn:
+                await _refresh_if_dirty_async(conn, customer_pk)
+                row = await conn.fetchrow(asyncpg_sql(OPEN_BALANCE_SQL), customer_pk)
+
+            return json.dumps({col: _json_value(val) for col, val in row.items()})
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in get_outstanding_balance_async: %s", e)
+            return json.dumps({"error": "Database error while fetching the balance."})
+        except Exception as e:
+            logger.error("Unexpected error in get_outstanding_balance_async: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    # --- Top Products ---
+
+    @staticmethod
+    @tool(
+        "get_top_products",
+        "Lists the products the customer orders most, by total quantity or by revenue, "
+        "with how often and when they were last ordered.",
+        params=[
+            Param("order_by", str, "Rank products by this total.", default="quantity", choices=tuple(TOP_PRODUCT_ORDERS)),
+            Param("limit", int, "How many products to return.", default=5, minimum=1, maximum=MAX_ANALYTICS_ROWS),
+        ],
+        returns="A JSON list of products with quantity, unit, revenue, invoice count and last order date, or an error message.",
+        keywords=("favorite", "favourite", "best", "most", "popular", "usual", "buy", "bread", "cake"),
+    )
+    @cached_tool("get_top_products", ttl=300)
+    def get_top_products(customer_number: str, order_by: str = "quantity", limit: int = 5):
+        """
+        Body of the get_top_products tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+            order_by (str): A key of TOP_PRODUCT_ORDERS. Defaults to "quantity".
+            limit (int): How many products to return, clamped to MAX_ANALYTICS_ROWS. Defaults to 5.
+        Returns:
+            str: A JSON list of products, or an error message.
+        """
+        logger.debug("Tool call: get_top_products(customer_number=%s, order_by=%s, limit=%s)", customer_number, order_by, limit)
+        if order_by not in TOP_PRODUCT_ORDERS:
+            return _error("get_top_products", f"order_by must be one of {', '.join(TOP_PRODUCT_ORDERS)}.")
+        try:
+            with DataBaseConnection().connection() as conn:
+                cur = conn.cursor()
+                _refresh_if_dirty(cur, customer_number)
+                cur.execute(top_products_sql(order_by), (customer_number, _clamp_limit(limit, 5)))
+                rows = cur.fetchall()
+                colnames = [desc[0] for desc in cur.description]
+                cur.close()
+
+            if not rows:
+                return json.dumps({"message": f"No orders found for customer {customer_number}."})
+            return json.dumps(_row_dicts(colnames, rows))
+
+        except psycopg2.Error as e:
+            logger.error("Database error in get_top_products: %s", e)
+            return json.dumps({"error": "Database error while fetching top products."})
+        except Exception as e:
+            logger.error("Unexpected error in get_top_products: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    @async_tool("get_top_products")
+    @cached_tool("get_top_products", ttl=300)
+    async def get_top_products_async(customer_number: str, order_by: str = "quantity", limit: int = 5):
+        """Async variant of get_top_products."""
+        logger.debug("Tool call: get_top_products_async(customer_number=%s, order_by=%s, limit=%s)", customer_number, order_by, limit)
+        if order_by not in TOP_PRODUCT_ORDERS:
+            return _error("get_top_products", f"order_by must be one of {', '.join(TOP_PRODUCT_ORDERS)}.")
+        try:
+            customer_pk = int(customer_number)
+            async with AsyncDataBaseConnection().connection() as conn:
+                await _refresh_if_dirty_async(conn, customer_pk)
+                rows = await conn.fetch(asyncpg_sql(top_products_sql(order_by)), customer_pk, _clamp_limit(limit, 5))
+
+            if not rows:
+                return json.dumps({"message": f"No orders found for customer {customer_number}."})
+            return json.dumps([{col: _json_value(val) for col, val in row.items()} for row in rows])
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in get_top_products_async: %s", e)
+            return json.dumps({"error": "Database error while fetching top products."})
+        except Exception as e:
+            logger.error("Unexpected error in get_top_products_async: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    # --- Order Frequency ---
+
+    @staticmethod
+    @tool(
+        "get_order_frequency",
+        "Describes how often the customer orders: total invoices, first and last order dates, invoices in the "
+        "last 12 months, average days between orders and days since the last order.",
+        returns="A JSON object with the order frequency summary, or an error message.",
+        keywords=("how often", "often", "regularly", "frequency", "since", "last time", "days between"),
+    )
+    @cached_tool("get_order_frequency", ttl=300)
+    def get_order_frequency(customer_number: str):
+        """
+        Body of the get_order_frequency tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+        Returns:
+            str: A JSON object with the order frequency summary, or an error message.
+        """
+        logger.debug("Tool call: get_order_frequency(customer_number=%s)", customer_number)
+        try:
+            with DataBaseConnection().connection() as conn:
+                cur = conn.cursor()
+                _refresh_if_dirty(cur, customer_number)
+                cur.execute(ORDER_FREQUENCY_SQL, (customer_number,))
+                summary = cur.fetchone()
+                cur.close()
+
+            if not summary[0]:
+                return json.dumps({"message": f"No orders found for customer {customer_number}."})
+            return json.dumps(order_frequency(summary))
+
+        except psycopg2.Error as e:
+            logger.error("Database error in get_order_frequency: %s", e)
+            return json.dumps({"error": "Database error while fetching order frequency."})
+        except Exception as e:
+            logger.error("Unexpected error in get_order_frequency: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    @async_tool("get_order_frequency")
+    @cached_tool("get_order_frequency", ttl=300)
+    async def get_order_frequency_async(customer_number: str):
+        """Async variant of get_order_frequency."""
+        logger.debug("Tool call: get_order_frequency_async(customer_number=%s)", customer_number)
+        try:
+            customer_pk = int(customer_number)
+            async with AsyncDataBaseConnection().connection() as conn:
+                await _refresh_if_dirty_async(conn, customer_pk)
+                summary = await conn.fetchrow(asyncpg_sql(ORDER_FREQUENCY_SQL), customer_pk)
+
+            if not summary[0]:
+                return json.dumps({"message": f"No orders found for customer {customer_number}."})
+            return json.dumps(order_frequency(tuple(summary)))
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in get_order_frequency_async: %s", e)
+            return json.dumps({"error": "Database error while fetching order frequency."})
+        except Exception as e:
+            logger.error("Unexpected error in get_order_frequency_async: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
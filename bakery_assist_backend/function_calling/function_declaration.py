@@ -1,12 +1,107 @@
 import json
+import logging
+import re
+import asyncpg
 import psycopg2
+from function_calling.tool_cache import cached_tool
+from function_calling.tool_registry import Param, async_tool, tool
+from utils import config
+from utils.async_db_connection import AsyncDataBaseConnection
 from utils.db_connection import DataBaseConnection
 
+logger = logging.getLogger(__name__)
+
+# --- Invoice Details Query ---
+# Headers, line items and product names for several invoices in ONE round trip. Postgres
+# renders the whole reply as JSON, items as compact arrays in ITEM_COLUMNS order, so Python
+# never builds a dict per row. Only the first `max_items` lines per invoice are returned;
+# `items_omitted` says how many were left out.
+ITEM_COLUMNS = ("product", "quantity", "unit", "unit_price", "total")
+
+INVOICE_DETAILS_SQL = """
+    WITH wanted AS (
+        SELECT invoice_pk, invoice_number, invoice_date, due_date, status, payment_terms,
+               net_amount, tax_amount, total_amount, currency
+        FROM invoices
+        WHERE customer_fk = %(customer)s AND invoice_number = ANY(%(numbers)s::text[])
+    )
+    SELECT json_build_object(
+        'item_columns', %(item_columns)s::json,
+        'invoices', COALESCE((
+            SELECT json_agg(json_build_object(
+                       'invoice_number', w.invoice_number, 'invoice_date', w.invoice_date,
+                       'due_date', w.due_date, 'status', w.status, 'payment_terms', w.payment_terms,
+                       'net_amount', w.net_amount, 'tax_amount', w.tax_amount,
+                       'total_amount', w.total_amount, 'currency', w.currency,
+                       'items', COALESCE(items.rows, '[]'::json),
+                       'items_omitted', GREATEST(items.item_count - %(max_items)s, 0))
+                   ORDER BY w.invoice_date DESC, w.invoice_number)
+            FROM wanted w
+            CROSS JOIN LATERAL (
+                SELECT json_agg(json_build_array(prod.product_name, line.quantity, line.unit_of_measure,
+                                                 line.unit_price, line.item_total_amount)
+                                ORDER BY line.item_number) FILTER (WHERE line.position <= %(max_items)s) AS rows,
+                       COUNT(*) AS item_count
+                FROM (
+                    SELECT item.*, row_number() OVER (ORDER BY item.item_number) AS position
+                    FROM invoice_items item
+                    WHERE item.invoice_fk = w.invoice_pk
+                ) line
+                JOIN products prod ON prod.product_pk = line.product_fk
+            ) items
+        ), '[]'::json),
+        'not_found', COALESCE((
+            SELECT json_agg(requested.number)
+            FROM unnest(%(numbers)s::text[]) AS requested(number)
+            WHERE NOT EXISTS (SELECT 1 FROM wanted w WHERE w.invoice_number = requested.number)
+        ), '[]'::json)
+    )::text
+"""
+
+INVOICE_NUMBER_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]*")
+
+
+def parse_invoice_numbers(invoice_numbers):
+    """
+    Normalizes what the LLM passed as invoice numbers: a list, or one string with
+    numbers separated by commas/spaces. Upper-cased, de-duplicated, in request order.
+    """
+    if isinstance(invoice_numbers, (list, tuple)):
+        invoice_numbers = ",".join(str(n) for n in invoice_numbers)
+    numbers = [n.upper() for n in INVOICE_NUMBER_PATTERN.findall(str(invoice_numbers or ""))]
+    return list(dict.fromkeys(numbers))
+
+
+def invoice_details_params(customer_number, numbers):
+    return {
+        "customer": int(customer_number),
+        "numbers": numbers,
+        "item_columns": json.dumps(ITEM_COLUMNS),
+        "max_items": max(1, config.INVOICE_DETAILS_MAX_ITEMS),
+    }
+
+
+def asyncpg_named_sql(sql, params):
+    """Rewrites `%(name)s` placeholders as asyncpg's `$n`; returns (sql, positional args)."""
+    names = list(dict.fromkeys(re.findall(r"%\((\w+)\)s", sql)))
+    for position, name in enumerate(names, start=1):
+        sql = sql.replace(f"%({name})s", f"${position}")
+    return sql, [params[name] for name in names]
+
+
 class FunctionDeclaration:
     def __init__(self):
        pass
 
     @staticmethod
+    @tool(
+        "get_customer_invoices",
+        "Retrieves a list of the most recent invoices for a specific customer.",
+        params=[Param("limit", int, "The maximum number of invoices to return.", default=5, minimum=1, maximum=50)],
+        returns="A JSON list of invoices (number, date, total, status), or an error message.",
+        keywords=("bills", "recent", "latest", "last", "orders", "paid", "status"),
+    )
+    @cached_tool("get_customer_invoices", ttl=60)
     def get_customer_invoices_from_db(customer_number: str, limit: int = 5):
         """
         Retrieves a list of the most recent invoices for a specific customer.
@@ -17,45 +112,191 @@ class FunctionDeclaration:
             str: A JSON string representing a list of invoices (number, date, total, status)
                 or an error message if the customer is not found or an error occurs.
         """
-        print(f"--- TOOL CALL: get_customer_invoices_from_db(customer_number={customer_number}, limit={limit}) ---")
-        conn = None
+        logger.debug("Tool call: get_customer_invoices_from_db(customer_number=%s, limit=%s)", customer_number, limit)
         try:
             db_connection = DataBaseConnection()
-            conn = db_connection.get_db_connection()
-            if conn is None:
-                return json.dumps({"error": "Database connection failed"})
+            with db_connection.connection() as conn:
+                cur = conn.cursor()
 
-            cur = conn.cursor()
+                # Fetch invoices
+                cur.execute("""
+                    SELECT invoice_number, invoice_date, total_amount, status
+                    FROM invoices inv
+                    JOIN customers cust ON inv.customer_fk = cust.customer_pk
+                    WHERE cust.customer_pk = %s
+                    ORDER BY invoice_date DESC
+                    LIMIT %s
+                """, (customer_number, limit))
+
+                invoices = cur.fetchall()
+                colnames = [desc[0] for desc in cur.description]
+                cur.close()
 
-            # Fetch invoices
-            cur.execute("""
-                SELECT invoice_number, invoice_date, total_amount, status
-                FROM invoices inv
-                JOIN customers cust ON inv.customer_fk = cust.customer_pk
-                WHERE cust.customer_pk = %s
-                ORDER BY invoice_date DESC
-                LIMIT %s
-            """, (customer_number, limit))
-
-            invoices = cur.fetchall()
-            colnames = [desc[0] for desc in cur.description]
             invoices_list = []
             for row in invoices:
                 # Convert date/decimal directly to string for JSON compatibility
                 row_dict = {col: str(val) for col, val in zip(colnames, row)}
                 invoices_list.append(row_dict)
 
-            cur.close()
             if not invoices_list:
                 return json.dumps({"message": f"No invoices found for customer {customer_number}."})
             return json.dumps(invoices_list) # Return results as a JSON string
 
         except psycopg2.Error as e:
-            print(f"Database error in get_customer_invoices_from_db: {e}")
+            logger.error("Database error in get_customer_invoices_from_db: %s", e)
             return json.dumps({"error": "Database error while fetching invoices."})
         except Exception as e:
-            print(f"Unexpected error in get_customer_invoices_from_db: {e}")
+            logger.error("Unexpected error in get_customer_invoices_from_db: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    @async_tool("get_customer_invoices")
+    @cached_tool("get_customer_invoices", ttl=60)
+    async def get_customer_invoices_from_db_async(customer_number: str, limit: int = 5):
+        """Async variant of get_customer_invoices_from_db."""
+        logger.debug("Tool call: get_customer_invoices_from_db_async(customer_number=%s, limit=%s)", customer_number, limit)
+        try:
+            async with AsyncDataBaseConnection().connection() as conn:
+                # asyncpg does not cast text parameters implicitly
+                rows = await conn.fetch("""
+                    SELECT invoice_number, invoice_date, total_amount, status
+                    FROM invoices inv
+                    JOIN customers cust ON inv.customer_fk = cust.customer_pk
+                    WHERE cust.customer_pk = $1
+                    ORDER BY invoice_date DESC
+                    LIMIT $2
+                """, int(customer_number), int(limit))
+
+            # Convert date/decimal directly to string for JSON compatibility
+            invoices_list = [{col: str(val) for col, val in row.items()} for row in rows]
+
+            if not invoices_list:
+                return json.dumps({"message": f"No invoices found for customer {customer_number}."})
+            return json.dumps(invoices_list) # Return results as a JSON string
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in get_customer_invoices_from_db_async: %s", e)
+            return json.dumps({"error": "Database error while fetching invoices."})
+        except Exception as e:
+            logger.error("Unexpected error in get_customer_invoices_from_db_async: %s", e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    # --- Invoice Details ---
+
+    @staticmethod
+    def fetch_invoice_details(customer_number, numbers):
+        """Runs INVOICE_DETAILS_SQL for the given invoice numbers; returns the JSON reply string."""
+        db_connection = DataBaseConnection()
+        with db_connection.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(INVOICE_DETAILS_SQL, invoice_details_params(customer_number, numbers))
+            details = cur.fetchone()[0]
+            cur.close()
+        return details
+
+    @staticmethod
+    async def fetch_invoice_details_async(customer_number, numbers):
+        sql, args = asyncpg_named_sql(INVOICE_DETAILS_SQL, invoice_details_params(customer_number, numbers))
+        async with AsyncDataBaseConnection().connection() as conn:
+            return await conn.fetchval(sql, *args)
+
+    @staticmethod
+    @tool(
+        "get_invoice_details",
+        "Retrieves one invoice with its line items (product, quantity, unit, unit price, line total).",
+        params=[Param("invoice_number", str, "The invoice number, e.g. INV20240012345.")],
+        returns='The invoice header and items ("item_columns" names the fields of each item array), '
+                'plus "not_found" if the invoice does not belong to the customer.',
+        keywords=("items", "lines", "products", "bought", "contents", "what was on", "INV"),
+    )
+    @cached_tool("get_invoice_details", ttl=300)
+    def get_invoice_details(customer_number: str, invoice_number: str):
+        """
+        Body of the get_invoice_details tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+            invoice_number (str): The invoice number, e.g. INV20240012345.
+        Returns:
+            str: A JSON object with "item_columns" (the order of each item array), "invoices"
+                (header fields plus "items" and "items_omitted") and "not_found", or an error message.
+        """
+        logger.debug("Tool call: get_invoice_details(customer_number=%s, invoice_number=%s)", customer_number, invoice_number)
+        return FunctionDeclaration._invoice_details("get_invoice_details", customer_number, invoice_number, 1)
+
+    @staticmethod
+    @async_tool("get_invoice_details")
+    @cached_tool("get_invoice_details", ttl=300)
+    async def get_invoice_details_async(customer_number: str, invoice_number: str):
+        """Async variant of get_invoice_details."""
+        logger.debug("Tool call: get_invoice_details_async(customer_number=%s, invoice_number=%s)", customer_number, invoice_number)
+        return await FunctionDeclaration._invoice_details_async("get_invoice_details", customer_number, invoice_number, 1)
+
+    @staticmethod
+    @tool(
+        "get_multiple_invoice_details",
+        "Retrieves several invoices with their line items in one lookup.",
+        params=[Param("invoice_numbers", list, "The invoice numbers, as a list or comma-separated string "
+                      f"(at most {config.INVOICE_DETAILS_MAX_INVOICES}).")],
+        returns="The same result as get_invoice_details, with one entry per invoice found.",
+        keywords=("items", "lines", "products", "compare", "several", "both", "these invoices"),
+    )
+    @cached_tool("get_multiple_invoice_details", ttl=300)
+    def get_multiple_invoice_details(customer_number: str, invoice_numbers: list):
+        """
+        Body of the get_multiple_invoice_details tool (described by its @tool spec).
+        Args:
+            customer_number (str): The unique identifier for the customer.
+            invoice_numbers (list): The invoice numbers, e.g. ["INV20240012345", "INV20240012346"]; a
+                comma-separated string is accepted too. At most config.INVOICE_DETAILS_MAX_INVOICES.
+        Returns:
+            str: The same JSON object as get_invoice_details, with one entry per invoice found.
+        """
+        logger.debug("Tool call: get_multiple_invoice_details(customer_number=%s, invoice_numbers=%s)", customer_number, invoice_numbers)
+        return FunctionDeclaration._invoice_details("get_multiple_invoice_details", customer_number, invoice_numbers,
+                                                    config.INVOICE_DETAILS_MAX_INVOICES)
+
+    @staticmethod
+    @async_tool("get_multiple_invoice_details")
+    @cached_tool("get_multiple_invoice_details", ttl=300)
+    async def get_multiple_invoice_details_async(customer_number: str, invoice_numbers: list):
+        """Async variant of get_multiple_invoice_details."""
+        logger.debug("Tool call: get_multiple_invoice_details_async(customer_number=%s, invoice_numbers=%s)", customer_number, invoice_numbers)
+        return await FunctionDeclaration._invoice_details_async("get_multiple_invoice_details", customer_number,
+                                                                invoice_numbers, config.INVOICE_DETAILS_MAX_INVOICES)
+
+    @staticmethod
+    def _requested_numbers(invoice_numbers, max_invoices):
+        numbers = parse_invoice_numbers(invoice_numbers)
+        if not numbers:
+            return None, json.dumps({"error": "No invoice number given."})
+        if len(numbers) > max_invoices:
+            return None, json.dumps({"error": f"At most {max_invoices} invoices can be fetched at once."})
+        return numbers, None
+
+    @staticmethod
+    def _invoice_details(tool_name, customer_number, invoice_numbers, max_invoices):
+        numbers, error = FunctionDeclaration._requested_numbers(invoice_numbers, max_invoices)
+        if error:
+            return error
+        try:
+            return FunctionDeclaration.fetch_invoice_details(customer_number, numbers)
+        except psycopg2.Error as e:
+            logger.error("Database error in %s: %s", tool_name, e)
+            return json.dumps({"error": "Database error while fetching invoice details."})
+        except Exception as e:
+            logger.error("Unexpected error in %s: %s", tool_name, e)
+            return json.dumps({"error": "An unexpected error occurred."})
+
+    @staticmethod
+    async def _invoice_details_async(tool_name, customer_number, invoice_numbers, max_invoices):
+        numbers, error = FunctionDeclaration._requested_numbers(invoice_numbers, max_invoices)
+        if error:
+            return error
+        try:
+            return await FunctionDeclaration.fetch_invoice_details_async(customer_number, numbers)
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Database error in %s: %s", tool_name, e)
+            return json.dumps({"error": "Database error while fetching invoice details."})
+        except Exception as e:
+            logger.error("Unexpected error in %s: %s", tool_name, e)
             return json.dumps({"error": "An unexpected error occurred."})
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
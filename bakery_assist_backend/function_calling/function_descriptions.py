@@ -1,18 +1,10 @@
-from function_calling.function_registry import FunctionRegistry
+from function_calling.tool_registry import TOOLS
 
 class FunctionDescription:
     # --- Tool Descriptions for Prompting ---
-    # Generate the descriptions dynamically from the registry for the prompt
-    function_registry = FunctionRegistry()
-    TOOL_REGISTRY = function_registry.tool_registry()
+    # Rendered from the declared tool schemas on first use and cached by the registry
 
-    try:
-        TOOL_DESCRIPTIONS = "\n".join([
-            f"""- Function Name: {name}
-        Description: {func.__doc__.strip()}"""
-            for name, func in TOOL_REGISTRY.items()
-        ])
-
-    except:
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+    @staticmethod
+    def tool_descriptions(names=None):
+        """Prompt text describing `names` (default: every registered tool)."""
+        return TOOLS.descriptions(names)
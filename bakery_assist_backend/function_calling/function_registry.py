@@ -1,14 +1,20 @@
-from function_calling.function_declaration import FunctionDeclaration
+from function_calling.tool_registry import TOOLS
 
 class FunctionRegistry:
-    def __init__(self):
-        self.function_declaration = FunctionDeclaration()
+    """
+    Name -> implementation views over the declarative registry in tool_registry.py.
+    Tools register themselves with @tool/@async_tool; nothing is listed here.
+    """
+
+    def __init__(self, registry=TOOLS):
+        self.registry = registry
 
     # --- Tool Registry ---
     # Maps tool names (as the LLM should use them) to the actual Python functions
     def tool_registry(self):
-        TOOL_REGISTRY = {
-            "get_customer_invoices": FunctionDeclaration.get_customer_invoices_from_db,
-        }
+        return self.registry.sync_tools()
 
-        return TOOL_REGISTRY
\ No newline at end of file
+    # --- Async Tool Registry ---
+    # Same tool names, mapped to the coroutine implementations used by async_app.py
+    def async_tool_registry(self):
+        return self.registry.async_tools()
@@ -0,0 +1,267 @@
+"""
+Compacts tool results before they are pasted into the next prompt.
+
+Tools return JSON, which spends most of its tokens on quotes, braces and keys repeated
+on every row. The compactor re-renders a result as plain text the model reads just as
+well: lists of records become pipe-separated tables with one header line, columns with
+a single value are stated once, long repeated values are replaced by short codes with a
+legend, and tables longer than a threshold are pre-aggregated (totals, ranges, value
+counts) with only a sample of rows kept. Whatever comes out is held to a token budget.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from utils import config
+from utils.metrics import METRICS
+from utils.token_estimator import estimate_text_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+TOOL_RESULT_TOKENS = METRICS.histogram("tool_result_tokens", "Estimated tokens of tool results by stage (raw, compacted)",
+                                       buckets=(25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800))
+COMPACTION_SECONDS = METRICS.histogram("tool_result_compaction_seconds", "Time spent compacting one tool result",
+                                       buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+
+_NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+# Identifier-like columns: numeric, but summing them means nothing
+_KEY_SUFFIXES = ("_pk", "_fk", "_id", "_number", "id")
+
+MIN_ROWS_TO_ENCODE = 4
+MIN_ENCODED_LENGTH = 6
+MAX_VALUE_COUNTS = 8
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _is_record_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _is_flat(record):
+    return all(not isinstance(v, (list, dict)) for v in record.values())
+
+
+class CompactedResult:
+    """A compacted tool result plus the before/after numbers that get logged and traced."""
+    __slots__ = ("text", "raw_tokens", "tokens", "seconds")
+
+    def __init__(self, text, raw_tokens, tokens, seconds):
+        self.text = text
+        self.raw_tokens = raw_tokens
+        self.tokens = tokens
+        self.seconds = seconds
+
+    def trace(self):
+        return {"raw_tokens": self.raw_tokens, "compacted_tokens": self.tokens,
+                "compaction_ms": round(self.seconds * 1000, 3)}
+
+
+class ResultCompactor:
+    """
+    Renders JSON tool results as compact text within a token budget.
+
+    Tables with more than `row_limit` rows are summarized and only their first rows kept;
+    if the text is still over budget, the limit is tightened step by step, and as a last
+    resort the text is truncated.
+    """
+
+    def __init__(self, summary_rows=None, sample_rows=None):
+        self.summary_rows = config.TOOL_RESULT_SUMMARY_ROWS if summary_rows is None else summary_rows
+        self.sample_rows = config.TOOL_RESULT_SAMPLE_ROWS if sample_rows is None else sample_rows
+
+    def compact(self, result, max_tokens):
+        """
+        Args:
+            result (str): The tool's JSON (or plain text) result.
+            max_tokens (int): Estimated token budget for the rendered text.
+
+        Returns:
+            CompactedResult: The text to put in the prompt, never longer than the raw result.
+        """
+        started = time.perf_counter()
+        raw_tokens = estimate_text_tokens(result)
+        try:
+            value = json.loads(result)
+        except (TypeError, ValueError):
+            value = None
+
+        text, tokens = result, raw_tokens
+        if isinstance(value, (dict, list)):
+            # (row_limit, sample) pairs from generous to summary-only
+            for row_limit, sample in self._row_limits():
+                candidate = "\n".join(self.render(value, row_limit, sample))
+                candidate_tokens = estimate_text_tokens(candidate)
+                if candidate_tokens < tokens:
+                    text, tokens = candidate, candidate_tokens
+                if tokens <= max_tokens:
+                    break
+        if tokens > max_tokens:
+            text = truncate_to_tokens(text, max_tokens)
+            tokens = estimate_text_tokens(text)
+
+        seconds = time.perf_counter() - started
+        TOOL_RESULT_TOKENS.observe(raw_tokens, stage="raw")
+        TOOL_RESULT_TOKENS.observe(tokens, stage="compacted")
+        COMPACTION_SECONDS.observe(seconds)
+        return CompactedResult(text, raw_tokens, tokens, seconds)
+
+    def _row_limits(self):
+        limit = self.summary_rows
+        yield limit, min(self.sample_rows, limit)
+        while limit > 0:
+            limit //= 2
+            yield limit, limit // 2
+
+    # --- Rendering ---
+
+    def render(self, value, row_limit, sample, indent="", columns=None):
+        """Lines of compact text for any JSON value; `columns` names the fields of array rows."""
+        if isinstance(value, dict):
+            return self._render_dict(value, row_limit, sample, indent)
+        if _is_record_list(value):
+            if all(_is_flat(record) for record in value):
+                return self.render_table(value, row_limit, sample, indent)
+            return self._render_blocks(value, row_limit, sample, indent, columns)
+        if isinstance(value, list) and value and all(isinstance(item, list) for item in value):
+            return self.render_table([dict(zip(columns, row)) if columns and len(columns) == len(row)
+                                      else {f"c{i + 1}": cell for i, cell in enumerate(row)} for row in value],
+                                     row_limit, sample, indent)
+        if isinstance(value, list):
+            return [indent + ", ".join(_cell(item) for item in value)]
+        return [indent + _cell(value)]
+
+    def _render_dict(self, record, row_limit, sample, indent, columns=None):
+        # "<name>_columns" lists name the positions of array rows elsewhere in the object
+        columns = next((v for k, v in record.items() if k.endswith("columns") and isinstance(v, list)), columns)
+        lines = []
+        for key, value in record.items():
+            if key.endswith("columns") and value is columns:
+                continue
+            if isinstance(value, (dict, list)) and value:
+                if isinstance(value, list) and not any(isinstance(item, (dict, list)) for item in value):
+                    lines.append(f"{indent}{key}: {', '.join(_cell(item) for item in value)}")
+                    continue
+                lines.append(f"{indent}{key}:")
+                if isinstance(value, dict):
+                    lines.extend(self._render_dict(value, row_limit, sample, indent + "  ", columns))
+                else:
+                    lines.extend(self.render(value, row_limit, sample, indent + "  ", columns))
+            else:
+                lines.append(f"{indent}{key}: {_cell(value)}")
+        return lines
+
+    def _render_blocks(self, records, row_limit, sample, indent, columns):
+        """Records with nested lists (e.g. invoices with items): one block per record."""
+        shown = records if len(records) <= max(row_limit, 1) else records[:max(sample, 1)]
+        lines = []
+        for record in shown:
+            block = self._render_dict(record, row_limit, sample, indent + "  ", columns)
+            lines.append(indent + "- " + block[0].lstrip() if block else indent + "-")
+            lines.extend(block[1:])
+        if len(shown) < len(records):
+            lines.append(f"{indent}({len(records) - len(shown)} more not shown)")
+        return lines
+
+    def render_table(self, records, row_limit, sample, indent=""):
+        """
+        A pipe-separated table with one header line. Constant columns are hoisted above it
+        and long repeated values dictionary-encoded; above `row_limit` rows only a summary
+        and the first `sample` rows are kept.
+        """
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        rows = [[_cell(record.get(column)) for column in columns] for record in records]
+        lines = [f"{indent}{len(rows)} rows"]
+
+        if len(rows) > row_limit:
+            lines.extend(self._summary_lines(columns, rows, indent))
+            rows = rows[:sample]
+            if not rows:
+                return lines
+            lines.append(f"{indent}first {len(rows)} rows:")
+
+        keep = list(range(len(columns)))
+        if len(rows) > 1:
+            for i, column in enumerate(columns):
+                distinct = {row[i] for row in rows}
+                if len(distinct) == 1:
+                    lines.append(f"{indent}{column} (all rows): {rows[0][i]}")
+                    keep.remove(i)
+        for i in keep:
+            legend = self._dictionary_encode(rows, i)
+            if legend:
+                lines.append(f"{indent}{columns[i]} codes: {legend}")
+
+        lines.append(indent + "|".join(columns[i] for i in keep))
+        lines.extend(indent + "|".join(row[i] for i in keep) for row in rows)
+        return lines
+
+    @staticmethod
+    def _dictionary_encode(rows, i):
+        """Replaces repeated long values of column `i` with short codes in place; returns the legend or None."""
+        values = [row[i] for row in rows]
+        counts = Counter(values)
+        if len(rows) < MIN_ROWS_TO_ENCODE or len(counts) > len(rows) // 2:
+            return None
+        if sum(len(v) for v in values) / len(values) < MIN_ENCODED_LENGTH:
+            return None
+        codes = {value: f"#{n}" for n, (value, _count) in enumerate(counts.most_common(), start=1)}
+        legend = ", ".join(f"{code}={value}" for value, code in codes.items())
+        if len(legend) + sum(len(codes[v]) for v in values) >= sum(len(v) for v in values):
+            return None  # encoding would not save anything
+        for row in rows:
+            row[i] = codes[row[i]]
+        return legend
+
+    @staticmethod
+    def _summary_lines(columns, rows, indent):
+        """Totals and ranges for numeric columns, ranges for dates, value counts for low-cardinality text."""
+        lines = [f"{indent}summary:"]
+        for i, column in enumerate(columns):
+            values = [row[i] for row in rows if row[i] != ""]
+            if not values:
+                continue
+            if all(_DATE_PATTERN.match(v) for v in values):
+                lines.append(f"{indent}  {column}: {min(values)} to {max(values)}")
+            elif all(_NUMBER_PATTERN.fullmatch(v) for v in values) and not column.lower().endswith(_KEY_SUFFIXES):
+                numbers = [float(v) for v in values]
+                lines.append(f"{indent}  {column}: total {sum(numbers):.2f}, min {min(numbers):g}, "
+                             f"max {max(numbers):g}, avg {sum(numbers) / len(numbers):.2f}")
+            else:
+                counts = Counter(values)
+                if len(counts) <= MAX_VALUE_COUNTS:
+                    lines.append(f"{indent}  {column}: " + ", ".join(f"{v} {n}" for v, n in counts.most_common()))
+                else:
+                    lines.append(f"{indent}  {column}: {len(counts)} distinct values")
+        return lines
+
+
+def compact_tool_results(tool_results, compactor=None):
+    """
+    Compacts the results of one tool step in place (sets `tool_result.compacted`), splitting
+    BAKERY_TOOL_RESULTS_MAX_TOKENS between them and capping each at BAKERY_TOOL_RESULT_MAX_TOKENS.
+    Logs raw vs. compacted tokens and the time spent.
+    """
+    if not config.TOOL_RESULT_COMPACTION_ENABLED or not tool_results:
+        return
+    compactor = compactor or DEFAULT_COMPACTOR
+    per_result = min(config.TOOL_RESULT_MAX_TOKENS, config.TOOL_RESULTS_MAX_TOKENS // len(tool_results))
+    for tool_result in tool_results:
+        compacted = compactor.compact(tool_result.result, max(1, per_result))
+        tool_result.compacted = compacted
+        logger.debug("Compacted %s result: %s -> %s tokens in %.2f ms",
+                     tool_result.name, compacted.raw_tokens, compacted.tokens, compacted.seconds * 1000)
+
+
+DEFAULT_COMPACTOR = ResultCompactor()
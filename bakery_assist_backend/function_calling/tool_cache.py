@@ -0,0 +1,187 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils import config
+from utils.db_notifications import get_invoice_change_listener
+from utils.metrics import METRICS
+
+TOOL_CACHE_LOOKUPS = METRICS.counter("tool_cache_lookups_total", "Tool result cache lookups by tool and result (hit, miss)")
+TOOL_CACHE_EVICTIONS = METRICS.counter("tool_cache_evictions_total", "Tool result cache entries removed, by reason")
+TOOL_CACHE_BYTES = METRICS.gauge("tool_cache_bytes", "Approximate bytes held by the tool result cache")
+
+ENTRY_OVERHEAD_BYTES = 150  # rough per-entry cost of the key tuple, entry list and dict slots
+
+
+def is_error_result(function_result_str):
+    """True if a tool returned its JSON error envelope ({"error": ...}) instead of data."""
+    try:
+        result = json.loads(function_result_str)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(result, dict) and "error" in result
+
+
+class ToolResultCache:
+    """
+    Bounded LRU cache of tool results (JSON strings) with per-entry TTLs.
+
+    Entries are grouped by the `customer_number` argument of the call, so an invoice
+    change notification can drop exactly that customer's results. Each customer also
+    has a generation counter: a result fetched before an invalidation is not stored.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = config.TOOL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()  # key -> [result, expires_at, size, customer]
+        self._generations = {}         # customer_number -> invalidation count
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def generation(self, customer_number):
+        with self._lock:
+            return self._generations.get(customer_number, 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key, "expired")
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, result, ttl, customer_number, generation):
+        size = ENTRY_OVERHEAD_BYTES + len(result.encode("utf-8")) + len(repr(key))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._generations.get(customer_number, 0) != generation:
+                return  # data changed while this result was being fetched
+            if key in self._entries:
+                self._remove(key, "replaced")
+            self._entries[key] = [result, time.monotonic() + ttl, size, customer_number]
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)), "size")
+            TOOL_CACHE_BYTES.set(self._bytes)
+
+    def invalidate_customer(self, customer_number):
+        """Drops every cached result that was computed for `customer_number`."""
+        customer_number = str(customer_number)
+        with self._lock:
+            self._generations[customer_number] = self._generations.get(customer_number, 0) + 1
+            for key in [k for k, entry in self._entries.items() if entry[3] == customer_number]:
+                self._remove(key, "invalidated")
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key, "cleared")
+
+    def _remove(self, key, reason):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        TOOL_CACHE_EVICTIONS.inc(reason=reason)
+        TOOL_CACHE_BYTES.set(self._bytes)
+
+
+# --- Shared Cache ---
+_tool_cache = None
+_tool_cache_lock = threading.Lock()
+
+def get_tool_cache():
+    """Returns the process-wide tool cache, subscribing it to invoice change notifications."""
+    global _tool_cache
+    with _tool_cache_lock:
+        if _tool_cache is None:
+            _tool_cache = ToolResultCache()
+            listener = get_invoice_change_listener()
+            # Changes made while the listener was disconnected were never announced
+            listener.subscribe(_tool_cache.invalidate_customer, on_connect=_tool_cache.clear)
+            listener.start()
+        return _tool_cache
+
+
+def _normalize_arguments(signature, args, kwargs):
+    """Binds a call to the tool signature, fills defaults and coerces annotated scalars."""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    normalized = []
+    for name, value in sorted(bound.arguments.items()):
+        annotation = signature.parameters[name].annotation
+        if annotation in (int, float, str) and value is not None:
+            try:
+                value = annotation(value.strip() if isinstance(value, str) else value)
+            except (TypeError, ValueError):
+                pass  # leave it to the tool to reject
+        elif isinstance(value, list):
+            value = tuple(value)  # keys must be hashable
+        normalized.append((name, value))
+    return tuple(normalized)
+
+
+def cached_tool(name, ttl=None):
+    """
+    Opts a tool into the shared result cache.
+
+    The cache key is (name, normalized arguments), so `limit="5"` and `limit=5` share an
+    entry, and the sync and async implementations of one tool share results when they
+    use the same name. Only successful results are cached; {"error": ...} envelopes are not.
+
+    Args:
+        name (str): Tool name used in the cache key (normally the registry name).
+        ttl (float): Seconds a result stays valid. Defaults to TOOL_CACHE_DEFAULT_TTL.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        entry_ttl = config.TOOL_CACHE_DEFAULT_TTL if ttl is None else ttl
+
+        def cache_key(args, kwargs):
+            arguments = _normalize_arguments(signature, args, kwargs)
+            customer_number = str(dict(arguments).get("customer_number"))
+            return (name, arguments), customer_number
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not config.TOOL_CACHE_ENABLED:
+                    return await func(*args, **kwargs)
+                cache = get_tool_cache()
+                key, customer_number = cache_key(args, kwargs)
+                cached = cache.get(key)
+                TOOL_CACHE_LOOKUPS.inc(tool=name, result="hit" if cached is not None else "miss")
+                if cached is not None:
+                    return cached
+                generation = cache.generation(customer_number)
+                result = await func(*args, **kwargs)
+                if isinstance(result, str) and not is_error_result(result):
+                    cache.put(key, result, entry_ttl, customer_number, generation)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.TOOL_CACHE_ENABLED:
+                return func(*args, **kwargs)
+            cache = get_tool_cache()
+            key, customer_number = cache_key(args, kwargs)
+            cached = cache.get(key)
+            TOOL_CACHE_LOOKUPS.inc(tool=name, result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return cached
+            generation = cache.generation(customer_number)
+            result = func(*args, **kwargs)
+            if isinstance(result, str) and not is_error_result(result):
+                cache.put(key, result, entry_ttl, customer_number, generation)
+            return result
+        return wrapper
+
+    return decorator
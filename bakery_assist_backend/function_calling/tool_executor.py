@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from function_calling.tool_cache import is_error_result
+from function_calling.tool_registry import ToolArgumentError
+from utils import config
+from utils.metrics import METRICS
+from utils.tracing import in_current_context, span
+
+logger = logging.getLogger(__name__)
+
+TOOL_CALL_SECONDS = METRICS.histogram("tool_call_seconds", "Tool execution latency by tool")
+TOOL_CALLS = METRICS.counter("tool_calls_total", "Tool calls by tool and status (ok, error, timeout, queue_timeout, unknown_tool, invalid_arguments)")
+
+
+class ToolCallResult:
+    """Outcome of one tool call: the JSON result string fed back to the LLM plus its trace data."""
+    __slots__ = ("name", "arguments", "result", "status", "latency_ms", "compacted")
+
+    def __init__(self, name, arguments, result, status, latency_ms):
+        self.name = name
+        self.arguments = arguments
+        self.result = result
+        self.status = status
+        self.latency_ms = latency_ms
+        self.compacted = None  # CompactedResult, set by function_calling/result_compactor.py
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    @property
+    def prompt_text(self):
+        """What goes into the prompt: the compacted rendering if there is one, else the raw result."""
+        return self.compacted.text if self.compacted is not None else self.result
+
+    def trace(self):
+        trace = {"tool": self.name, "arguments": self.arguments, "status": self.status, "latency_ms": self.latency_ms}
+        if self.compacted is not None:
+            trace.update(self.compacted.trace())
+        return trace
+
+
+def call_arguments(call_data):
+    """
+    A copy of a parsed call's arguments as a dict. Models sometimes send them as a JSON
+    string, which is decoded; anything else that is not an object counts as no arguments.
+    """
+    arguments = call_data.get("arguments")
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except json.JSONDecodeError:
+            arguments = None
+    return dict(arguments) if isinstance(arguments, dict) else {}
+
+
+def _prepare_call(call_data, registry, customer_number):
+    """
+    Returns (name, arguments, function) for a parsed call; function is None if the tool is unknown.
+    Arguments are validated and coerced against the tool's schema when the registry declares one.
+
+    Raises:
+        ToolArgumentError: The arguments do not fit the schema; the tool must not run.
+    """
+    name = call_data.get("name")
+    arguments = call_arguments(call_data)
+    # Always use the customer from the request context, whatever the LLM supplied
+    arguments["customer_number"] = customer_number
+    tool_function = registry.get(name)
+    if tool_function is not None and hasattr(registry, "validate"):
+        arguments = registry.validate(name, arguments)
+    return name, arguments, tool_function
+
+
+def _finish(name, arguments, result, status, started):
+    latency = time.perf_counter() - started
+    if status == "ok" and is_error_result(result):
+        status = "error"
+    TOOL_CALL_SECONDS.observe(latency, tool=name)
+    TOOL_CALLS.inc(tool=name, status=status)
+    return ToolCallResult(name, arguments, result, status, round(latency * 1000, 2))
+
+
+def _unknown_tool(name, arguments):
+    logger.warning("LLM requested unknown tool '%s'", name)
+    TOOL_CALLS.inc(tool=str(name), status="unknown_tool")
+    return ToolCallResult(name, arguments, json.dumps({"error": f"Unknown tool '{name}'."}), "unknown_tool", 0.0)
+
+
+def _invalid_arguments(name, call_data, error):
+    logger.warning("Rejected call to %s: %s", name, error)
+    TOOL_CALLS.inc(tool=str(name), status="invalid_arguments")
+    return ToolCallResult(name, call_data.get("arguments"), json.dumps({"error": str(error)}), "invalid_arguments", 0.0)
+
+
+def _queue_timeout(name, arguments):
+    logger.warning("Tool %s was not started within %.1fs: all tool workers are busy", name,
+                   config.TOOL_QUEUE_TIMEOUT_SECONDS)
+    TOOL_CALLS.inc(tool=name, status="queue_timeout")
+    return ToolCallResult(name, arguments, json.dumps({"error": f"Tool {name} could not be run: the server is busy."}),
+                          "queue_timeout", 0.0)
+
+
+def _timeout_for(name):
+    return float(config.TOOL_TIMEOUTS.get(name, config.TOOL_TIMEOUT_SECONDS))
+
+
+class _CallStart:
+    """Set by the worker when a submitted call starts running, so queue wait is not charged to the tool's timeout."""
+    __slots__ = ("event", "at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+
+    def set(self):
+        self.at = time.perf_counter()
+        self.event.set()
+
+
+def _run_tool(name, tool_function, arguments, call_start):
+    call_start.set()
+    with span("tool", tool=name) as tool_span:
+        try:
+            result, status = tool_function(**arguments), "ok"
+        except TypeError as e:
+            logger.error("Argument mismatch calling tool %s: %s", name, e)
+            result, status = json.dumps({"error": f"Internal error: Incorrect arguments provided for tool {name}."}), "error"
+        except Exception as e:
+            logger.error("Error executing tool %s: %s", name, e)
+            result, status = json.dumps({"error": f"Error executing tool {name}."}), "error"
+        tool_span.set(status=status)
+        return result, status
+
+
+class ToolExecutor:
+    """
+    Runs the tool calls of one LLM turn concurrently on a bounded, process-wide thread pool.
+
+    Each call gets its own timeout (BAKERY_TOOL_TIMEOUTS, falling back to
+    BAKERY_TOOL_TIMEOUT_SECONDS), counted from when a worker starts running it. A call that
+    times out is reported as an error result; its worker thread finishes in the background,
+    since Python threads cannot be killed. A call still queued for a worker after
+    BAKERY_TOOL_QUEUE_TIMEOUT_SECONDS is cancelled and reported as "queue_timeout".
+    Results come back in the order the calls were requested.
+    """
+
+    def __init__(self, max_workers=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or config.TOOL_EXECUTOR_MAX_WORKERS,
+                                        thread_name_prefix="tool")
+
+    def execute(self, calls, registry, customer_number):
+        calls = calls[:config.MAX_TOOL_CALLS_PER_TURN]
+        pending = []
+        for call_data in calls:
+            try:
+                name, arguments, tool_function = _prepare_call(call_data, registry, customer_number)
+            except ToolArgumentError as e:
+                pending.append((call_data.get("name"), call_data, e, None))
+                continue
+            if tool_function is None:
+                pending.append((name, arguments, None, None))
+                continue
+            logger.debug("Executing tool %s with %s", name, arguments)
+            call_start = _CallStart()
+            # The copied context carries the request's trace into the worker thread
+            future = self._pool.submit(in_current_context(_run_tool), name, tool_function, arguments, call_start)
+            pending.append((name, arguments, future, call_start))
+
+        queue_deadline = time.perf_counter() + config.TOOL_QUEUE_TIMEOUT_SECONDS
+        results = []
+        for name, arguments, future, call_start in pending:
+            if isinstance(future, ToolArgumentError):
+                results.append(_invalid_arguments(name, arguments, future))
+                continue
+            if future is None:
+                results.append(_unknown_tool(name, arguments))
+                continue
+            if not call_start.event.wait(max(0.0, queue_deadline - time.perf_counter())) and future.cancel():
+                results.append(_queue_timeout(name, arguments))
+                continue
+            call_start.event.wait()  # cancel() failed: a worker has just picked the call up
+            remaining = _timeout_for(name) - (time.perf_counter() - call_start.at)
+            try:
+                result, status = future.result(timeout=max(0.0, remaining))
+            except FutureTimeoutError:
+                logger.warning("Tool %s timed out after %.1fs", name, _timeout_for(name))
+                result, status = json.dumps({"error": f"Tool {name} timed out."}), "timeout"
+            results.append(_finish(name, arguments, result, status, call_start.at))
+        return results
+
+    async def execute_async(self, calls, registry, customer_number):
+        """Async variant for coroutine tools: runs the calls as concurrent tasks with per-tool timeouts."""
+        async def run_one(call_data):
+            try:
+                name, arguments, tool_function = _prepare_call(call_data, registry, customer_number)
+            except ToolArgumentError as e:
+                return _invalid_arguments(call_data.get("name"), call_data, e)
+            if tool_function is None:
+                return _unknown_tool(name, arguments)
+            logger.debug("Executing tool %s with %s", name, arguments)
+            started = time.perf_counter()
+            with span("tool", tool=name) as tool_span:
+                try:
+                    result = await asyncio.wait_for(tool_function(**arguments), timeout=_timeout_for(name))
+                    status = "ok"
+                except asyncio.TimeoutError:
+                    logger.warning("Tool %s timed out after %.1fs", name, _timeout_for(name))
+                    result, status = json.dumps({"error": f"Tool {name} timed out."}), "timeout"
+                except TypeError as e:
+                    logger.error("Argument mismatch calling tool %s: %s", name, e)
+                    result, status = json.dumps({"error": f"Internal error: Incorrect arguments provided for tool {name}."}), "error"
+                except Exception as e:
+                    logger.error("Error executing tool %s: %s", name, e)
+                    result, status = json.dumps({"error": f"Error executing tool {name}."}), "error"
+                tool_span.set(status=status)
+            return _finish(name, arguments, result, status, started)
+
+        return list(await asyncio.gather(*(run_one(c) for c in calls[:config.MAX_TOOL_CALLS_PER_TURN])))
+
+
+# --- Shared Executor ---
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_tool_executor():
+    """Returns the process-wide ToolExecutor."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ToolExecutor()
+        return _executor
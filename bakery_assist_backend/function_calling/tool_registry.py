@@ -0,0 +1,359 @@
+"""
+Declarative tool registry.
+
+Tools register themselves with the @tool decorator, declaring a typed parameter schema:
+
+    @staticmethod
+    @tool("get_customer_invoices", "Retrieves the customer's most recent invoices.",
+          params=[Param("limit", int, "How many invoices to return.", default=5, minimum=1, maximum=50)],
+          returns="A JSON list of invoices (number, date, total, status), or an error message.")
+    def get_customer_invoices_from_db(customer_number: str, limit: int = 5): ...
+
+and the coroutine twin used by async_app.py with @async_tool("get_customer_invoices").
+Every tool implicitly takes `customer_number`, which the executor fills from the request.
+
+Modules listed in TOOL_MODULES are imported on first use of the registry, not at startup.
+LLM-provided arguments are validated and coerced against the schema before a tool runs,
+so bad input is rejected with a message the model can act on instead of failing in the
+DB layer. Prompt descriptions are rendered once per tool and cached. The same schema is
+available as JSON Schema (calls_schema) for Ollama's structured outputs.
+"""
+import importlib
+import inspect
+import threading
+from collections.abc import Mapping
+
+from utils import config
+
+TOOL_MODULES = (
+    "function_calling.function_declaration",
+    "function_calling.analytics_declaration",
+)
+
+_REQUIRED = object()
+_TRUE_WORDS = ("true", "yes", "1", "on")
+_FALSE_WORDS = ("false", "no", "0", "off")
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when LLM-provided arguments do not match a tool's schema; the message lists every problem."""
+
+
+class Param:
+    """
+    One declared tool parameter.
+
+    Args:
+        name (str): Argument name the model must use.
+        type (type): str, int, float, bool or list (a list of strings; a comma-separated string is accepted).
+        description (str): Shown to the model in the tool description.
+        default: Value used when the argument is missing. Omit to make the parameter required.
+        choices (tuple): Allowed values (strings are matched case-insensitively).
+        minimum, maximum: Numeric bounds; out-of-range values are clamped.
+    """
+    __slots__ = ("name", "type", "description", "default", "choices", "minimum", "maximum")
+
+    def __init__(self, name, type, description, default=_REQUIRED, choices=None, minimum=None, maximum=None):
+        if type not in (str, int, float, bool, list):
+            raise TypeError(f"Unsupported parameter type for '{name}': {type!r}")
+        self.name = name
+        self.type = type
+        self.description = description
+        self.default = default
+        self.choices = tuple(choices) if choices else None
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def required(self):
+        return self.default is _REQUIRED
+
+    def coerce(self, value):
+        """Returns `value` converted to the declared type; raises ValueError with a short reason."""
+        if self.type is list:
+            items = value.split(",") if isinstance(value, str) else value
+            if not isinstance(items, (list, tuple)):
+                raise ValueError("expected a list")
+            value = [str(item).strip() for item in items if str(item).strip()]
+            if not value:
+                raise ValueError("expected at least one value")
+            return value
+        if self.type is bool:
+            if isinstance(value, bool):
+                return value
+            word = str(value).strip().lower()
+            if word in _TRUE_WORDS or word in _FALSE_WORDS:
+                return word in _TRUE_WORDS
+            raise ValueError("expected true or false")
+        if isinstance(value, (dict, list)) or isinstance(value, bool):
+            raise ValueError(f"expected {self.type.__name__}")
+        if self.type is str:
+            value = str(value).strip()
+            if self.choices:
+                matches = [choice for choice in self.choices if choice.lower() == value.lower()]
+                if not matches:
+                    raise ValueError(f"expected one of {', '.join(self.choices)}")
+                value = matches[0]
+            return value
+
+        # int / float
+        try:
+            number = float(value.strip()) if isinstance(value, str) else float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected {self.type.__name__}") from None
+        if self.type is int:
+            if not number.is_integer():
+                raise ValueError("expected a whole number")
+            number = int(number)
+        if self.minimum is not None:
+            number = max(self.minimum, number)
+        if self.maximum is not None:
+            number = min(self.maximum, number)
+        return number
+
+    def describe(self):
+        type_name = "list of str" if self.type is list else self.type.__name__
+        details = [type_name]
+        if not self.required:
+            details.append(f"optional, default {self.default!r}")
+        if self.choices:
+            details.append("one of " + "/".join(self.choices))
+        if self.minimum is not None or self.maximum is not None:
+            details.append(f"{self.minimum if self.minimum is not None else ''}..{self.maximum if self.maximum is not None else ''}")
+        return f"{self.name} ({', '.join(details)}): {self.description}"
+
+    def json_schema(self):
+        schema = {"type": "array", "items": {"type": "string"}} if self.type is list else {"type": _JSON_TYPES[self.type]}
+        if self.choices:
+            schema["enum"] = list(self.choices)
+        if self.minimum is not None:
+            schema["minimum"] = self.minimum
+        if self.maximum is not None:
+            schema["maximum"] = self.maximum
+        return schema
+
+
+CUSTOMER_NUMBER_PARAM = Param("customer_number", str, "The customer number from the current context.")
+
+
+class ToolSpec:
+    """A registered tool: its schema, its prompt description and its sync/async implementations."""
+
+    def __init__(self, name, summary, params, returns, keywords=()):
+        self.name = name
+        self.summary = summary
+        self.params = [CUSTOMER_NUMBER_PARAM] + list(params)
+        self.returns = returns
+        self.keywords = tuple(keywords)  # extra retrieval terms (see tool_retriever.py), not shown to the model
+        self.sync_function = None
+        self.async_function = None
+        self._by_name = {param.name: param for param in self.params}
+        self._description = None
+
+    def validate(self, arguments):
+        """
+        Coerces `arguments` to the schema, filling defaults.
+
+        Raises:
+            ToolArgumentError: Unknown, missing or ill-typed arguments (all of them, in one message).
+        """
+        problems = [f"unexpected argument '{key}'" for key in arguments if key not in self._by_name]
+        validated = {}
+        for param in self.params:
+            value = arguments.get(param.name)
+            if value is None or value == "":
+                if param.required:
+                    problems.append(f"missing required argument '{param.name}'")
+                else:
+                    validated[param.name] = param.default
+                continue
+            try:
+                validated[param.name] = param.coerce(value)
+            except ValueError as e:
+                problems.append(f"'{param.name}': {e} (got {value!r})")
+        if problems:
+            raise ToolArgumentError(f"Invalid arguments for tool {self.name}: " + "; ".join(problems) + ".")
+        return validated
+
+    @property
+    def description(self):
+        """Prompt text for this tool, rendered on first use."""
+        if self._description is None:
+            lines = [f"- Function Name: {self.name}", f"        Description: {self.summary}", "        Args:"]
+            lines += [f"            {param.describe()}" for param in self.params]
+            lines += ["        Returns:", f"            str: {self.returns}"]
+            self._description = "\n".join(lines)
+        return self._description
+
+    def call_schema(self):
+        """JSON Schema of one call to this tool: {"name": ..., "arguments": {...}}."""
+        return {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "enum": [self.name]},
+                "arguments": {
+                    "type": "object",
+                    "properties": {param.name: param.json_schema() for param in self.params},
+                    "required": [param.name for param in self.params if param.required],
+                },
+            },
+            "required": ["name", "arguments"],
+        }
+
+
+class ToolRegistry:
+    """Holds the ToolSpecs registered by @tool/@async_tool, importing the tool modules on first use."""
+
+    def __init__(self, modules=TOOL_MODULES):
+        self.modules = tuple(modules) + tuple(config.TOOL_MODULES)
+        self._specs = {}
+        self._descriptions = {}
+        self._discovered = False
+        self._lock = threading.RLock()
+
+    # --- Registration ---
+
+    def register(self, name, summary, params, returns, function, keywords=()):
+        with self._lock:
+            spec = self._specs.get(name)
+            if spec is None or spec.summary is None:
+                pending = spec
+                spec = ToolSpec(name, summary, params, returns, keywords)
+                if pending is not None:
+                    spec.async_function = pending.async_function
+                self._specs[name] = spec
+            elif spec.sync_function is not None:
+                raise ValueError(f"Tool '{name}' is registered twice")
+            spec.sync_function = function
+            self._descriptions.clear()
+
+    def register_async(self, name, function):
+        with self._lock:
+            spec = self._specs.get(name)
+            if spec is None:
+                # The sync declaration (which carries the schema) may live further down the module
+                spec = self._specs[name] = ToolSpec(name, None, (), None)
+            spec.async_function = function
+
+    # --- Discovery ---
+
+    def _ensure_discovered(self):
+        if self._discovered:
+            return
+        with self._lock:
+            if self._discovered:
+                return
+            for module in self.modules:
+                importlib.import_module(module)
+            incomplete = [name for name, spec in self._specs.items() if spec.summary is None]
+            if incomplete:
+                raise RuntimeError(f"Async tools without a schema-declaring @tool twin: {', '.join(incomplete)}")
+            self._discovered = True
+
+    def spec(self, name):
+        self._ensure_discovered()
+        return self._specs.get(name)
+
+    def names(self):
+        self._ensure_discovered()
+        return list(self._specs)
+
+    def validate(self, name, arguments):
+        """Validated, coerced arguments for tool `name` (see ToolSpec.validate)."""
+        return self.spec(name).validate(arguments)
+
+    def descriptions(self, names=None):
+        """Prompt text for `names` (default: every tool), cached per distinct selection."""
+        self._ensure_discovered()
+        key = tuple(names) if names is not None else None
+        text = self._descriptions.get(key)
+        if text is None:
+            selected = self._specs.values() if names is None else [self._specs[n] for n in names if n in self._specs]
+            text = self._descriptions[key] = "\n".join(spec.description for spec in selected)
+        return text
+
+    def calls_schema(self, names=None, max_calls=None):
+        """
+        JSON Schema of a list of calls to `names` (default: every tool), at most `max_calls`
+        long; an empty list means no tool is needed.
+        """
+        self._ensure_discovered()
+        selected = self._specs.values() if names is None else [self._specs[n] for n in names if n in self._specs]
+        if not selected:
+            return {"type": "array", "maxItems": 0}
+        schema = {"type": "array", "items": {"anyOf": [spec.call_schema() for spec in selected]}}
+        if max_calls:
+            schema["maxItems"] = max_calls
+        return schema
+
+    def sync_tools(self):
+        return ToolView(self, "sync_function")
+
+    def async_tools(self):
+        return ToolView(self, "async_function")
+
+
+class ToolView(Mapping):
+    """
+    Read-only name -> implementation mapping over a ToolRegistry (sync or async side).
+    Creating it does not import any tool module; the first lookup does.
+    """
+
+    def __init__(self, registry, attribute):
+        self._registry = registry
+        self._attribute = attribute
+
+    def _functions(self):
+        self._registry._ensure_discovered()
+        return {name: getattr(spec, self._attribute) for name, spec in self._registry._specs.items()
+                if getattr(spec, self._attribute) is not None}
+
+    def __getitem__(self, name):
+        spec = self._registry.spec(name)
+        function = getattr(spec, self._attribute) if spec is not None else None
+        if function is None:
+            raise KeyError(name)
+        return function
+
+    def __iter__(self):
+        return iter(self._functions())
+
+    def __len__(self):
+        return len(self._functions())
+
+    def validate(self, name, arguments):
+        return self._registry.validate(name, arguments)
+
+    def descriptions(self, names=None):
+        return self._registry.descriptions(names)
+
+    def calls_schema(self, names=None, max_calls=None):
+        return self._registry.calls_schema(names, max_calls)
+
+
+# --- Shared Registry and Decorators ---
+TOOLS = ToolRegistry()
+
+def tool(name, summary, params=(), returns="A JSON string with the result, or an error message.", keywords=(),
+         registry=None):
+    """
+    Registers the decorated function as the synchronous implementation of tool `name`.
+    `keywords` are words users say when they need the tool; they help tool retrieval only.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            raise TypeError(f"@tool('{name}') expects a regular function; use @async_tool for coroutines")
+        (registry or TOOLS).register(name, summary, params, returns, function, keywords)
+        return function
+    return decorator
+
+
+def async_tool(name, registry=None):
+    """Registers the decorated coroutine as the async implementation of tool `name` (schema comes from its @tool twin)."""
+    def decorator(function):
+        if not inspect.iscoroutinefunction(function):
+            raise TypeError(f"@async_tool('{name}') expects a coroutine function")
+        (registry or TOOLS).register_async(name, function)
+        return function
+    return decorator
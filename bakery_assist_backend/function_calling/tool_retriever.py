@@ -0,0 +1,197 @@
+"""
+Picks the tool descriptions worth sending with each user message.
+
+Every tool description costs prompt tokens on every request, and prompt evaluation time
+grows with them. The retriever keeps a BM25 index over each tool's name, summary,
+parameter descriptions and declared keywords, built once from the tool registry, and
+sends only the top-k tools that match the message. When nothing matches (a greeting, a
+vague question) every tool is sent, so retrieval can narrow the choice but never hide
+the right tool from a request it cannot classify.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from function_calling.tool_registry import TOOLS
+from utils import config
+from utils.metrics import METRICS
+from utils.token_estimator import estimate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+SELECTION_SECONDS = METRICS.histogram("tool_selection_seconds", "Time spent picking the tools for one message",
+                                      buckets=(0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+SELECTED_TOOLS = METRICS.histogram("tool_selection_size", "Tools described in the prompt per message",
+                                   buckets=(1, 2, 3, 5, 8, 13, 21))
+TOKENS_SAVED = METRICS.counter("tool_description_tokens_saved_total", "Estimated prompt tokens saved by tool retrieval")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could did do does for from get give has have how i in is it its me my "
+    "of on or our please show that the their them there this to us was we were what when which who will "
+    "with would you your".split()
+)
+_SUFFIXES = ("ing", "ies", "ed", "es", "ly", "s")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def _stem(word):
+    """Strips the most common English suffixes so 'invoices'/'invoice' and 'ordered'/'order' match."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokenize(text):
+    """Lower-cased, stemmed terms of `text`, without stopwords; underscores split identifiers."""
+    return [_stem(word) for word in _WORD_PATTERN.findall(text.lower().replace("_", " "))
+            if word not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a small, fixed set of documents.
+
+    Args:
+        documents (dict): Document id -> text.
+    """
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._terms = {doc_id: Counter(tokenize(text)) for doc_id, text in documents.items()}
+        self._lengths = {doc_id: sum(terms.values()) for doc_id, terms in self._terms.items()}
+        self._average_length = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter(term for terms in self._terms.values() for term in terms)
+        count = len(self._terms)
+        self._idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query):
+        """Score per document id for `query` (documents sharing no term with it score 0)."""
+        query_terms = set(tokenize(query)) & self._idf.keys()
+        scores = {}
+        for doc_id, terms in self._terms.items():
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / (self._average_length or 1))
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores[doc_id] = score
+        return scores
+
+
+class ToolSelection:
+    """The tools picked for one message, plus the numbers that get logged and traced."""
+    __slots__ = ("names", "scores", "retrieved", "seconds", "full_tokens", "tokens")
+
+    def __init__(self, names, scores, retrieved, seconds, full_tokens, tokens):
+        self.names = names
+        self.scores = scores
+        self.retrieved = retrieved  # False when every tool was sent (fallback or retrieval off)
+        self.seconds = seconds
+        self.full_tokens = full_tokens
+        self.tokens = tokens
+
+    @property
+    def tokens_saved(self):
+        return self.full_tokens - self.tokens
+
+    def trace(self):
+        return {
+            "tools": self.names,
+            "retrieved": self.retrieved,
+            "scores": {name: round(score, 3) for name, score in self.scores.items() if score},
+            "description_tokens": self.tokens,
+            "tokens_saved": self.tokens_saved,
+            "selection_ms": round(self.seconds * 1000, 3),
+        }
+
+
+class ToolRetriever:
+    """
+    Selects up to `top_k` tools per message with a BM25 index over the registry's tools.
+
+    Tools scoring below `min_score_ratio` of the best match are dropped even inside the
+    top-k, so a clear single-tool question gets a single description. Selected names keep
+    registry order, which keeps the rendered prompt (and its cache key) stable.
+    """
+
+    def __init__(self, registry=None, top_k=None, min_score_ratio=None):
+        self.registry = registry or TOOLS
+        self.top_k = config.TOOL_RETRIEVAL_TOP_K if top_k is None else top_k
+        self.min_score_ratio = config.TOOL_RETRIEVAL_MIN_SCORE_RATIO if min_score_ratio is None else min_score_ratio
+        self._index = None
+        self._names = None
+        self._tokens = None
+        self._full_tokens = 0
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Indexes the registry's tools; called on first use, or at startup to keep it off the request path."""
+        with self._lock:
+            if self._index is not None:
+                return self
+            started = time.perf_counter()
+            names = self.registry.names()
+            documents = {}
+            for name in names:
+                spec = self.registry.spec(name)
+                documents[name] = " ".join([name, spec.summary] + [param.description for param in spec.params[1:]]
+                                           + list(spec.keywords))
+            self._tokens = {name: estimate_text_tokens(self.registry.descriptions([name])) for name in names}
+            self._full_tokens = estimate_text_tokens(self.registry.descriptions())
+            self._index = BM25Index(documents)
+            self._names = names
+            logger.info("Tool retrieval index built over %s tools in %.2f ms",
+                        len(names), (time.perf_counter() - started) * 1000)
+        return self
+
+    def select(self, message, required=()):
+        """
+        Args:
+            message (str): The user's message.
+            required (iterable): Tool names that must be included (e.g. calls already chosen by the intent router).
+
+        Returns:
+            ToolSelection: Names in registry order, or every tool when retrieval is off or nothing matched.
+        """
+        self.build()
+        started = time.perf_counter()
+        scores = self._index.scores(message) if config.TOOL_RETRIEVAL_ENABLED else {}
+        best = max(scores.values(), default=0.0)
+        names = self._names
+        retrieved = best > 0 and len(self._names) > self.top_k
+        if retrieved:
+            ranked = sorted((name for name in self._names if scores[name] >= best * self.min_score_ratio),
+                            key=lambda name: -scores[name])[:self.top_k]
+            keep = set(ranked) | {name for name in required if name in scores}
+            names = [name for name in self._names if name in keep]
+        tokens = sum(self._tokens[name] for name in names) if retrieved else self._full_tokens
+        seconds = time.perf_counter() - started
+
+        SELECTION_SECONDS.observe(seconds)
+        SELECTED_TOOLS.observe(len(names))
+        selection = ToolSelection(names, scores, retrieved, seconds, self._full_tokens, tokens)
+        if selection.tokens_saved > 0:
+            TOKENS_SAVED.inc(selection.tokens_saved)
+        return selection
+
+
+# --- Shared Retriever ---
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_tool_retriever():
+    """Returns the process-wide ToolRetriever over the shared tool registry."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = ToolRetriever()
+        return _retriever
@@ -0,0 +1,446 @@
+"""
+Bounded agent loop: LLM -> tools -> LLM ... until the model answers.
+
+Each chat turn alternates model steps and tool steps, so the model can follow up on a
+result (e.g. list invoices, then fetch the items of the overdue one). The loop stops
+requesting tools when a budget runs out (LLM steps, estimated tokens, wall clock) or
+when the model repeats a call it already has the result of; the last step is then an
+answer-only call over every tool result gathered so far.
+"""
+import json
+import logging
+import time
+
+from helpers.ollama_helper import call_ollama, call_ollama_stream
+from helpers.async_ollama_helper import call_ollama_async, call_ollama_stream_async
+from helpers.llm_dispatcher import FIRST_TURN, FOLLOW_UP
+from helpers.reply_parser import FUNCTION_CALL_OPEN_TAG, ReplyParser
+from helpers.tool_detection import ToolDetection
+from function_calling.result_compactor import compact_tool_results
+from function_calling.tool_executor import call_arguments, get_tool_executor
+from function_calling.tool_retriever import get_tool_retriever
+from templates.prompt_builder import PROMPT_BUILDER
+from utils import config
+from utils.metrics import METRICS
+from utils.token_estimator import estimate_text_tokens
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+AGENT_STEP_SECONDS = METRICS.histogram("agent_step_seconds", "Duration of agent loop steps by kind (llm, tools)")
+AGENT_RUNS = METRICS.counter("agent_runs_total", "Finished agent loops by stop reason")
+EARLY_STOPS = METRICS.counter("agent_early_stops_total", "Streamed model steps cut short once their tool calls were complete")
+
+UNKNOWN_TOOL_REPLY = "Sorry, I encountered an issue trying to use an internal tool ('{tool_name}'). Please try rephrasing your request."
+EMPTY_REPLY = "Sorry, I encountered an unexpected issue generating a response."
+
+
+class AgentError(Exception):
+    """Raised when a model step fails; the message is safe to return to the client."""
+
+
+def _call_key(call_data):
+    """Identity of a tool call: its name plus canonical JSON of its arguments."""
+    return call_data.get("name"), json.dumps(call_data.get("arguments") or {}, sort_keys=True, default=str)
+
+
+def _as_call_tags(calls):
+    """Renders router-chosen calls the way the model would have written them, to keep the conversation coherent."""
+    return "\n".join(f"<function_call>{json.dumps(call_data)}</function_call>" for call_data in calls)
+
+
+class ReplySniffer:
+    """
+    Classifies one model step as tool calls or the final answer while it streams in.
+
+    With `eager` set (streaming mode), visible text is released as soon as it can no
+    longer be the start of a <function_call> tag, so answers stream without waiting
+    for the step to finish. Otherwise the whole step is collected and a call tag
+    anywhere in the visible text counts. <think> spans are dropped either way, and the
+    calls are parsed as they stream in (see helpers/reply_parser.py). With `json_calls`
+    the step was sent with a JSON `format` and its whole output is the calls.
+    """
+
+    def __init__(self, eager, tools_allowed=True, json_calls=False):
+        self.eager = eager
+        self.tools_allowed = tools_allowed
+        # None until decided, then "calls" or "answer"
+        self.kind = "calls" if json_calls else None if tools_allowed else "answer"
+        self.done_reason = None
+        self._parser = ReplyParser(json_only=json_calls)
+        self._held = ""
+
+    @property
+    def text(self):
+        return self._parser.text
+
+    @property
+    def raw_length(self):
+        return self._parser.raw_length
+
+    @property
+    def raw_tokens(self):
+        return self._parser.raw_tokens
+
+    @property
+    def calls(self):
+        return self._parser.calls if self.kind == "calls" else []
+
+    @property
+    def unterminated(self):
+        """The step ended inside a call block (a stop sequence, or JSON mode)."""
+        return self._parser.unterminated
+
+    @property
+    def can_stop(self):
+        """The step's calls are complete and the model moved on to other text, which is not needed."""
+        return self.kind != "answer" and self._parser.calls_complete
+
+    def record_done(self, response_data):
+        """on_done callback for the Ollama helpers: keeps why generation ended ("length": num_predict hit)."""
+        self.done_reason = response_data.get("done_reason")
+
+    def feed(self, chunk):
+        """Consumes raw model output and returns answer text that is ready for the client."""
+        visible = self._parser.feed(chunk)
+        if not visible:
+            return ""
+        self._held += visible
+        if self.kind == "answer":
+            return self._release()
+        if self.kind == "calls" or not self.eager:
+            return ""
+
+        head = self._held[:len(FUNCTION_CALL_OPEN_TAG)].lower()
+        if head.startswith(FUNCTION_CALL_OPEN_TAG):
+            self.kind = "calls"
+        elif not FUNCTION_CALL_OPEN_TAG.startswith(head):
+            self.kind = "answer"
+            return self._release()
+        return ""
+
+    def finish(self):
+        """Ends the step; returns any answer text still held back."""
+        self._held += self._parser.finish()
+        if self.kind is None:
+            self.kind = "calls" if self._parser.call_blocks else "answer"
+        return self._release() if self.kind == "answer" else ""
+
+    def _release(self):
+        held, self._held = self._held, ""
+        return held
+
+
+class AgentRun:
+    """
+    State and trace of one chat turn through the agent loop.
+
+    Drivers in AgentLoop do the I/O; the bookkeeping (prompts, budgets, repeat
+    detection, per-step timings) lives here so the sync and async drivers share it.
+    """
+
+    def __init__(self, customer_number, user_message, first_calls=None, on_detection=None,
+                 max_steps=None, max_tokens=None, max_seconds=None, history=None, detection=None):
+        self.customer_number = customer_number
+        self.user_message = user_message
+        self.on_detection = on_detection
+        self.detection = detection if detection is not None else ToolDetection()
+        self.max_steps = config.AGENT_MAX_STEPS if max_steps is None else max(2, max_steps)
+        self.max_tokens = config.AGENT_MAX_TOKENS if max_tokens is None else max_tokens
+        self.max_seconds = config.AGENT_MAX_SECONDS if max_seconds is None else max_seconds
+
+        self.pending_calls = list(first_calls or [])
+        # Describe only the tools relevant to this message (always including any the router already chose).
+        # Follow-ups ("and the one before that?") rarely name a tool, so the previous question counts too.
+        previous_message = next((m["content"] for m in reversed(history or ()) if m["role"] == "user"), "")
+        with span("tool_selection") as selection_span:
+            self.tool_selection = get_tool_retriever().select(
+                f"{previous_message}\n{user_message}", required=[call_data.get("name") for call_data in self.pending_calls])
+            selection_span.set(tools=len(self.tool_selection.names), tokens_saved=self.tool_selection.tokens_saved)
+        logger.debug("Tool selection: %s (%d description tokens, %d saved) in %.2f ms",
+                     self.tool_selection.names, self.tool_selection.tokens, self.tool_selection.tokens_saved,
+                     self.tool_selection.seconds * 1000)
+        self.history = list(history or ())
+        self.messages = PROMPT_BUILDER.tool_detection_messages(customer_number, user_message,
+                                                               self.tool_selection.names, self.history)
+        if self.pending_calls:
+            self.messages.append({"role": "assistant", "content": _as_call_tags(self.pending_calls)})
+        self.tool_results = []
+        self.steps = []
+        self.llm_steps = 0
+        self.tokens_used = 0
+        self.stop_reason = None
+        self.answered = False
+        self.reply = ""
+        self._detection_seconds = 0.0  # model time spent deciding on tools, dropped detection steps included
+        self._detection_reported = False
+        self._seen_calls = set()
+        self._started = time.monotonic()
+
+    @property
+    def llm_priority(self):
+        """Model steps after tool results finish a chat that is already under way, so they queue first."""
+        return FOLLOW_UP if self.tool_results else FIRST_TURN
+
+    @property
+    def cacheable(self):
+        """Only answers grounded in successful tool results are worth caching."""
+        return bool(self.tool_results) and all(tool_result.ok for tool_result in self.tool_results)
+
+    def trace(self):
+        return {
+            "tool_selection": self.tool_selection.trace(),
+            "steps": self.steps,
+            "stop_reason": self.stop_reason,
+            "llm_steps": self.llm_steps,
+            "estimated_tokens": self.tokens_used,
+            "elapsed_ms": round((time.monotonic() - self._started) * 1000, 2),
+        }
+
+    # --- Budgets ---
+
+    def _budget_exhausted(self):
+        if self.llm_steps + 1 >= self.max_steps:
+            return "step_budget"
+        if self.tokens_used >= self.max_tokens:
+            return "token_budget"
+        if time.monotonic() - self._started >= self.max_seconds:
+            return "time_budget"
+        return None
+
+    @property
+    def detecting(self):
+        """The next model step is the turn's tool-detection step, sent with the detection limits."""
+        return self.detection.enabled and self.llm_steps == 0 and not self.tool_results and self.stop_reason is None
+
+    def next_prompt(self):
+        """Returns (messages, tools_allowed, detecting) for the next model step."""
+        if self.stop_reason is None and self.tool_results:
+            self.stop_reason = self._budget_exhausted()
+        if self.stop_reason is not None:
+            # Out of budget or looping: answer from what we have, no more tools (follow-ups still need the session)
+            return PROMPT_BUILDER.response_messages(self.tool_results, self.user_message, self.history), False, False
+        if self.detecting and self.detection.json_format:
+            return PROMPT_BUILDER.json_detection_messages(self.messages), True, True
+        return self.messages, True, self.detecting
+
+    def new_sniffer(self, stream, tools_allowed, detecting):
+        """The sniffer for a model step; a detection step that may be dropped is never streamed to the client."""
+        decides_only = detecting and self.detection.decides_only
+        return ReplySniffer(eager=stream and not decides_only, tools_allowed=tools_allowed,
+                            json_calls=detecting and self.detection.json_format)
+
+    # --- Steps ---
+
+    def record_llm_step(self, sniffer, seconds, detecting=False):
+        """Records a finished model step; returns False if it was dropped (its text must not reach the client)."""
+        self.llm_steps += 1
+        tokens = sniffer.raw_tokens
+        self.tokens_used += tokens
+        calls = sniffer.calls
+        # A capped or JSON detection step without a call is no answer: ask again without limits
+        retry = (detecting and not calls and self.detection.decides_only
+                 and (self.detection.json_format or sniffer.done_reason == "length"))
+        outcome = "tool_calls" if calls else "no_call" if retry else "answer"
+        details = {"detection": self.detection.trace(), "done_reason": sniffer.done_reason} if detecting else {}
+        self._record_step("llm", seconds, outcome=outcome, estimated_tokens=tokens, **details)
+        if not self.tool_results:
+            self._detection_seconds += seconds
+        if retry:
+            return False
+
+        # The first kept step made the turn's tool decision (after any dropped detection step)
+        if self.on_detection and not self._detection_reported and not self.tool_results:
+            self.on_detection(calls, self._detection_seconds)
+        self._detection_reported = True
+
+        if calls:
+            # A stop sequence or JSON mode leaves no closing tag; keep the transcript in tag form
+            self.messages.append({"role": "assistant",
+                                  "content": _as_call_tags(calls) if sniffer.unterminated else sniffer.text})
+            self.pending_calls = calls
+        else:
+            self.answered = True
+            self.reply = sniffer.text.strip()
+            if self.stop_reason is None:
+                self.stop_reason = "answer"
+        return True
+
+    def take_new_calls(self):
+        """Pops the pending calls, dropping (and tracing) any the model already made this turn."""
+        new_calls, repeats = [], []
+        for call_data in self.pending_calls[:config.MAX_TOOL_CALLS_PER_TURN]:
+            if not isinstance(call_data.get("name"), str):
+                logger.warning("Agent loop: dropping tool call without a tool name: %s", call_data)
+                continue
+            call_data = {"name": call_data["name"],
+                         "arguments": dict(call_arguments(call_data), customer_number=self.customer_number)}
+            key = _call_key(call_data)
+            if key in self._seen_calls:
+                repeats.append(call_data)
+                continue
+            self._seen_calls.add(key)
+            new_calls.append(call_data)
+        self.pending_calls = []
+
+        if repeats:
+            logger.info("Agent loop: short-circuiting %d repeated tool call(s)", len(repeats))
+            self._record_step("tools", 0.0, repeated=[{"tool": c["name"], "arguments": c["arguments"]} for c in repeats])
+        if not new_calls:
+            # Nothing new to learn: the model is looping (or only sent broken calls), so answer now
+            self.stop_reason = self.stop_reason or ("repeated_call" if repeats else "invalid_call")
+        return new_calls
+
+    def record_tool_step(self, results, seconds):
+        with span("compaction"):
+            compact_tool_results(results)
+        self._record_step("tools", seconds, calls=[tool_result.trace() for tool_result in results])
+        if results and all(tool_result.status == "unknown_tool" for tool_result in results) and not self.tool_results:
+            self.stop_reason = "unknown_tool"
+            self.reply = UNKNOWN_TOOL_REPLY.format(tool_name=results[0].name)
+            return
+        self.tool_results.extend(results)
+        self.tokens_used += sum(
+            tool_result.compacted.tokens if tool_result.compacted else estimate_text_tokens(tool_result.result)
+            for tool_result in results)
+        self.messages.append(PROMPT_BUILDER.follow_up_message(results))
+
+    @property
+    def reply_ready(self):
+        return self.answered or self.stop_reason == "unknown_tool"
+
+    def finish(self):
+        AGENT_RUNS.inc(stop_reason=self.stop_reason or "none")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Agent loop finished (%s) after %d LLM step(s): %s",
+                         self.stop_reason, self.llm_steps, json.dumps(self.steps))
+
+    def _record_step(self, kind, seconds, **details):
+        AGENT_STEP_SECONDS.observe(seconds, kind=kind)
+        self.steps.append({"step": len(self.steps) + 1, "kind": kind, "latency_ms": round(seconds * 1000, 2), **details})
+
+
+class AgentLoop:
+    """
+    Drives an AgentRun against Ollama and the tool registry.
+
+    reply_chunks() yields the visible text of the final answer. In streaming mode the
+    model is called with streaming enabled and answer tokens are forwarded as they
+    arrive; otherwise the answer comes back as one chunk. Either way the run's trace
+    (per-step timings, stop reason) is complete once the generator is exhausted.
+    """
+
+    def __init__(self, registry, executor=None):
+        self.registry = registry
+        self.executor = executor or get_tool_executor()
+
+    def reply_chunks(self, agent_run, stream=False):
+        try:
+            while True:
+                if agent_run.pending_calls:
+                    new_calls = agent_run.take_new_calls()
+                    if new_calls:
+                        started = time.monotonic()
+                        with span("tools", calls=len(new_calls)):
+                            results = self.executor.execute(new_calls, self.registry, agent_run.customer_number)
+                        agent_run.record_tool_step(results, time.monotonic() - started)
+                    continue
+                if agent_run.reply_ready:
+                    if agent_run.stop_reason == "unknown_tool":
+                        yield agent_run.reply
+                    return
+
+                messages, tools_allowed, detecting = agent_run.next_prompt()
+                fields = agent_run.detection.request_fields(self.registry, agent_run.tool_selection.names) if detecting else None
+                sniffer = agent_run.new_sniffer(stream, tools_allowed, detecting)
+                started = time.monotonic()
+                with span("llm", step=agent_run.llm_steps + 1, tools_allowed=tools_allowed, stream=stream,
+                          detection=detecting) as llm_span:
+                    if stream:
+                        chunks = call_ollama_stream(messages, agent_run.llm_priority, fields, sniffer.record_done)
+                        try:
+                            for chunk in chunks:
+                                visible = sniffer.feed(chunk)
+                                if visible:
+                                    yield visible
+                                if sniffer.can_stop:
+                                    EARLY_STOPS.inc()
+                                    llm_span.set(early_stop=True)
+                                    break
+                        finally:
+                            chunks.close()  # closes the HTTP stream, which makes Ollama stop generating
+                    else:
+                        content = call_ollama(messages, agent_run.llm_priority, fields, sniffer.record_done)
+                        if content is None:
+                            raise AgentError(self._failure_message(agent_run))
+                        visible = sniffer.feed(content)
+                        if visible:
+                            yield visible
+                tail = sniffer.finish()
+                kept = agent_run.record_llm_step(sniffer, time.monotonic() - started, detecting)
+                if tail and kept:
+                    yield tail
+                if sniffer.kind == "calls" and agent_run.answered and agent_run.reply:
+                    # Looked like a call but did not parse: the text itself is the answer
+                    yield agent_run.reply
+        finally:
+            agent_run.finish()
+
+    async def reply_chunks_async(self, agent_run, stream=False):
+        """Async twin of reply_chunks, using the httpx client and coroutine tools."""
+        try:
+            while True:
+                if agent_run.pending_calls:
+                    new_calls = agent_run.take_new_calls()
+                    if new_calls:
+                        started = time.monotonic()
+                        with span("tools", calls=len(new_calls)):
+                            results = await self.executor.execute_async(new_calls, self.registry, agent_run.customer_number)
+                        agent_run.record_tool_step(results, time.monotonic() - started)
+                    continue
+                if agent_run.reply_ready:
+                    if agent_run.stop_reason == "unknown_tool":
+                        yield agent_run.reply
+                    return
+
+                messages, tools_allowed, detecting = agent_run.next_prompt()
+                fields = agent_run.detection.request_fields(self.registry, agent_run.tool_selection.names) if detecting else None
+                sniffer = agent_run.new_sniffer(stream, tools_allowed, detecting)
+                started = time.monotonic()
+                with span("llm", step=agent_run.llm_steps + 1, tools_allowed=tools_allowed, stream=stream,
+                          detection=detecting) as llm_span:
+                    if stream:
+                        chunks = call_ollama_stream_async(messages, agent_run.llm_priority, fields, sniffer.record_done)
+                        try:
+                            async for chunk in chunks:
+                                visible = sniffer.feed(chunk)
+                                if visible:
+                                    yield visible
+                                if sniffer.can_stop:
+                                    EARLY_STOPS.inc()
+                                    llm_span.set(early_stop=True)
+                                    break
+                        finally:
+                            await chunks.aclose()  # closes the HTTP stream, which makes Ollama stop generating
+                    else:
+                        content = await call_ollama_async(messages, agent_run.llm_priority, fields, sniffer.record_done)
+                        if content is None:
+                            raise AgentError(self._failure_message(agent_run))
+                        visible = sniffer.feed(content)
+                        if visible:
+                            yield visible
+                tail = sniffer.finish()
+                kept = agent_run.record_llm_step(sniffer, time.monotonic() - started, detecting)
+                if tail and kept:
+                    yield tail
+                if sniffer.kind == "calls" and agent_run.answered and agent_run.reply:
+                    # Looked like a call but did not parse: the text itself is the answer
+                    yield agent_run.reply
+        finally:
+            agent_run.finish()
+
+    @staticmethod
+    def _failure_message(agent_run):
+        if agent_run.tool_results:
+            return "Failed to get final response from language model after tool use"
+        return "Failed to get response from language model"
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+import psycopg2
+
+from utils import config
+from utils.db_connection import DataBaseConnection
+from utils.db_notifications import get_invoice_change_listener
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_REFRESHED = METRICS.counter("analytics_customers_refreshed_total", "Customers whose analytics summaries were recomputed in the background")
+ANALYTICS_REFRESH_SECONDS = METRICS.histogram("analytics_refresh_seconds", "Time spent draining the analytics dirty queue")
+
+
+class AnalyticsRefresher:
+    """
+    Background worker that keeps the invoice analytics summaries current.
+
+    Invoice writes mark their customer dirty (triggers in bakery_assist_data/invoice_analytics.sql).
+    This worker drains that queue in small batches, one transaction each, woken early by
+    'invoice_changes' notifications and otherwise every `interval` seconds. Tools still
+    refresh a dirty customer on read, so the worker only keeps that read-time work rare.
+    """
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = config.ANALYTICS_REFRESH_SECONDS if interval is None else interval
+        self.batch_size = config.ANALYTICS_REFRESH_BATCH if batch_size is None else batch_size
+        self.db_connection = DataBaseConnection()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def notify(self, _payload=None):
+        """Invoice change subscriber: asks the worker to drain the queue now."""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="analytics-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def drain(self):
+        """Refreshes dirty customers batch by batch until none are left; returns how many were refreshed."""
+        started = time.perf_counter()
+        total = 0
+        while not self._stop.is_set():
+            with self.db_connection.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT refresh_dirty_customer_analytics(%s)", (self.batch_size,))
+                refreshed = cur.fetchone()[0]
+                cur.close()
+            total += refreshed
+            ANALYTICS_REFRESHED.inc(refreshed)
+            # A short batch means the queue is empty or its rest is being refreshed by other sessions
+            if refreshed < self.batch_size:
+                break
+        ANALYTICS_REFRESH_SECONDS.observe(time.perf_counter() - started)
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.drain()
+            except psycopg2.Error as e:
+                logger.error("Analytics refresh failed: %s", e)
+
+
+# --- Shared Refresher ---
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def get_analytics_refresher():
+    """Returns the process-wide analytics refresher, started and subscribed to invoice change notifications."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = AnalyticsRefresher()
+            listener = get_invoice_change_listener()
+            listener.subscribe(_refresher.notify)
+            listener.start()
+            _refresher.start()
+        return _refresher
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+from utils import config
+from helpers.llm_dispatcher import FIRST_TURN, get_llm_dispatcher, request_key
+from helpers.ollama_helper import OLLAMA_REQUEST_ERRORS, OLLAMA_REQUEST_SECONDS, build_chat_payload, record_ollama_stats
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_CHAT_URL = f"{config.OLLAMA_BASE_URL.rstrip('/')}/api/chat"
+
+# --- Shared Async Client ---
+# One keep-alive client per event loop; httpx clients must not be shared across loops.
+_clients = {}
+
+
+def get_async_client():
+    """Returns the shared httpx.AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # httpx transports retry connection failures only, never a request that reached Ollama
+        transport = httpx.AsyncHTTPTransport(retries=config.OLLAMA_CONNECT_RETRIES)
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(config.OLLAMA_READ_TIMEOUT, connect=config.OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=config.OLLAMA_POOL_SIZE,
+                                max_keepalive_connections=config.OLLAMA_POOL_SIZE),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Closes the client belonging to the running event loop, if any."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def build_payload(prompt, stream, fields=None):
+    return build_chat_payload(config.OLLAMA_MODEL, config.OLLAMA_OPTIONS, prompt, stream, fields)
+
+
+async def call_ollama_async(prompt, priority=FIRST_TURN, fields=None, on_done=None):
+    """
+    Async variant of call_ollama: sends a prompt to /api/chat and returns the response content.
+
+    Raises:
+        LLMOverloadedError: No Ollama slot was free in time.
+    """
+    payload = build_payload(prompt, stream=False, fields=fields)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sending prompt to Ollama (%s, async): %s", payload["model"], json.dumps(payload["messages"]))
+
+    dispatcher = get_llm_dispatcher()
+    async def dispatched_call():
+        async with dispatcher.slot_async(priority):
+            return await _chat_content(payload)
+    if config.LLM_SINGLE_FLIGHT:
+        content, response_data = await dispatcher.single_flight.do_async(request_key(payload), dispatched_call)
+    else:
+        content, response_data = await dispatched_call()
+    if on_done and response_data is not None:
+        on_done(response_data)
+    return content
+
+
+async def _chat_content(payload):
+    """Returns (content, final response), or (None, None) on failure."""
+    started = time.monotonic()
+    try:
+        response = await get_async_client().post(OLLAMA_CHAT_URL, json=payload)
+        response.raise_for_status()
+        response_data = response.json()
+        record_ollama_stats(response_data)
+        content = response_data.get("message", {}).get("content", "").strip()
+        if not content:
+            logger.warning("Received empty content from Ollama.")
+        return content, response_data
+
+    except httpx.TimeoutException:
+        OLLAMA_REQUEST_ERRORS.inc(mode="chat")
+        logger.error("Ollama API request timed out.")
+        return None, None
+    except httpx.HTTPError as e:
+        OLLAMA_REQUEST_ERRORS.inc(mode="chat")
+        logger.error("Error calling Ollama API: %s", e)
+        return None, None
+    except json.JSONDecodeError as e:
+        OLLAMA_REQUEST_ERRORS.inc(mode="chat")
+        logger.error("Error decoding Ollama JSON response: %s", e)
+        return None, None
+    finally:
+        OLLAMA_REQUEST_SECONDS.observe(time.monotonic() - started, mode="chat")
+
+
+async def call_ollama_stream_async(prompt, priority=FIRST_TURN, fields=None, on_done=None):
+    """
+    Async variant of call_ollama_stream: yields content chunks from Ollama's NDJSON stream.
+
+    Raises:
+        httpx.HTTPError: If the request fails or the stream breaks.
+        LLMOverloadedError: No Ollama slot was free in time.
+    """
+    payload = build_payload(prompt, stream=True, fields=fields)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Streaming prompt to Ollama (%s, async): %s", payload["model"], json.dumps(payload["messages"]))
+
+    async with get_llm_dispatcher().slot_async(priority):
+        contents = _stream_content(payload, on_done)
+        try:
+            async for content in contents:
+                yield content
+        finally:
+            await contents.aclose()  # closed right away, not at garbage collection, when the caller stops early
+
+
+async def _stream_content(payload, on_done=None):
+    started = time.monotonic()
+    try:
+        async with get_async_client().stream("POST", OLLAMA_CHAT_URL, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Error decoding Ollama stream chunk: %s", e)
+                    continue
+                if chunk.get("error"):
+                    raise httpx.HTTPError(chunk["error"])
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    record_ollama_stats(chunk)
+                    if on_done:
+                        on_done(chunk)
+                    break
+    except httpx.HTTPError:
+        OLLAMA_REQUEST_ERRORS.inc(mode="stream")
+        raise
+    finally:
+        OLLAMA_REQUEST_SECONDS.observe(time.monotonic() - started, mode="stream")
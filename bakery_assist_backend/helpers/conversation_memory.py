@@ -0,0 +1,380 @@
+"""
+Per-session conversation memory for /api/chat.
+
+Each chat session keeps its most recent turns verbatim and folds older ones into a
+rolling summary, so follow-ups ("and the one before that?") have context while the
+history sent to the model stays under BAKERY_CONVERSATION_MAX_TOKENS however long the
+chat runs. The summary is extractive: the question, the opening of the answer and any
+invoice numbers either mentioned, which is what follow-ups tend to refer back to. It
+costs no extra model call.
+
+Sessions live in an in-memory LRU bounded by session count and bytes. Sessions pushed
+out of it are spilled to SQLite (or Postgres) and loaded back on their next message;
+sessions idle longer than the TTL are dropped from both tiers.
+"""
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from templates.prompt import CONVERSATION_SUMMARY_TEMPLATE
+from utils import config
+from utils.metrics import METRICS
+from utils.token_estimator import estimate_text_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = METRICS.gauge("conversation_sessions", "Conversation sessions held in memory")
+SESSION_MEMORY_BYTES = METRICS.gauge("conversation_memory_bytes", "Approximate bytes held by in-memory conversation sessions")
+SESSION_BYTES = METRICS.histogram("conversation_session_bytes", "Approximate size of one session after a turn",
+                                  buckets=(1024, 2048, 4096, 8192, 16384, 32768, 65536))
+HISTORY_TOKENS = METRICS.histogram("conversation_history_tokens", "Estimated tokens of history sent with a message",
+                                   buckets=(0, 100, 200, 400, 800, 1600, 3200))
+SESSION_LOADS = METRICS.counter("conversation_session_loads_total", "Session lookups by source (memory, spill, new)")
+SESSION_EVICTIONS = METRICS.counter("conversation_session_evictions_total", "Sessions leaving memory, by reason (spilled, expired)")
+
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{8,64}")
+_INVOICE_NUMBER_PATTERN = re.compile(r"\bINV\d+\b", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+SUMMARY_QUESTION_TOKENS = 40
+SUMMARY_ANSWER_TOKENS = 60
+MAX_MENTIONED_IDS = 10
+SWEEP_INTERVAL_SECONDS = 60.0
+
+# Rough CPython costs of the containers around the strings (object, slots, list/dict entries)
+TURN_OVERHEAD_BYTES = 120
+SESSION_OVERHEAD_BYTES = 600
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def summarize_turn(user_message, reply):
+    """One summary line for a turn: the question, the first sentence of the answer, and invoice numbers mentioned."""
+    question = truncate_to_tokens(" ".join(user_message.split()), SUMMARY_QUESTION_TOKENS, marker="...")
+    answer = _SENTENCE_END.split(" ".join(reply.split()), maxsplit=1)[0]
+    answer = truncate_to_tokens(answer, SUMMARY_ANSWER_TOKENS, marker="...")
+    line = f'- Customer: "{question}" You: "{answer}"'
+    mentioned = list(dict.fromkeys(match.upper() for match in _INVOICE_NUMBER_PATTERN.findall(user_message + " " + reply)))
+    if mentioned:
+        line += " (invoices mentioned: " + ", ".join(mentioned[:MAX_MENTIONED_IDS]) + ")"
+    return line
+
+
+class ConversationTurn:
+    __slots__ = ("user", "assistant", "tokens")
+
+    def __init__(self, user, assistant, tokens=None):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = estimate_text_tokens(user) + estimate_text_tokens(assistant) if tokens is None else tokens
+
+
+class Conversation:
+    """
+    History of one chat session: a window of verbatim turns plus a rolling summary of
+    the turns that fell out of it. Belongs to one customer.
+    """
+
+    def __init__(self, session_id, customer_number, turns=None, summary_lines=None, last_active=None):
+        self.session_id = session_id
+        self.customer_number = str(customer_number)
+        self.turns = list(turns or [])
+        self.summary_lines = list(summary_lines or [])
+        self.last_active = time.time() if last_active is None else last_active
+
+    @property
+    def empty(self):
+        return not self.turns and not self.summary_lines
+
+    @property
+    def summary(self):
+        return "\n".join(self.summary_lines)
+
+    def history_tokens(self):
+        return sum(turn.tokens for turn in self.turns) + estimate_text_tokens(self.summary)
+
+    def history_messages(self):
+        """Chat messages to place between the system prompt and the current message."""
+        messages = []
+        if self.summary_lines:
+            messages.append({"role": "user", "content": CONVERSATION_SUMMARY_TEMPLATE.format(summary=self.summary)})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.assistant})
+        return messages
+
+    def add_turn(self, user_message, reply, max_turns, max_tokens, summary_max_tokens):
+        """
+        Appends a turn, then folds the oldest turns into the summary until at most
+        `max_turns` remain verbatim and the whole history fits `max_tokens`.
+        """
+        # A single oversized reply must not push everything else out of the window
+        reply = truncate_to_tokens(reply, max(1, max_tokens // 2))
+        self.turns.append(ConversationTurn(user_message, reply))
+        self.last_active = time.time()
+
+        while self.turns and (len(self.turns) > max_turns or self.history_tokens() > max_tokens):
+            oldest = self.turns.pop(0)
+            self.summary_lines.append(summarize_turn(oldest.user, oldest.assistant))
+            # Oldest summary lines go first once the summary itself is over its budget
+            while len(self.summary_lines) > 1 and estimate_text_tokens(self.summary) > summary_max_tokens:
+                self.summary_lines.pop(0)
+
+    def size_bytes(self):
+        """Approximate memory held by this session (strings plus container overhead)."""
+        size = SESSION_OVERHEAD_BYTES + sys.getsizeof(self.session_id) + sys.getsizeof(self.customer_number)
+        size += sum(TURN_OVERHEAD_BYTES + sys.getsizeof(turn.user) + sys.getsizeof(turn.assistant) for turn in self.turns)
+        size += sum(sys.getsizeof(line) + 8 for line in self.summary_lines)
+        return size
+
+    # --- Serialization (spill tier) ---
+
+    def to_json(self):
+        return json.dumps({
+            "turns": [[turn.user, turn.assistant, turn.tokens] for turn in self.turns],
+            "summary": self.summary_lines,
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, session_id, customer_number, data, last_active):
+        payload = json.loads(data)
+        turns = [ConversationTurn(user, assistant, tokens) for user, assistant, tokens in payload.get("turns", [])]
+        return cls(session_id, customer_number, turns, payload.get("summary"), last_active)
+
+
+# --- Spill Tiers ---
+
+class SQLiteConversationSpill:
+    """Spill tier in a local SQLite file; sessions are removed from it when loaded back into memory."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " session_id TEXT PRIMARY KEY, customer_number TEXT NOT NULL,"
+            " last_active REAL NOT NULL, data TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_active ON chat_sessions (last_active)")
+        self._lock = threading.Lock()
+
+    def save(self, conversation):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, customer_number, last_active, data) VALUES (?, ?, ?, ?)",
+                (conversation.session_id, conversation.customer_number, conversation.last_active, conversation.to_json()))
+
+    def take(self, session_id):
+        """Removes and returns the spilled session, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT customer_number, last_active, data FROM chat_sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        customer_number, last_active, data = row
+        return Conversation.from_json(session_id, customer_number, data, last_active)
+
+    def purge(self, idle_before):
+        with self._lock:
+            return self._conn.execute("DELETE FROM chat_sessions WHERE last_active < ?", (idle_before,)).rowcount
+
+
+class PostgresConversationSpill:
+    """Spill tier in the chat_sessions table (bakery_assist_data/chat_sessions.sql), shared by all workers."""
+
+    def save(self, conversation):
+        from utils.db_connection import DataBaseConnection
+        with DataBaseConnection().connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO chat_sessions (session_id, customer_number, last_active, data)"
+                " VALUES (%s, %s, to_timestamp(%s), %s)"
+                " ON CONFLICT (session_id) DO UPDATE SET customer_number = EXCLUDED.customer_number,"
+                " last_active = EXCLUDED.last_active, data = EXCLUDED.data",
+                (conversation.session_id, conversation.customer_number, conversation.last_active, conversation.to_json()))
+
+    def take(self, session_id):
+        from utils.db_connection import DataBaseConnection
+        with DataBaseConnection().connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_sessions WHERE session_id = %s"
+                        " RETURNING customer_number, extract(epoch FROM last_active), data", (session_id,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        customer_number, last_active, data = row
+        return Conversation.from_json(session_id, customer_number, data, float(last_active))
+
+    def purge(self, idle_before):
+        from utils.db_connection import DataBaseConnection
+        with DataBaseConnection().connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_sessions WHERE last_active < to_timestamp(%s)", (idle_before,))
+            return cur.rowcount
+
+
+def create_spill(kind=None, path=None):
+    """Spill tier named by BAKERY_CONVERSATION_SPILL ("sqlite", "postgres" or "none")."""
+    kind = (config.CONVERSATION_SPILL if kind is None else kind).lower()
+    if kind == "sqlite":
+        return SQLiteConversationSpill(config.CONVERSATION_SPILL_PATH if path is None else path)
+    if kind == "postgres":
+        return PostgresConversationSpill()
+    if kind in ("", "none"):
+        return None
+    raise ValueError(f"Unknown conversation spill tier: {kind!r}")
+
+
+# --- Store ---
+
+class ConversationStore:
+    """
+    Sessions by id: an in-memory LRU (at most `max_sessions` sessions and `max_bytes`)
+    in front of an optional spill tier. Least recently used sessions are spilled when
+    memory is full; sessions idle for `ttl` seconds are dropped from both tiers.
+    """
+
+    def __init__(self, ttl=None, max_sessions=None, max_bytes=None, spill=None):
+        self.ttl = config.CONVERSATION_TTL_SECONDS if ttl is None else ttl
+        self.max_sessions = config.CONVERSATION_MAX_SESSIONS if max_sessions is None else max_sessions
+        self.max_bytes = config.CONVERSATION_MAX_BYTES if max_bytes is None else max_bytes
+        self.spill = spill
+        self._sessions = OrderedDict()  # session_id -> Conversation, least recently used first
+        self._sizes = {}
+        self._bytes = 0
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL_SECONDS
+        self._lock = threading.Lock()
+
+    def get(self, session_id, customer_number):
+        """
+        The session's conversation, or a new empty one when the session is unknown or
+        expired. A session of another customer is never reused: the caller gets a fresh
+        session under a new id instead.
+        """
+        customer_number = str(customer_number)
+        self._maybe_sweep()
+        idle_before = time.time() - self.ttl
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is not None:
+                self._sessions.move_to_end(session_id)
+        source = "memory"
+        if conversation is None and self.spill is not None:
+            conversation = self._spill_call("take", session_id)
+            source = "spill"
+            if conversation is not None:
+                self._admit(conversation)  # back in memory, so a failed request does not lose it
+        if conversation is not None and conversation.customer_number != customer_number:
+            conversation, session_id = None, new_session_id()
+        elif conversation is not None and conversation.last_active < idle_before:
+            conversation = None
+        if conversation is None:
+            conversation = Conversation(session_id, customer_number)
+            source = "new"
+        SESSION_LOADS.inc(source=source)
+        HISTORY_TOKENS.observe(conversation.history_tokens())
+        return conversation
+
+    def record(self, conversation, user_message, reply):
+        """Adds a finished turn to the conversation and (re)admits it to the in-memory tier."""
+        with self._lock:
+            conversation.add_turn(user_message, reply, config.CONVERSATION_MAX_TURNS,
+                                  config.CONVERSATION_MAX_TOKENS, config.CONVERSATION_SUMMARY_MAX_TOKENS)
+        size = self._admit(conversation)
+        SESSION_BYTES.observe(size)
+
+    def _admit(self, conversation):
+        """Puts the conversation at the most recently used end, spilling the least recently used over the limits."""
+        spilled = []
+        with self._lock:
+            size = conversation.size_bytes()
+            self._bytes += size - self._sizes.get(conversation.session_id, 0)
+            self._sizes[conversation.session_id] = size
+            self._sessions[conversation.session_id] = conversation
+            self._sessions.move_to_end(conversation.session_id)
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                spilled.append(self._remove(next(iter(self._sessions)), "spilled"))
+            self._update_gauges()
+        for evicted in spilled:
+            if self.spill is not None:
+                self._spill_call("save", evicted)
+        return size
+
+    def sweep(self):
+        """Drops sessions idle longer than the TTL from memory and from the spill tier."""
+        idle_before = time.time() - self.ttl
+        with self._lock:
+            expired = [sid for sid, conversation in self._sessions.items() if conversation.last_active < idle_before]
+            for session_id in expired:
+                self._remove(session_id, "expired")
+            self._update_gauges()
+        purged = self._spill_call("purge", idle_before) if self.spill is not None else 0
+        if expired or purged:
+            logger.info("Conversation memory: dropped %s idle session(s) from memory, %s from spill", len(expired), purged or 0)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + SWEEP_INTERVAL_SECONDS
+        self.sweep()
+
+    def _spill_call(self, method, *args):
+        # The spill tier is an optimisation; failing to reach it must not fail the chat
+        try:
+            return getattr(self.spill, method)(*args)
+        except Exception as e:
+            logger.error("Conversation spill %s failed: %s", method, e)
+            return None
+
+    # --- Internals (call with the lock held) ---
+
+    def _remove(self, session_id, reason):
+        conversation = self._sessions.pop(session_id)
+        self._bytes -= self._sizes.pop(session_id, 0)
+        SESSION_EVICTIONS.inc(reason=reason)
+        return conversation
+
+    def _update_gauges(self):
+        SESSIONS.set(len(self._sessions))
+        SESSION_MEMORY_BYTES.set(self._bytes)
+
+    def stats(self):
+        with self._lock:
+            sessions = len(self._sessions)
+            return {
+                "sessions": sessions,
+                "bytes": self._bytes,
+                "bytes_per_session": round(self._bytes / sessions) if sessions else 0,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# --- Shared Store ---
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+def get_conversation_store():
+    """Returns the process-wide conversation store with the spill tier from BAKERY_CONVERSATION_SPILL."""
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            try:
+                spill = create_spill()
+            except Exception as e:  # unwritable path, bad setting: keep the memory tier only
+                logger.warning("Conversation spill tier not available, keeping sessions in memory only: %s", e)
+                spill = None
+            _conversation_store = ConversationStore(spill=spill)
+        return _conversation_store
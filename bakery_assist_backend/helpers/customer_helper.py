@@ -1,42 +1,144 @@
+import asyncpg
+import logging
 import psycopg2
+from utils import config
+from utils.async_db_connection import AsyncDataBaseConnection
 from utils.db_connection import DataBaseConnection
 
+logger = logging.getLogger(__name__)
+
+# Columns clients may request via ?fields=; customer_pk is always returned (it is the page cursor)
+CUSTOMER_FIELDS = (
+    "customer_pk", "customer_number", "customer_name", "customer_group", "address_street",
+    "address_city", "address_state", "address_zip", "address_country", "email", "phone_number",
+)
+DEFAULT_CUSTOMER_FIELDS = ("customer_pk", "customer_name", "customer_group")
+
+
+class CustomerPageQuery:
+    """
+    Validated parameters of one customer list page.
+
+    Pages are keyset-paginated on customer_pk: `after` is the last customer_pk the
+    client has seen, so each page is an index range scan no matter how deep it is.
+    """
+
+    def __init__(self, after=0, limit=None, search=None, group=None, fields=None):
+        self.after = after
+        self.limit = config.CUSTOMERS_PAGE_DEFAULT_LIMIT if limit is None else limit
+        self.search = search or None
+        self.group = group or None
+        self.fields = tuple(fields) if fields else DEFAULT_CUSTOMER_FIELDS
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Builds a query from request arguments (after, limit, q, group, fields).
+
+        Raises:
+            ValueError: If an argument is malformed; the message is safe to return to the client.
+        """
+        try:
+            after = int(args.get("after", 0))
+            limit = int(args.get("limit", config.CUSTOMERS_PAGE_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValueError("'after' and 'limit' must be integers")
+        if after < 0 or limit < 1:
+            raise ValueError("'after' must be >= 0 and 'limit' >= 1")
+        limit = min(limit, config.CUSTOMERS_PAGE_MAX_LIMIT)
+
+        fields = None
+        if args.get("fields"):
+            requested = [f.strip() for f in args["fields"].split(",") if f.strip()]
+            unknown = [f for f in requested if f not in CUSTOMER_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+            fields = ["customer_pk"] + [f for f in dict.fromkeys(requested) if f != "customer_pk"]
+
+        search = (args.get("q") or "").strip()
+        return cls(after, limit, search, (args.get("group") or "").strip(), fields)
+
+    def sql(self, placeholder):
+        """
+        Returns (query, params) for one page, with `placeholder(n)` rendering the n-th
+        parameter marker (%s for psycopg2, $n for asyncpg). One extra row is fetched
+        to tell whether another page follows.
+        """
+        conditions, params = ["customer_pk > " + placeholder(1)], [self.after]
+        if self.search:
+            # Substring match, served by the trigram index in bakery_assist_data/customer_list_indexes.sql
+            escaped = self.search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+            conditions.append("customer_name ILIKE " + placeholder(len(params)))
+        if self.group:
+            params.append(self.group)
+            conditions.append("customer_group = " + placeholder(len(params)))
+        params.append(self.limit + 1)
+        query = (
+            f"SELECT {', '.join(self.fields)}, updated_at FROM customers "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY customer_pk LIMIT {placeholder(len(params))}"
+        )
+        return query, params
+
+    def page(self, rows):
+        """Turns fetched rows (dicts incl. updated_at) into the response payload and the page's last change time."""
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        last_modified = max((row.pop("updated_at") for row in rows if row.get("updated_at")), default=None)
+        for row in rows:
+            row.pop("updated_at", None)
+        return {
+            "customers": rows,
+            "next_after": rows[-1]["customer_pk"] if has_more else None,
+            "limit": self.limit,
+        }, last_modified
+
+
 class CustomerHelper:
     def __init__(self):
         self.db_connection = DataBaseConnection()
+        self.async_db_connection = AsyncDataBaseConnection()
 
-    def get_all_customers(self):
+    def get_customers_page(self, page_query):
         """
-        Fetches all customers from the database.
+        Fetches one keyset-paginated page of customers.
+
+        Args:
+            page_query (CustomerPageQuery): Cursor, page size, filters and projected fields.
 
         Returns:
-            list: A list of dictionaries, where each dictionary represents a customer.
+            tuple: (payload dict with 'customers' and 'next_after', last-modified datetime or None).
             None: If a database error occurs.
         """
-        conn = None
+        query, params = page_query.sql(lambda n: "%s")
         try:
-            conn = self.db_connection.get_db_connection()
-            if conn is None:
-                return None  # Indicate connection failure
-
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT customer_pk, customer_name, customer_group
-                FROM customers
-                ORDER BY customer_pk;
-            """)
-            customers = cur.fetchall()
-            colnames = [desc[0] for desc in cur.description]
-            customers_list = [dict(zip(colnames, customer_tuple)) for customer_tuple in customers]
-            cur.close()
-            return customers_list
+            with self.db_connection.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(query, params)
+                colnames = [desc[0] for desc in cur.description]
+                rows = [dict(zip(colnames, row)) for row in cur.fetchall()]
+                cur.close()
+                return page_query.page(rows)
 
         except psycopg2.Error as e:
-            print(f"Error fetching customers: {e}")
+            logger.error("Error fetching customers: %s", e)
+            return None  # Indicate database error
+        except Exception as e:
+            logger.error("An unexpected error occurred: %s", e)
+            return None
+
+    async def get_customers_page_async(self, page_query):
+        """Async variant of get_customers_page, using the asyncpg pool."""
+        query, params = page_query.sql(lambda n: f"${n}")
+        try:
+            async with self.async_db_connection.connection() as conn:
+                rows = await conn.fetch(query, *params)
+                return page_query.page([dict(row) for row in rows])
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Error fetching customers: %s", e)
             return None  # Indicate database error
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            logger.error("An unexpected error occurred: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
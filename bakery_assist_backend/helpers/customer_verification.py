@@ -1,13 +1,71 @@
+import asyncpg
+import logging
 import psycopg2
+from helpers.customer_index import CUSTOMER_INDEX_FALLBACKS, get_customer_index
+from utils import config
+from utils.async_db_connection import AsyncDataBaseConnection
 from utils.db_connection import DataBaseConnection
 
+logger = logging.getLogger(__name__)
+
+
+def canonical_customer_number(customer_number):
+    """
+    The canonical text of a customer number ("007", " 7" and "7 " all become "7"), as
+    used by the invoice_changes notifications that invalidate the caches.
+
+    Returns:
+        str | None: The canonical number, or None if it is not an integer.
+    """
+    try:
+        return str(int(customer_number))
+    except (TypeError, ValueError):
+        return None
+
+
 class CustomerVerificationHelper:
     def __init__(self):
         self.db_connection = DataBaseConnection()
+        self.async_db_connection = AsyncDataBaseConnection()
+
+    # --- In-memory Index ---
+    def _check_index(self, customer_number):
+        """
+        Answers from the in-memory customer index when it can.
+
+        Returns:
+            bool | None: True/False when the index decides, None when the database must be asked
+            (index disabled or still loading, or an unknown id with BAKERY_CUSTOMER_INDEX_VERIFY_MISSES on).
+        """
+        if not config.CUSTOMER_INDEX_ENABLED:
+            return None
+        try:
+            customer_pk = int(customer_number)
+        except (TypeError, ValueError):
+            return False
+        customer_index = get_customer_index()
+        if not customer_index.ready:
+            CUSTOMER_INDEX_FALLBACKS.inc(reason="not_ready")
+            return None
+        if customer_index.contains(customer_pk):
+            return True
+        if config.CUSTOMER_INDEX_VERIFY_MISSES:
+            # A customer created moments ago may not have reached the index yet
+            CUSTOMER_INDEX_FALLBACKS.inc(reason="miss")
+            return None
+        return False
+
+    def _remember(self, customer_number):
+        """Adds a customer the database confirmed, so the next lookup stays in memory."""
+        if config.CUSTOMER_INDEX_ENABLED:
+            customer_index = get_customer_index()
+            if customer_index.ready:
+                customer_index.add(int(customer_number))
 
     def is_valid_customer(self, customer_number):
         """
-        Checks if a customer number exists in the database.
+        Checks if a customer number exists, answering from the in-memory
+        customer index when it is loaded and from the database otherwise.
 
         Args:
             customer_number (str): The customer number to verify.
@@ -15,24 +73,56 @@ class CustomerVerificationHelper:
         Returns:
             bool: True if the customer number is valid, False otherwise.
         """
-        conn = None
+        known = self._check_index(customer_number)
+        if known is not None:
+            return known
+
         try:
-            conn = self.db_connection.get_db_connection()
-            if conn is None:
-                return False  # Indicate connection failure
-
-            cur = conn.cursor()
-            cur.execute("SELECT 1 FROM customers WHERE customer_pk = %s", (customer_number,))
-            exists = cur.fetchone() is not None
-            cur.close()
+            with self.db_connection.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT 1 FROM customers WHERE customer_pk = %s", (customer_number,))
+                exists = cur.fetchone() is not None
+                cur.close()
+            if exists:
+                self._remember(customer_number)
             return exists
 
         except psycopg2.Error as e:
-            print(f"Error verifying customer: {e}")
+            logger.error("Error verifying customer: %s", e)
+            return False  # Indicate database error
+        except Exception as e:
+            logger.error("An unexpected error occurred: %s", e)
+            return False
+
+    async def is_valid_customer_async(self, customer_number):
+        """
+        Async variant of is_valid_customer, using the asyncpg pool.
+
+        Args:
+            customer_number (str): The customer number to verify.
+
+        Returns:
+            bool: True if the customer number is valid, False otherwise.
+        """
+        known = self._check_index(customer_number)
+        if known is not None:
+            return known
+
+        try:
+            customer_pk = int(customer_number)  # asyncpg does not cast text parameters implicitly
+        except (TypeError, ValueError):
+            return False
+
+        try:
+            async with self.async_db_connection.connection() as conn:
+                row = await conn.fetchrow("SELECT 1 FROM customers WHERE customer_pk = $1", customer_pk)
+            if row is not None:
+                self._remember(customer_pk)
+            return row is not None
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Error verifying customer: %s", e)
             return False  # Indicate database error
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            logger.error("An unexpected error occurred: %s", e)
             return False
-        finally:
-            if conn:
-                conn.close()
@@ -0,0 +1,260 @@
+"""
+Intent router that answers "which tool, with which arguments?" without an LLM call.
+
+Obvious requests (e.g. "show my last 3 invoices") are matched by keyword/regex rules,
+optionally backed by a small TF-IDF + logistic regression model trained from logged
+traffic. Anything below the confidence threshold falls back to the first LLM call.
+
+Train a model from the JSONL written to BAKERY_INTENT_LOG_PATH with:
+    python -m helpers.intent_router train intent_log.jsonl intent_model.pkl
+"""
+import json
+import logging
+import pickle
+import re
+import sys
+import threading
+import time
+
+from utils import config
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+ROUTER_DECISIONS = METRICS.counter("intent_router_decisions_total", "Routing decisions by source (rules, model) and outcome (routed, fallback)")
+ROUTER_LATENCY_SECONDS = METRICS.histogram("intent_router_latency_seconds", "Time spent deciding a route",
+                                           buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+ROUTER_SECONDS_SAVED = METRICS.counter("intent_router_llm_seconds_saved_total", "Estimated first-call LLM seconds skipped by routing")
+
+NO_TOOL = "none"
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+_COUNT = r"(\d{1,3}|" + "|".join(_NUMBER_WORDS) + r")"
+
+
+class RouteDecision:
+    """A tool call chosen by the router instead of the LLM."""
+    __slots__ = ("tool_name", "arguments", "confidence", "source")
+
+    def __init__(self, tool_name, arguments, confidence, source):
+        self.tool_name = tool_name
+        self.arguments = arguments
+        self.confidence = confidence
+        self.source = source
+
+    def as_function_call(self):
+        """The call the model would have emitted: a dict that passes reply_parser.is_valid_call."""
+        return {"name": self.tool_name, "arguments": dict(self.arguments)}
+
+
+# --- Argument Extractors ---
+
+def _to_int(token):
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+def extract_invoice_limit(message):
+    """Pulls an invoice count out of phrases like 'last 3 invoices', 'my two latest bills' or 'latest invoice'."""
+    text = message.lower()
+    match = (re.search(rf"\b(?:last|latest|recent|past|previous|top|first)\s+{_COUNT}\b", text)
+             or re.search(rf"\b{_COUNT}\s+(?:\w+\s+){{0,2}}(?:invoices?|bills?)\b", text))
+    if match:
+        return {"limit": max(1, min(_to_int(match.group(1)), 50))}
+    if re.search(r"\b(?:last|latest|most recent|newest)\s+(?:invoice|bill)\b(?!s)", text):
+        return {"limit": 1}
+    return {}
+
+
+class IntentRule:
+    """
+    Regex rule for one tool. A message must match `pattern`; matching any of the
+    `boost_patterns` raises confidence, matching a `veto_pattern` (e.g. how-to questions
+    about a tool's subject) drops it below any sensible threshold.
+    """
+
+    def __init__(self, tool_name, pattern, base_confidence, boost_patterns=(), veto_pattern=None,
+                 argument_extractor=None):
+        self.tool_name = tool_name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.base_confidence = base_confidence
+        self.boost_patterns = [re.compile(p, re.IGNORECASE) for p in boost_patterns]
+        self.veto_pattern = re.compile(veto_pattern, re.IGNORECASE) if veto_pattern else None
+        self.argument_extractor = argument_extractor
+
+    def score(self, message):
+        if not self.pattern.search(message):
+            return 0.0
+        if self.veto_pattern and self.veto_pattern.search(message):
+            return 0.2
+        boosts = sum(1 for p in self.boost_patterns if p.search(message))
+        return min(0.99, self.base_confidence + 0.15 * boosts)
+
+
+# Questions about invoices that other tools answer: balances, spend, top products and
+# frequency (analytics), or the line items of an invoice (drill-down). Left to the LLM.
+OTHER_INVOICE_TOOLS_PATTERN = (r"\b(balance|owed?|outstanding|overdue|unpaid|spen[dt]|spending|top|most(?! recent)|"
+                               r"products?|items?|lines?|how often|frequency|inv-?\d+)\b")
+
+DEFAULT_RULES = [
+    IntentRule(
+        "get_customer_invoices",
+        pattern=r"\b(invoices?|bills?|billing|statements?)\b",
+        base_confidence=0.6,
+        boost_patterns=(
+            r"\b(show|list|get|see|view|display|fetch|give|what('?s| is| are))\b",
+            r"\b(my|our|last|latest|recent|newest|previous|past)\b",
+        ),
+        veto_pattern=r"\b(how (do|can|to)|why|pay|dispute|cancel|change|update|email|send|wrong|error)\b|"
+                     + OTHER_INVOICE_TOOLS_PATTERN,
+        argument_extractor=extract_invoice_limit,
+    ),
+]
+
+
+class ModelIntentClassifier:
+    """Wraps a pickled scikit-learn pipeline (TF-IDF + logistic regression) predicting a tool name or 'none'."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+    def predict(self, message):
+        probabilities = self.pipeline.predict_proba([message])[0]
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.pipeline.classes_[best], float(probabilities[best])
+
+
+class IntentRouter:
+    """
+    Decides tool calls for obvious intents ahead of the first LLM call.
+
+    route() returns a RouteDecision when the rules (or the optional model) are at least
+    `threshold` confident, otherwise None so the caller falls back to the LLM.
+    """
+
+    def __init__(self, rules=None, classifier=None, threshold=None, log_path=None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.classifier = classifier
+        self.threshold = config.INTENT_ROUTER_THRESHOLD if threshold is None else threshold
+        self.log_path = config.INTENT_LOG_PATH if log_path is None else log_path
+        self._llm_latency_ewma = None
+        self._lock = threading.Lock()
+
+    def route(self, message, known_tools=None):
+        started = time.perf_counter()
+        decision = self._decide(message, known_tools)
+        ROUTER_LATENCY_SECONDS.observe(time.perf_counter() - started)
+
+        if decision is None:
+            ROUTER_DECISIONS.inc(source="none", outcome="fallback")
+            return None
+        ROUTER_DECISIONS.inc(source=decision.source, outcome="routed")
+        with self._lock:
+            if self._llm_latency_ewma is not None:
+                ROUTER_SECONDS_SAVED.inc(self._llm_latency_ewma)
+        return decision
+
+    def _decide(self, message, known_tools):
+        best_rule, best_score = None, 0.0
+        for rule in self.rules:
+            if known_tools is not None and rule.tool_name not in known_tools:
+                continue
+            score = rule.score(message)
+            if score > best_score:
+                best_rule, best_score = rule, score
+
+        if best_rule is not None and best_score >= self.threshold:
+            arguments = best_rule.argument_extractor(message) if best_rule.argument_extractor else {}
+            return RouteDecision(best_rule.tool_name, arguments, best_score, "rules")
+
+        if self.classifier is not None:
+            try:
+                tool_name, confidence = self.classifier.predict(message)
+            except Exception as e:
+                logger.error("Intent model prediction failed: %s", e)
+                return None
+            if tool_name != NO_TOOL and confidence >= self.threshold and (known_tools is None or tool_name in known_tools):
+                rule = next((r for r in self.rules if r.tool_name == tool_name), None)
+                arguments = rule.argument_extractor(message) if rule and rule.argument_extractor else {}
+                return RouteDecision(tool_name, arguments, confidence, "model")
+        return None
+
+    def record_llm_decision(self, message, function_call_data, llm_seconds):
+        """
+        Called after a fallback: tracks first-call latency (used to estimate seconds saved)
+        and logs the LLM's choice as a training example when BAKERY_INTENT_LOG_PATH is set.
+        """
+        with self._lock:
+            if self._llm_latency_ewma is None:
+                self._llm_latency_ewma = llm_seconds
+            else:
+                self._llm_latency_ewma = 0.9 * self._llm_latency_ewma + 0.1 * llm_seconds
+
+        if not self.log_path:
+            return
+        label = function_call_data.get("name", NO_TOOL) if function_call_data else NO_TOOL
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"message": message, "tool": label}) + "\n")
+        except OSError as e:
+            logger.warning("Could not write intent log: %s", e)
+
+
+# --- Shared Router ---
+_router = None
+_router_lock = threading.Lock()
+
+def get_intent_router():
+    """Returns the process-wide router, loading the optional model from BAKERY_INTENT_MODEL_PATH."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            classifier = None
+            if config.INTENT_MODEL_PATH:
+                try:
+                    classifier = ModelIntentClassifier.load(config.INTENT_MODEL_PATH)
+                except Exception as e:  # missing file, or scikit-learn not installed
+                    logger.warning("Intent model not loaded, using rules only: %s", e)
+            _router = IntentRouter(classifier=classifier)
+        return _router
+
+
+# --- Offline Training ---
+
+def train_model(log_path, model_path):
+    """Trains a TF-IDF + logistic regression pipeline from a JSONL intent log (needs scikit-learn)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    messages, labels = [], []
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                messages.append(example["message"])
+                labels.append(example["tool"])
+    if len(set(labels)) < 2:
+        raise ValueError("Need examples of at least two intents (e.g. a tool and 'none') to train")
+
+    pipeline = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1),
+        LogisticRegression(max_iter=1000, class_weight="balanced"),
+    )
+    pipeline.fit(messages, labels)
+    with open(model_path, "wb") as f:
+        pickle.dump(pipeline, f)
+    print(f"Trained intent model on {len(messages)} examples ({len(set(labels))} intents) -> {model_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "train":
+        print("Usage: python -m helpers.intent_router train <intent_log.jsonl> <model.pkl>")
+        sys.exit(1)
+    train_model(sys.argv[2], sys.argv[3])
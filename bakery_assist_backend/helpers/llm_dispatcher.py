@@ -0,0 +1,275 @@
+"""
+Admission control for Ollama chat calls.
+
+A single local Ollama generates at most OLLAMA_NUM_PARALLEL replies at once and queues the
+rest internally, where every queued call runs into the 90 s read timeout together. The
+dispatcher keeps that queue on our side instead:
+  - at most BAKERY_LLM_MAX_CONCURRENCY calls are sent to Ollama at once (sync threads
+    and asyncio tasks share the same slots);
+  - waiting calls are served by priority, then arrival: FOLLOW_UP calls (a chat that
+    already ran its tools and only needs its answer) go ahead of FIRST_TURN calls, so
+    started chats finish before new ones begin;
+  - a call that cannot get a slot within BAKERY_LLM_QUEUE_TIMEOUT seconds, or finds
+    BAKERY_LLM_MAX_QUEUE calls already waiting, fails at once with LLMOverloadedError,
+    which the apps answer with 503 and a Retry-After header;
+  - identical non-streaming prompts in flight at the same time share one Ollama call
+    (single flight), e.g. the same question sent twice before the response cache has it.
+Embedding calls are not gated: they are short and run on a different model.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from utils import config
+from utils.metrics import METRICS
+from utils.tracing import annotate, span
+
+FOLLOW_UP = 0  # continues a chat after its tool results
+FIRST_TURN = 1  # the first model call for a new message
+PRIORITY_NAMES = {FOLLOW_UP: "follow_up", FIRST_TURN: "first_turn"}
+
+BUSY_REPLY = "The assistant is busy right now. Please try again in a few seconds."
+
+QUEUE_DEPTH = METRICS.gauge("llm_queue_depth", "Ollama calls waiting for a slot")
+IN_FLIGHT = METRICS.gauge("llm_in_flight", "Ollama calls holding a slot")
+QUEUE_WAIT_SECONDS = METRICS.histogram("llm_queue_wait_seconds", "Time Ollama calls waited for a slot, by priority")
+REJECTED = METRICS.counter("llm_rejected_total", "Ollama calls refused before reaching Ollama, by reason (queue_full, deadline)")
+SHARED_CALLS = METRICS.counter("llm_single_flight_shared_total", "Ollama calls answered by an identical call already in flight")
+
+
+class LLMOverloadedError(Exception):
+    """No Ollama slot was free in time; the request should be answered with 503."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"The language model is busy ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "granted")
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LLMDispatcher:
+    """
+    Priority-ordered slots for Ollama calls, usable from threads (slot) and coroutines
+    (slot_async). A freed slot is handed straight to the first waiter, so a late
+    arrival cannot overtake calls that were already queued.
+    """
+
+    def __init__(self, max_concurrency=None, max_queue=None, queue_timeout=None, retry_after=None):
+        self.max_concurrency = config.LLM_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.max_queue = config.LLM_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = config.LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.retry_after = config.LLM_RETRY_AFTER_SECONDS if retry_after is None else retry_after
+        self.single_flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._waiters = []  # heap of _Waiter
+        self._in_flight = 0
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self):
+        return self.max_concurrency > 0
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "queued": len(self._waiters), "max_concurrency": self.max_concurrency}
+
+    # --- Slot Bookkeeping (under self._lock) ---
+
+    def _enter(self, priority, wake):
+        """Takes a free slot (returns None) or queues a waiter (returns it); raises when the queue is full."""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            IN_FLIGHT.set(self._in_flight)
+            return None
+        if len(self._waiters) >= self.max_queue:
+            REJECTED.inc(reason="queue_full")
+            raise LLMOverloadedError("queue_full", self.retry_after)
+        waiter = _Waiter(priority, next(self._seq), wake)
+        heapq.heappush(self._waiters, waiter)
+        QUEUE_DEPTH.set(len(self._waiters))
+        return waiter
+
+    def _abandon(self, waiter):
+        """Withdraws a waiter that gave up; returns True if a slot had been handed to it meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            QUEUE_DEPTH.set(len(self._waiters))
+            return False
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                waiter.granted = True
+                QUEUE_DEPTH.set(len(self._waiters))
+                waiter.wake()  # the slot passes to the waiter; in-flight count is unchanged
+            else:
+                self._in_flight -= 1
+                IN_FLIGHT.set(self._in_flight)
+
+    def _deadline_passed(self):
+        REJECTED.inc(reason="deadline")
+        raise LLMOverloadedError("deadline", self.retry_after)
+
+    # --- Public API ---
+
+    @contextmanager
+    def slot(self, priority=FIRST_TURN, timeout=None):
+        """
+        Holds one Ollama slot for the block (e.g. a whole streamed reply).
+
+        Raises:
+            LLMOverloadedError: The queue was full, or no slot was free within `timeout`
+                (default BAKERY_LLM_QUEUE_TIMEOUT) seconds.
+        """
+        if not self.enabled:
+            yield
+            return
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        started = time.monotonic()
+        granted = threading.Event()
+        with self._lock:
+            waiter = self._enter(priority, granted.set)
+        if waiter is not None:
+            with span("llm_queue", priority=name):
+                if not granted.wait(self.queue_timeout if timeout is None else timeout) and not self._abandon(waiter):
+                    self._deadline_passed()
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, priority=name)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self, priority=FIRST_TURN, timeout=None):
+        """Async twin of slot(); cancelling a waiting task withdraws it from the queue."""
+        if not self.enabled:
+            yield
+            return
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        with self._lock:
+            waiter = self._enter(priority, lambda: loop.call_soon_threadsafe(_resolve, granted))
+        if waiter is not None:
+            with span("llm_queue", priority=name):
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout if timeout is None else timeout)
+                except asyncio.TimeoutError:
+                    if not self._abandon(waiter):
+                        self._deadline_passed()
+                except asyncio.CancelledError:
+                    if self._abandon(waiter):
+                        self._release()
+                    raise
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, priority=name)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+# --- Single Flight ---
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share the first caller's execution and result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = {}  # (event loop, key) -> asyncio.Task
+
+    def do(self, key, function):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            SHARED_CALLS.inc()
+            annotate(single_flight="shared")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, coroutine_function):
+        """
+        Async twin of do(). The shared call runs as its own task, so a caller that is
+        cancelled (client gone) does not cancel it for the others.
+        """
+        task_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        else:
+            SHARED_CALLS.inc()
+            annotate(single_flight="shared")
+        return await asyncio.shield(task)
+
+
+def request_key(payload):
+    """Identity of a chat request for single flight: its /api/chat payload (model, messages, options, ...)."""
+    identity = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+# --- Shared Dispatcher ---
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_llm_dispatcher():
+    """Returns the process-wide LLMDispatcher, creating it on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = LLMDispatcher()
+    return _dispatcher
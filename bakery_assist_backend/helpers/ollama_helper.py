@@ -1,123 +1,285 @@
 import requests
 import json
-import re # For parsing the function call tag
+import logging
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from helpers.llm_dispatcher import FIRST_TURN, get_llm_dispatcher, request_key
+from utils import config
+from utils.metrics import METRICS
+from utils.tracing import annotate
 
-def call_ollama(prompt):
-    """Sends a prompt to the Ollama API (/api/chat) and returns the response content."""
-    # Set up the base URL for the local Ollama API
-    url = "http://localhost:11434/api/chat" # Using the chat endpoint
+logger = logging.getLogger(__name__)
 
-    # Structure for the /api/chat endpoint
+OLLAMA_REQUEST_SECONDS = METRICS.histogram("ollama_request_seconds", "Latency of Ollama /api/chat calls (full completion)")
+OLLAMA_REQUEST_ERRORS = METRICS.counter("ollama_request_errors_total", "Failed Ollama /api/chat calls")
+OLLAMA_TOKENS = METRICS.counter("ollama_tokens_total", "Tokens processed by Ollama, by kind (prompt, completion)")
+OLLAMA_PHASE_SECONDS = METRICS.histogram("ollama_phase_seconds", "Ollama-reported time per phase (load, prompt_eval, eval)")
+OLLAMA_EVAL_RATE = METRICS.histogram("ollama_eval_tokens_per_second", "Completion tokens generated per second",
+                                     buckets=(1, 2.5, 5, 10, 20, 40, 80, 160, 320))
+
+NANOSECONDS = 1e9
+
+
+def record_ollama_stats(response_data):
+    """
+    Captures the timing fields of a final Ollama response (or the last chunk of a stream)
+    into metrics and the current trace span. Ollama reports durations in nanoseconds and
+    leaves prompt_eval_count out when the whole prompt came from its KV cache.
+
+    Returns:
+        dict: The stats added to the span, or None if the response carried none.
+    """
+    if not isinstance(response_data, dict) or "eval_count" not in response_data:
+        return None
+    prompt_tokens = response_data.get("prompt_eval_count", 0)
+    completion_tokens = response_data.get("eval_count", 0)
+    load = response_data.get("load_duration", 0) / NANOSECONDS
+    prompt_eval = response_data.get("prompt_eval_duration", 0) / NANOSECONDS
+    eval_seconds = response_data.get("eval_duration", 0) / NANOSECONDS
+
+    OLLAMA_TOKENS.inc(prompt_tokens, kind="prompt")
+    OLLAMA_TOKENS.inc(completion_tokens, kind="completion")
+    OLLAMA_PHASE_SECONDS.observe(load, phase="load")
+    OLLAMA_PHASE_SECONDS.observe(prompt_eval, phase="prompt_eval")
+    OLLAMA_PHASE_SECONDS.observe(eval_seconds, phase="eval")
+    stats = {
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_ms": round(prompt_eval * 1000, 2),
+        "eval_count": completion_tokens,
+        "eval_ms": round(eval_seconds * 1000, 2),
+        "load_ms": round(load * 1000, 2),
+    }
+    if eval_seconds > 0:
+        stats["eval_tokens_per_second"] = round(completion_tokens / eval_seconds, 2)
+        OLLAMA_EVAL_RATE.observe(stats["eval_tokens_per_second"])
+    annotate(**stats)
+    return stats
+
+
+def as_messages(prompt):
+    """Accepts a plain prompt string or a ready /api/chat message list and returns the message list."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+def build_chat_payload(model, options, prompt, stream, fields=None):
+    """
+    The /api/chat request body. `fields` adds per-call settings (e.g. think, format, see
+    helpers/tool_detection.py); its `options` are merged over the configured ones.
+    """
     payload = {
-        "model": "deepseek-r1", # Make sure this model is running in Ollama
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": False # Get the full response at once
-        # Add options if needed, e.g., "options": {"temperature": 0.2}
+        "model": model,
+        "messages": as_messages(prompt),
+        "stream": stream,
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,  # avoid unloading the model between chats
     }
+    if fields:
+        payload.update(fields)
+        options = {**options, **fields.get("options", {})}
+    if options:
+        payload["options"] = options
+    return payload
 
-    print(f"\n--- Sending Prompt to Ollama ({payload['model']}) ---")
-    # print(prompt) # Uncomment to debug the exact prompt being sent
-    print("--- End Prompt ---")
 
-    try:
-        # Consider adding a timeout (e.g., timeout=60 for 60 seconds)
-        response = requests.post(url, json=payload, timeout=90)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+class OllamaClient:
+    """
+    Keep-alive HTTP client for the local Ollama server.
+
+    Wraps one requests.Session whose connection pool is shared by every call, so
+    chats reuse open TCP connections instead of handshaking per request. Only
+    connection errors are retried (with exponential backoff): a read timeout means
+    the model is busy generating, and resending would just queue a duplicate.
+    """
+
+    def __init__(self, base_url=None, model=None, options=None, pool_size=None,
+                 connect_timeout=None, read_timeout=None, connect_retries=None, retry_backoff=None):
+        self.base_url = (base_url or config.OLLAMA_BASE_URL).rstrip("/")
+        self.model = model or config.OLLAMA_MODEL
+        self.options = dict(config.OLLAMA_OPTIONS if options is None else options)
+        self.timeout = (
+            config.OLLAMA_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout,
+            config.OLLAMA_READ_TIMEOUT if read_timeout is None else read_timeout,
+        )
+        pool_size = config.OLLAMA_POOL_SIZE if pool_size is None else pool_size
+        retries = Retry(
+            total=None,
+            connect=config.OLLAMA_CONNECT_RETRIES if connect_retries is None else connect_retries,
+            read=0,
+            status=0,
+            other=0,
+            allowed_methods=None,  # POST is safe to retry when the connection was never established
+            backoff_factor=config.OLLAMA_RETRY_BACKOFF if retry_backoff is None else retry_backoff,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def chat_url(self):
+        return f"{self.base_url}/api/chat"
+
+    @property
+    def embed_url(self):
+        return f"{self.base_url}/api/embed"
+
+    def build_payload(self, prompt, stream, fields=None):
+        return build_chat_payload(self.model, self.options, prompt, stream, fields)
+
+    def chat(self, prompt, fields=None):
+        """Posts a non-streaming chat request and returns the decoded JSON body."""
+        started = time.monotonic()
+        try:
+            response = self.session.post(self.chat_url, json=self.build_payload(prompt, stream=False, fields=fields),
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            response_data = response.json()
+            record_ollama_stats(response_data)
+            return response_data
+        except (requests.exceptions.RequestException, json.JSONDecodeError):
+            OLLAMA_REQUEST_ERRORS.inc(mode="chat")
+            raise
+        finally:
+            OLLAMA_REQUEST_SECONDS.observe(time.monotonic() - started, mode="chat")
 
-        response_data = response.json()
+    def chat_stream(self, prompt, fields=None):
+        """Posts a streaming chat request and yields each decoded NDJSON chunk."""
+        started = time.monotonic()
+        try:
+            with self.session.post(self.chat_url, json=self.build_payload(prompt, stream=True, fields=fields),
+                                   stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        logger.warning("Error decoding Ollama stream chunk: %s", e)
+                        continue
+                    if chunk.get("done"):
+                        record_ollama_stats(chunk)
+                    yield chunk
+        except requests.exceptions.RequestException:
+            OLLAMA_REQUEST_ERRORS.inc(mode="stream")
+            raise
+        finally:
+            OLLAMA_REQUEST_SECONDS.observe(time.monotonic() - started, mode="stream")
+
+    def embed(self, text, model=None):
+        """Returns the embedding vector for `text` from Ollama's /api/embed endpoint."""
+        started = time.monotonic()
+        try:
+            response = self.session.post(self.embed_url, json={"model": model or config.OLLAMA_EMBED_MODEL, "input": text},
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()["embeddings"][0]
+        except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError, IndexError):
+            OLLAMA_REQUEST_ERRORS.inc(mode="embed")
+            raise
+        finally:
+            OLLAMA_REQUEST_SECONDS.observe(time.monotonic() - started, mode="embed")
+
+
+# --- Shared Client ---
+_client = None
+_client_lock = threading.Lock()
+
+def get_ollama_client():
+    """Returns the process-wide OllamaClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
+
+
+def call_ollama(prompt, priority=FIRST_TURN, fields=None, on_done=None):
+    """
+    Sends a prompt (a string, or a message list from templates/prompt_builder.py)
+    to the Ollama API (/api/chat) and returns the response content (None on failure).
+    The call waits for a dispatcher slot at `priority` and is shared with an identical
+    prompt already in flight.
+
+    Args:
+        fields (dict): Extra request fields for this call (see build_chat_payload).
+        on_done (callable): Called with Ollama's final response (done_reason, eval_count, ...).
+
+    Raises:
+        LLMOverloadedError: No Ollama slot was free in time.
+    """
+    client = get_ollama_client()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sending prompt to Ollama (%s): %s", client.model, json.dumps(as_messages(prompt)))
+
+    dispatcher = get_llm_dispatcher()
+    def dispatched_call():
+        with dispatcher.slot(priority):
+            return _chat_content(client, prompt, fields)
+    if config.LLM_SINGLE_FLIGHT:
+        key = request_key(client.build_payload(prompt, stream=False, fields=fields))
+        content, response_data = dispatcher.single_flight.do(key, dispatched_call)
+    else:
+        content, response_data = dispatched_call()
+    if on_done and response_data is not None:
+        on_done(response_data)
+    return content
+
+def _chat_content(client, prompt, fields):
+    """Returns (content, final response), or (None, None) on failure."""
+    try:
+        response_data = client.chat(prompt, fields)
 
         # --- CORRECT PARSING for /api/chat ---
         message_data = response_data.get("message", {})
         content = message_data.get("content", "").strip()
         # --- End Correction ---
 
-        #print(f"\n--- Received Response from Ollama ---")
-        # print(f"Raw Response Data: {response_data}") # Uncomment for deeper debugging
-        #print(f"Extracted Content: {content}")
-        #print("--- End Response ---")
-
         # Check if content is empty, which might indicate an issue
         if not content:
-            print("Warning: Received empty content from Ollama.")
-            # You might want to return None or a specific error message string here
-            # return None
-            
-        return content
+            logger.warning("Received empty content from Ollama.")
+
+        return content, response_data
 
     except requests.exceptions.Timeout:
-        print(f"Error: Ollama API request timed out.")
-        return None
+        logger.error("Ollama API request timed out.")
+        return None, None
     except requests.exceptions.RequestException as e:
-        print(f"Error calling Ollama API: {e}")
-        return None
+        logger.error("Error calling Ollama API: %s", e)
+        return None, None
     except json.JSONDecodeError as e:
-        print(f"Error decoding Ollama JSON response: {e}")
-        print(f"Raw response text: {response.text}")
-        return None
+        logger.error("Error decoding Ollama JSON response: %s", e)
+        return None, None
 
-def parse_function_call(response_content):
-    """
-    Parses the LLM response to find a <function_call> tag and extracts
-    the JSON object contained within it, even if extra text is present.
-    Returns a dictionary with 'name' and 'arguments' if found, otherwise None.
+def call_ollama_stream(prompt, priority=FIRST_TURN, fields=None, on_done=None):
     """
-    print(f"\n--- Debug: Entering parse_function_call ---") # DEBUG
-    print(f"Input type: {type(response_content)}") # DEBUG
-
-    if not isinstance(response_content, str):
-        print(f"Warning: parse_function_call received non-string input: {type(response_content)}")
-        return None
+    Sends a prompt (a string or a message list) to the Ollama API (/api/chat) with
+    streaming enabled and yields the content of each NDJSON chunk as it arrives.
+    A dispatcher slot is held until the stream ends or the generator is closed.
+    `fields` and `on_done` work as in call_ollama (on_done is not called for a stream
+    closed before its end).
 
-    # 1. Find the block between <function_call> and </function_call>
-    outer_match = re.search(r"<function_call>(.*?)</function_call>", response_content, re.DOTALL | re.IGNORECASE)
-    print(f"Outer regex match object: {outer_match}") # DEBUG
-
-    if outer_match:
-        content_between_tags = outer_match.group(1).strip()
-        print(f"Content between tags (raw): '{content_between_tags}'") # DEBUG
-
-        # 2. Find the JSON object within that block
-        # Look for the first '{' and the last '}'
-        json_match = re.search(r"\{.*\}", content_between_tags, re.DOTALL)
-
-        if json_match:
-            json_str = json_match.group(0).strip() # group(0) is the whole match
-            print(f"Potential JSON string found: '{json_str}'") # DEBUG
-
-            # Optional: Basic cleanup for markdown fences around the extracted JSON
-            if json_str.startswith("```json"): json_str = json_str[7:]
-            if json_str.startswith("```"): json_str = json_str[3:]
-            if json_str.endswith("```"): json_str = json_str[:-3]
-            json_str = json_str.strip()
-            print(f"Potential JSON string (cleaned): '{json_str}'") # DEBUG
-
-            try:
-                # 3. Attempt to parse the potential JSON
-                call_data = json.loads(json_str)
-                print(f"Successfully parsed JSON: {type(call_data)}") # DEBUG
-
-                # 4. Validate the structure
-                if isinstance(call_data, dict) and "name" in call_data and "arguments" in call_data:
-                     print(f"--- Parsed Function Call ---")
-                     print(json.dumps(call_data, indent=2))
-                     print("--- End Parsed Call ---")
-                     return call_data # Success!
-                else:
-                     print(f"Warning: Parsed JSON is not in the expected format: {call_data}") # DEBUG
-                     return None
-            except json.JSONDecodeError as e:
-                # Failed to parse the extracted JSON string
-                print(f"!!! Error decoding potential JSON string: {e} !!!") # DEBUG
-                print(f"String attempted to parse: '{json_str}'") # DEBUG
-                return None
-        else:
-            # Could not find '{...}' within the function call tags
-            print("Debug: No JSON object ('{...}') found within the <function_call> tags.") # DEBUG
-            return None
-    else:
-        # The outer <function_call> tags were not found
-         print("Debug: No <function_call> tag found in response.") # DEBUG
-         return None
+    Raises:
+        requests.exceptions.RequestException: If the request fails or the stream breaks.
+        LLMOverloadedError: No Ollama slot was free in time.
+    """
+    client = get_ollama_client()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Streaming prompt to Ollama (%s): %s", client.model, json.dumps(as_messages(prompt)))
 
-    # Fallback return None
-    return None
\ No newline at end of file
+    with get_llm_dispatcher().slot(priority):
+        for chunk in client.chat_stream(prompt, fields):
+            if chunk.get("error"):
+                raise requests.exceptions.RequestException(chunk["error"])
+            content = chunk.get("message", {}).get("content", "")
+            if content:
+                yield content
+            if chunk.get("done"):
+                if on_done:
+                    on_done(chunk)
+                break
@@ -0,0 +1,258 @@
+"""
+Single-pass, incremental parser for model replies.
+
+A reply mixes three kinds of content: <think>...</think> reasoning (dropped),
+<function_call>...</function_call> blocks (tool calls as JSON) and plain answer text.
+ReplyParser consumes the reply chunk by chunk as Ollama streams it and carries only a
+little state between chunks (a tag split across two chunks, or the call block being
+read), so every character is looked at once however the reply is chunked. The JSON in
+a call block is delimited by a bracket-aware scanner that skips string contents, so a
+block may hold an object, an array of objects or several objects in a row, with code
+fences or prose around them, and braces or tags inside argument strings do no harm.
+"""
+import json
+import logging
+import re
+
+from utils.token_estimator import estimate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN_TAG = "<think>"
+THINK_CLOSE_TAG = "</think>"
+FUNCTION_CALL_OPEN_TAG = "<function_call>"
+FUNCTION_CALL_CLOSE_TAG = "</function_call>"
+
+_OPEN_TAG = re.compile(r"<(think|function_call)>", re.IGNORECASE)
+_THINK_CLOSE = re.compile(re.escape(THINK_CLOSE_TAG), re.IGNORECASE)
+_JSON_TOKEN = re.compile(r'[{}\[\]"<]')  # outside JSON strings; "<" may start the closing tag
+_STRING_TOKEN = re.compile(r'["\\]')  # inside JSON strings
+
+TEXT, THINK, CALL = "text", "think", "function_call"
+
+
+def held_prefix_length(buffer, tags):
+    """Length of the suffix of `buffer` that may be the (case-insensitive) start of one of `tags`."""
+    start = buffer.rfind("<")  # every tag starts with "<" and has no other
+    if start < 0:
+        return 0
+    suffix = buffer[start:].lower()
+    return len(suffix) if any(len(suffix) < len(tag) and tag.startswith(suffix) for tag in tags) else 0
+
+
+def is_valid_call(call_data):
+    """A call names its tool with a string and carries arguments (normalised later, see tool_executor.call_arguments)."""
+    return isinstance(call_data, dict) and isinstance(call_data.get("name"), str) and "arguments" in call_data
+
+
+class ReplyParser:
+    """
+    State machine over one model reply: text, think or function_call.
+
+    feed() returns the visible text (everything outside <think> spans, call blocks
+    included, leading whitespace dropped) and collects calls in `calls` as soon as each
+    JSON value in a call block is complete. A block left open when the reply ends (e.g.
+    cut by a stop sequence) still yields the values completed so far.
+
+    Args:
+        json_only (bool): The reply is bare JSON (Ollama's `format` option), read as the
+            body of one call block that is complete with its first value.
+    """
+
+    def __init__(self, json_only=False):
+        self.json_only = json_only
+        self.state = CALL if json_only else TEXT
+        self.calls = []
+        self.call_blocks = 1 if json_only else 0  # <function_call> tags opened so far
+        self.raw_length = 0
+        self.raw_tokens = 0  # estimated, chunk by chunk (<think> spans and calls included)
+        self.calls_complete = False
+        self.unterminated = False  # the reply ended inside a call block
+        self._pending = ""
+        self._visible = []
+        self._started = False
+        self._after_call = False
+        self._reset_block()
+
+    @property
+    def text(self):
+        """Visible text so far: the reply without <think> spans."""
+        return "".join(self._visible)
+
+    def feed(self, chunk):
+        """Consumes a chunk of raw model output and returns the visible part of it."""
+        self.raw_length += len(chunk)
+        self.raw_tokens += estimate_text_tokens(chunk)
+        self._pending += chunk
+        visible = []
+        while self._pending:
+            if self.state == THINK:
+                advanced = self._skip_think()
+            elif self.state == CALL:
+                advanced = self._read_call(visible)
+            else:
+                advanced = self._read_text(visible)
+            if not advanced:
+                break
+        return self._emit("".join(visible))
+
+    def finish(self):
+        """Ends the reply; returns any visible text still held back."""
+        tail = self._pending if self.state == TEXT else ""
+        if self.state == CALL:
+            self.unterminated = True
+            self._close_block()
+        self.state = TEXT
+        self._pending = ""
+        return self._emit(tail)
+
+    # --- States ---
+    # Each consumes what it can of self._pending and returns True after switching state,
+    # or False when it needs more input.
+
+    def _read_text(self, visible):
+        if self._after_call:
+            # A closed call block followed by anything but another call: the calls are complete
+            head = self._pending.lstrip()[:len(FUNCTION_CALL_OPEN_TAG)].lower()
+            if head and not FUNCTION_CALL_OPEN_TAG.startswith(head):
+                self.calls_complete = True
+                self._after_call = False
+
+        match = _OPEN_TAG.search(self._pending)
+        if match is None:
+            ready = len(self._pending) - held_prefix_length(self._pending, (THINK_OPEN_TAG, FUNCTION_CALL_OPEN_TAG))
+            visible.append(self._pending[:ready])
+            self._pending = self._pending[ready:]
+            return False
+
+        visible.append(self._pending[:match.start()])
+        self._pending = self._pending[match.end():]
+        if match.group(1).lower() == "think":
+            self.state = THINK
+        else:
+            visible.append(match.group())
+            self.state = CALL
+            self.call_blocks += 1
+            self._after_call = False
+            self._reset_block()
+        return True
+
+    def _skip_think(self):
+        match = _THINK_CLOSE.search(self._pending)
+        if match is None:
+            self._pending = self._pending[len(self._pending) - held_prefix_length(self._pending, (THINK_CLOSE_TAG,)):]
+            return False
+        self._pending = self._pending[match.end():]
+        self.state = TEXT
+        return True
+
+    def _read_call(self, visible):
+        self._block += self._pending
+        self._pending = ""
+        close = self._scan_block()
+        if close is None:
+            visible.append(self._block[self._emitted:])
+            self._emitted = len(self._block)
+            return False
+
+        end = close + len(FUNCTION_CALL_CLOSE_TAG)
+        visible.append(self._block[self._emitted:end])
+        self._pending = self._block[end:]
+        self._close_block()
+        self.state = TEXT
+        self._after_call = True
+        return True
+
+    # --- Call Blocks ---
+
+    def _reset_block(self):
+        self._block = ""
+        self._block_calls = len(self.calls)
+        self._emitted = 0
+        self._scan_position = 0
+        self._depth = 0
+        self._in_string = False
+        self._value_start = 0
+
+    def _scan_block(self):
+        """
+        Scans the call block from where the last chunk left off, collecting each JSON
+        value whose brackets balance. Returns the index of the closing tag, or None if
+        the block has not been closed yet.
+        """
+        block, position = self._block, self._scan_position
+        while True:
+            if self._in_string:
+                match = _STRING_TOKEN.search(block, position)
+                if match is None:
+                    position = len(block)
+                    break
+                if match.group() == "\\":
+                    if match.end() == len(block):  # the escaped character is in the next chunk
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                else:
+                    self._in_string = False
+                    position = match.end()
+                continue
+
+            match = _JSON_TOKEN.search(block, position)
+            if match is None:
+                position = len(block)
+                break
+            token, position = match.group(), match.end()
+            if token == "<":
+                candidate = block[match.start():match.start() + len(FUNCTION_CALL_CLOSE_TAG)].lower()
+                if candidate == FUNCTION_CALL_CLOSE_TAG:
+                    return match.start()  # an unbalanced value before it is dropped
+                if FUNCTION_CALL_CLOSE_TAG.startswith(candidate):  # may be the tag, split across chunks
+                    position = match.start()
+                    break
+            elif token == '"':
+                self._in_string = self._depth > 0  # quotes in prose around the JSON do not count
+            elif token in "{[":
+                if self._depth == 0:
+                    self._value_start = match.start()
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._add_calls(block[self._value_start:position])
+                    self.calls_complete = self.calls_complete or self.json_only
+        self._scan_position = position
+        return None
+
+    def _add_calls(self, json_text):
+        try:
+            call_data = json.loads(json_text)
+        except json.JSONDecodeError as e:
+            logger.debug("Skipping non-JSON brackets in a <function_call> tag: %s", e)
+            return
+        for candidate in (call_data if isinstance(call_data, list) else [call_data]):
+            if is_valid_call(candidate):
+                self.calls.append(candidate)
+            else:
+                logger.warning("Parsed JSON is not in the expected format: %s", candidate)
+
+    def _close_block(self):
+        if len(self.calls) == self._block_calls and not self.json_only:  # [] is a valid JSON-mode reply
+            logger.warning("No valid function call found within a <function_call> tag.")
+        self._reset_block()
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        self._visible.append(text)
+        return text
+
+
+def parse_reply(text):
+    """Parses a complete reply in one go; returns the finished ReplyParser."""
+    parser = ReplyParser()
+    parser.feed(text)
+    parser.finish()
+    return parser
@@ -0,0 +1,250 @@
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from helpers.ollama_helper import get_ollama_client
+from utils import config
+from utils.db_notifications import get_invoice_change_listener
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = METRICS.counter("response_cache_lookups_total", "Response cache lookups by result (exact_hit, semantic_hit, miss)")
+CACHE_EVICTIONS = METRICS.counter("response_cache_evictions_total", "Response cache entries removed, by reason")
+CACHE_BYTES = METRICS.gauge("response_cache_bytes", "Approximate bytes held by the response cache")
+
+ENTRY_OVERHEAD_BYTES = 200  # rough per-entry cost of the key tuple, entry object and dict slots
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Lowercases, drops punctuation and collapses whitespace so trivial variations share a key."""
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", message.lower())).strip()
+
+
+class VectorIndex:
+    """
+    Brute-force cosine-similarity index over unit-normalised float32 vectors.
+
+    One index is kept per customer, which keeps each scan to that customer's handful
+    of cached questions.
+    """
+
+    def __init__(self):
+        self._vectors = {}
+
+    @staticmethod
+    def normalize(vector):
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return array("f", (v / norm for v in vector))
+
+    def add(self, key, unit_vector):
+        self._vectors[key] = unit_vector
+
+    def remove(self, key):
+        self._vectors.pop(key, None)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def search(self, unit_vector, threshold):
+        """Returns (key, similarity) of the closest vector at or above `threshold`, or (None, 0.0)."""
+        best_key, best_score = None, threshold
+        for key, candidate in self._vectors.items():
+            score = sum(a * b for a, b in zip(unit_vector, candidate))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return (best_key, best_score) if best_key is not None else (None, 0.0)
+
+
+class _Entry:
+    __slots__ = ("reply", "expires_at", "size", "vector")
+
+    def __init__(self, reply, expires_at, size, vector):
+        self.reply = reply
+        self.expires_at = expires_at
+        self.size = size
+        self.vector = vector
+
+
+class CacheLookup:
+    """Result of ResponseCache.lookup; pass it back to store() after a miss."""
+    __slots__ = ("reply", "key", "vector", "kind")
+
+    def __init__(self, reply, key, vector, kind):
+        self.reply = reply
+        self.key = key
+        self.vector = vector
+        self.kind = kind
+
+    @property
+    def hit(self):
+        return self.reply is not None
+
+
+class ResponseCache:
+    """
+    Chat reply cache keyed on (customer_number, normalized message, data version).
+
+    - Exact lookups hit on the normalized message; with `semantic=True` a miss falls back
+      to the closest cached question of the same customer by embedding similarity.
+    - Entries expire after `ttl` seconds and the least recently used ones are evicted once
+      the approximate footprint exceeds `max_bytes`.
+    - Each customer has a data version that invalidate_customer() bumps (wired to invoice
+      change notifications), dropping that customer's entries. A reply computed before an
+      invalidation carries the old version, so storing it late can never serve stale data.
+    """
+
+    def __init__(self, ttl=None, max_bytes=None, semantic=None, similarity_threshold=None, embedder=None):
+        self.ttl = config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = config.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.semantic = config.RESPONSE_CACHE_SEMANTIC if semantic is None else semantic
+        self.similarity_threshold = (config.RESPONSE_CACHE_SIMILARITY_THRESHOLD
+                                     if similarity_threshold is None else similarity_threshold)
+        self._embedder = embedder
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._indexes = {}             # customer_number -> VectorIndex
+        self._versions = {}            # customer_number -> data version
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    # --- Versioning / Invalidation ---
+
+    def data_version(self, customer_number):
+        with self._lock:
+            return self._versions.get(str(customer_number), 0)
+
+    def invalidate_customer(self, customer_number):
+        """Bumps the customer's data version and drops all of their cached replies."""
+        customer_number = str(customer_number)
+        with self._lock:
+            self._versions[customer_number] = self._versions.get(customer_number, 0) + 1
+            for key in [k for k in self._entries if k[0] == customer_number]:
+                self._remove(key, "invalidated")
+            self._indexes.pop(customer_number, None)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key, "cleared")
+            self._indexes.clear()
+
+    # --- Lookup / Store ---
+
+    def _embed(self, text):
+        if self._embedder is None:
+            self._embedder = get_ollama_client().embed
+        try:
+            return VectorIndex.normalize(self._embedder(text))
+        except Exception as e:
+            logger.warning("Response cache embedding failed, using exact lookup only: %s", e)
+            return None
+
+    def lookup(self, customer_number, message):
+        """Looks up a cached reply for the customer's message. Always returns a CacheLookup."""
+        customer_number = str(customer_number)
+        normalized = normalize_message(message)
+        now = time.monotonic()
+
+        with self._lock:
+            key = (customer_number, normalized, self._versions.get(customer_number, 0))
+            entry = self._get_live(key, now)
+            if entry is not None:
+                CACHE_LOOKUPS.inc(result="exact_hit")
+                return CacheLookup(entry.reply, key, entry.vector, "exact")
+            index = self._indexes.get(customer_number)
+            has_candidates = index is not None and len(index) > 0
+
+        vector = None
+        if self.semantic and normalized:
+            vector = self._embed(normalized)
+            if vector is not None and has_candidates:
+                with self._lock:
+                    index = self._indexes.get(customer_number)
+                    match_key, _ = index.search(vector, self.similarity_threshold) if index else (None, 0.0)
+                    entry = self._get_live(match_key, now) if match_key and match_key[2] == key[2] else None
+                    if entry is not None:
+                        CACHE_LOOKUPS.inc(result="semantic_hit")
+                        return CacheLookup(entry.reply, key, vector, "semantic")
+
+        CACHE_LOOKUPS.inc(result="miss")
+        return CacheLookup(None, key, vector, "miss")
+
+    def store(self, lookup, reply):
+        """Caches `reply` under the key captured by an earlier missed lookup."""
+        key = lookup.key
+        size = (ENTRY_OVERHEAD_BYTES + len(reply.encode("utf-8")) + len(key[1].encode("utf-8"))
+                + (lookup.vector.itemsize * len(lookup.vector) if lookup.vector is not None else 0))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # Data changed while the reply was being generated: it is already stale
+            if self._versions.get(key[0], 0) != key[2]:
+                return
+            if key in self._entries:
+                self._remove(key, "replaced")
+            self._entries[key] = _Entry(reply, time.monotonic() + self.ttl, size, lookup.vector)
+            self._bytes += size
+            if lookup.vector is not None:
+                self._indexes.setdefault(key[0], VectorIndex()).add(key, lookup.vector)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)), "size")
+            CACHE_BYTES.set(self._bytes)
+
+    # --- Internals (call with the lock held) ---
+
+    def _get_live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key, reason):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        index = self._indexes.get(key[0])
+        if index is not None:
+            index.remove(key)
+        CACHE_EVICTIONS.inc(reason=reason)
+        CACHE_BYTES.set(self._bytes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "exact_hits": CACHE_LOOKUPS.value(result="exact_hit"),
+                "semantic_hits": CACHE_LOOKUPS.value(result="semantic_hit"),
+                "misses": CACHE_LOOKUPS.value(result="miss"),
+            }
+
+
+# --- Shared Cache ---
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide response cache, subscribing it to invoice change notifications."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+            listener = get_invoice_change_listener()
+            # Changes made while the listener was disconnected were never announced
+            listener.subscribe(_response_cache.invalidate_customer, on_connect=_response_cache.clear)
+            listener.start()
+        return _response_cache
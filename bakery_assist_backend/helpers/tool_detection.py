@@ -0,0 +1,66 @@
+"""
+Limits for the tool-detection step: the first model call of a chat turn, whose job is to
+pick tools.
+
+Left alone, deepseek-r1 writes a whole <think> chain for that call and keeps generating
+after the <function_call> tag, although only the tag is used. ToolDetection turns the
+BAKERY_TOOL_DETECTION_* settings into Ollama request fields:
+  - options.num_predict caps the tokens the step may generate;
+  - options.stop ends it at the first </function_call> (Ollama leaves the stop sequence
+    out; the reply parser accepts the open block). Later call tags are lost with it, so
+    a turn that needs several lookups takes another step;
+  - "think": false makes thinking models answer without a reasoning chain. This one is
+    on by default: it cuts most of the step's tokens and, unlike the others, never
+    loses a call or an answer;
+  - format constrains the output to a JSON array of calls to the selected tools, built
+    from the registry's parameter schemas, with [] meaning that no tool is needed.
+With a cap or the JSON format the step only decides: if it yields no call (or the cap
+cut it), the agent loop drops it and asks again without limits, so the answer is never
+a truncated one. In JSON mode that means every message that needs no tool costs two
+model calls (see benchmarks/tool_detection_benchmark.py).
+"""
+from helpers.reply_parser import FUNCTION_CALL_CLOSE_TAG
+from utils import config
+
+
+class ToolDetection:
+    """Ollama request fields for a turn's tool-detection step (defaults from utils/config.py)."""
+
+    def __init__(self, num_predict=None, stop=None, think=None, json_format=None, max_calls=None):
+        self.num_predict = config.TOOL_DETECTION_NUM_PREDICT if num_predict is None else num_predict
+        self.stop = config.TOOL_DETECTION_STOP if stop is None else stop
+        self.think = config.TOOL_DETECTION_THINK if think is None else think
+        self.json_format = config.TOOL_DETECTION_JSON if json_format is None else json_format
+        self.max_calls = config.MAX_TOOL_CALLS_PER_TURN if max_calls is None else max_calls
+
+    @property
+    def enabled(self):
+        return self.num_predict > 0 or self.stop or not self.think or self.json_format
+
+    @property
+    def decides_only(self):
+        """The step's text cannot stand in for an answer: the cap may cut it, or it is JSON."""
+        return self.num_predict > 0 or self.json_format
+
+    def request_fields(self, registry, tool_names):
+        """
+        Extra /api/chat fields for the step; `options` are merged over BAKERY_OLLAMA_OPTIONS.
+
+        Args:
+            registry: ToolRegistry (or a ToolView of it) providing calls_schema() for JSON mode.
+            tool_names (list): The tools described to the model for this message.
+        """
+        options = {}
+        if self.num_predict > 0:
+            options["num_predict"] = self.num_predict
+        if self.stop and not self.json_format:
+            options["stop"] = [FUNCTION_CALL_CLOSE_TAG]
+        fields = {"options": options} if options else {}
+        if not self.think:
+            fields["think"] = False
+        if self.json_format:
+            fields["format"] = registry.calls_schema(tool_names, self.max_calls)
+        return fields
+
+    def trace(self):
+        return {"num_predict": self.num_predict, "stop": self.stop, "think": self.think, "json": self.json_format}
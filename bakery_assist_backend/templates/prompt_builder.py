@@ -0,0 +1,97 @@
+from function_calling.function_descriptions import FunctionDescription
+from templates.prompt import (
+    SYSTEM_PROMPT_PREFIX_TEMPLATE,
+    REQUEST_CONTEXT_TEMPLATE,
+    RESPONSE_SYSTEM_PROMPT,
+    RESPONSE_CONTEXT_TEMPLATE,
+    FUNCTION_RESPONSE_TEMPLATE,
+    AGENT_FOLLOW_UP_PROMPT,
+    JSON_DETECTION_PROMPT,
+)
+
+
+class PromptBuilder:
+    """
+    Assembles Ollama /api/chat message lists with a cache-friendly layout.
+
+    The system message is rendered once per tool selection and reused byte-for-byte on
+    every request with that selection, so Ollama can keep the prefix in its KV cache. The
+    tool list sits at the end of it, so even a different selection reuses the instructions.
+    Everything that varies per request (customer, query, tool results) goes into the
+    trailing user message.
+    """
+
+    def __init__(self, tool_descriptions=None):
+        self._tool_descriptions = tool_descriptions
+        self._system_prompts = {}
+        self.response_system_prompt = RESPONSE_SYSTEM_PROMPT
+
+    @property
+    def system_prompt(self):
+        """The static tool-detection prefix describing every tool, rendered on first use (which is when the tools are discovered)."""
+        return self.system_prompt_for(None)
+
+    def system_prompt_for(self, tool_names):
+        """The tool-detection prefix describing `tool_names` (None: every tool), rendered once per selection."""
+        key = tuple(tool_names) if tool_names is not None and self._tool_descriptions is None else None
+        prompt = self._system_prompts.get(key)
+        if prompt is None:
+            tool_descriptions = self._tool_descriptions
+            if tool_descriptions is None:
+                tool_descriptions = FunctionDescription.tool_descriptions(tool_names)
+            prompt = self._system_prompts[key] = SYSTEM_PROMPT_PREFIX_TEMPLATE.format(TOOL_DESCRIPTIONS=tool_descriptions)
+        return prompt
+
+    def tool_detection_messages(self, customer_number, user_message, tool_names=None, history=None):
+        """
+        Messages for the first turn: static system prefix, earlier turns of the session, then
+        customer context and query.
+
+        Args:
+            tool_names (list): Tools to describe (see function_calling/tool_retriever.py); None describes all of them.
+            history (list): Messages from Conversation.history_messages(), oldest first.
+        """
+        return [
+            {"role": "system", "content": self.system_prompt_for(tool_names)},
+            *(history or ()),
+            {"role": "user", "content": REQUEST_CONTEXT_TEMPLATE.format(
+                customer_number=customer_number, user_message=user_message)},
+        ]
+
+    def json_detection_messages(self, messages):
+        """Copy of tool-detection `messages` asking for the calls as a JSON array (the system prefix is untouched)."""
+        last = messages[-1]
+        return [*messages[:-1], {**last, "content": last["content"] + "\n\n" + JSON_DETECTION_PROMPT}]
+
+    def function_responses(self, tool_results):
+        """Renders one <function_response> block per tool result, in call order."""
+        return "\n".join(
+            FUNCTION_RESPONSE_TEMPLATE.format(name=tool_result.name, function_result=tool_result.prompt_text)
+            for tool_result in tool_results
+        )
+
+    def follow_up_message(self, tool_results):
+        """User message that hands tool results back to the model mid-loop, letting it answer or call another tool."""
+        return {"role": "user", "content": self.function_responses(tool_results) + "\n\n" + AGENT_FOLLOW_UP_PROMPT}
+
+    def response_messages(self, tool_results, user_message, history=None):
+        """
+        Messages for the final, answer-only turn: static response instructions, earlier
+        turns of the session, then one <function_response> block per executed tool call
+        and the original query.
+
+        Args:
+            tool_results (list): ToolCallResult objects, in the order the calls were requested.
+            user_message (str): The customer's original message.
+            history (list): Messages from Conversation.history_messages(), oldest first.
+        """
+        return [
+            {"role": "system", "content": self.response_system_prompt},
+            *(history or ()),
+            {"role": "user", "content": RESPONSE_CONTEXT_TEMPLATE.format(
+                function_responses=self.function_responses(tool_results), user_message=user_message)},
+        ]
+
+
+# Shared builder: each system prefix is rendered once per process
+PROMPT_BUILDER = PromptBuilder()
@@ -0,0 +1,10 @@
+"""
+Shared pytest setup: the backend modules import each other absolutely (`from utils import
+config`), as when the apps run from this directory.
+
+    cd bakery_assist_backend && python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
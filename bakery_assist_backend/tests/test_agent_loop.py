@@ -0,0 +1,126 @@
+import pytest
+
+from function_calling.tool_executor import call_arguments
+from helpers.agent_loop import AgentRun
+from helpers.reply_parser import is_valid_call, parse_reply
+from helpers.tool_detection import ToolDetection
+from utils.token_estimator import estimate_text_tokens
+
+CUSTOMER = "100001"
+
+
+def take(*calls):
+    agent_run = AgentRun(CUSTOMER, "Show my last 3 invoices")
+    agent_run.pending_calls = list(calls)
+    return agent_run, agent_run.take_new_calls()
+
+
+@pytest.mark.parametrize("arguments, expected", [
+    ({"limit": 3}, {"limit": 3}),
+    ('{"limit": 3}', {"limit": 3}),
+    ("not json", {}),
+    ('[1, 2]', {}),
+    ([1, 2], {}),
+    (3, {}),
+    (None, {}),
+])
+def test_arguments_of_any_shape_are_normalised(arguments, expected):
+    agent_run, new_calls = take({"name": "get_customer_invoices", "arguments": arguments})
+    assert new_calls == [{"name": "get_customer_invoices", "arguments": dict(expected, customer_number=CUSTOMER)}]
+    assert agent_run.stop_reason is None
+
+
+def test_model_cannot_override_customer_number():
+    _, new_calls = take({"name": "get_customer_invoices", "arguments": {"customer_number": "999999"}})
+    assert new_calls[0]["arguments"]["customer_number"] == CUSTOMER
+
+
+@pytest.mark.parametrize("name", [["get_customer_invoices"], {"tool": "x"}, 3, None])
+def test_calls_without_a_string_name_are_dropped(name):
+    agent_run, new_calls = take({"name": name, "arguments": {}})
+    assert new_calls == []
+    assert agent_run.stop_reason == "invalid_call"
+
+
+def test_repeated_calls_are_short_circuited():
+    agent_run, first = take({"name": "get_customer_invoices", "arguments": '{"limit": 3}'})
+    agent_run.pending_calls = [{"name": "get_customer_invoices", "arguments": {"limit": 3}}]
+    assert len(first) == 1
+    assert agent_run.take_new_calls() == []
+    assert agent_run.stop_reason == "repeated_call"
+
+
+def test_parser_rejects_non_string_names():
+    assert not is_valid_call({"name": ["get_customer_invoices"], "arguments": {}})
+    assert is_valid_call({"name": "get_customer_invoices", "arguments": "{}"})
+    reply = parse_reply('<function_call>{"name": 3, "arguments": {}}</function_call>')
+    assert reply.calls == []
+
+
+def test_call_arguments_copies():
+    arguments = {"limit": 3}
+    copied = call_arguments({"arguments": arguments})
+    copied["limit"] = 5
+    assert arguments == {"limit": 3}
+
+
+def test_answer_only_prompt_keeps_the_session_history():
+    history = [{"role": "user", "content": "Show my last 3 invoices"},
+               {"role": "assistant", "content": "INV-1, INV-2 and INV-3."}]
+    agent_run = AgentRun(CUSTOMER, "What about the second one?", history=history)
+    agent_run.stop_reason = "step_budget"
+    messages, tools_allowed, detecting = agent_run.next_prompt()
+    assert not tools_allowed and not detecting
+    assert messages[1:3] == history
+    assert "What about the second one?" in messages[-1]["content"]
+
+
+def finished_sniffer(agent_run, reply, done_reason="stop"):
+    messages, tools_allowed, detecting = agent_run.next_prompt()
+    sniffer = agent_run.new_sniffer(False, tools_allowed, detecting)
+    sniffer.feed(reply)
+    sniffer.finish()
+    sniffer.record_done({"done_reason": done_reason})
+    return sniffer, detecting
+
+
+def test_detection_is_reported_after_a_dropped_step():
+    reported = []
+    agent_run = AgentRun(CUSTOMER, "Are you open on Sundays?", detection=ToolDetection(json_format=True),
+                         on_detection=lambda calls, seconds: reported.append((calls, seconds)))
+    sniffer, detecting = finished_sniffer(agent_run, "[]")
+    assert detecting
+    assert agent_run.record_llm_step(sniffer, 0.5, detecting) is False
+    assert reported == []
+
+    sniffer, detecting = finished_sniffer(agent_run, "We open at 8 on Sundays.")
+    assert not detecting
+    assert agent_run.record_llm_step(sniffer, 1.0, detecting) is True
+    assert reported == [([], 1.5)]
+    assert agent_run.reply == "We open at 8 on Sundays."
+
+
+def test_detection_is_reported_once():
+    reported = []
+    agent_run = AgentRun(CUSTOMER, "Show my last 3 invoices", detection=ToolDetection(),
+                         on_detection=lambda calls, seconds: reported.append(calls))
+    call = '<function_call>{"name": "get_customer_invoices", "arguments": {"limit": 3}}</function_call>'
+    sniffer, detecting = finished_sniffer(agent_run, call)
+    agent_run.record_llm_step(sniffer, 0.1, detecting)
+    sniffer, detecting = finished_sniffer(agent_run, call.replace("3", "4"))
+    agent_run.record_llm_step(sniffer, 0.1, detecting)
+    assert len(reported) == 1
+
+
+def test_model_steps_count_tokens_with_the_shared_estimator():
+    agent_run = AgentRun(CUSTOMER, "Are you open on Sundays?", detection=ToolDetection(think=True))
+    reply = "<think>Opening hours, 2024-06-02.</think>We open at 8 on Sundays."
+    sniffer, detecting = finished_sniffer(agent_run, reply)
+    agent_run.record_llm_step(sniffer, 0.1, detecting)
+    assert agent_run.tokens_used == estimate_text_tokens(reply)
+
+
+def test_thinking_is_off_for_detection_by_default():
+    agent_run = AgentRun(CUSTOMER, "Show my last 3 invoices")
+    assert agent_run.detecting
+    assert agent_run.detection.request_fields(None, agent_run.tool_selection.names) == {"think": False}
@@ -0,0 +1,55 @@
+import asyncio
+
+from utils import async_db_connection
+
+
+class FakePool:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_concurrent_first_requests_share_one_pool(monkeypatch):
+    created = []
+
+    async def create_pool():
+        await asyncio.sleep(0.01)
+        created.append(FakePool())
+        return created[-1]
+
+    monkeypatch.setattr(async_db_connection, "_create_pool", create_pool)
+
+    async def scenario():
+        pools = await asyncio.gather(*(async_db_connection.get_async_pool() for _ in range(10)))
+        await async_db_connection.close_async_pool()
+        return pools
+
+    pools = asyncio.run(scenario())
+    assert len(created) == 1
+    assert all(pool is created[0] for pool in pools)
+    assert created[0].closed
+
+
+def test_failed_creation_is_retried(monkeypatch):
+    attempts = []
+
+    async def create_pool():
+        attempts.append(True)
+        if len(attempts) == 1:
+            raise OSError("connection refused")
+        return FakePool()
+
+    monkeypatch.setattr(async_db_connection, "_create_pool", create_pool)
+
+    async def scenario():
+        try:
+            await async_db_connection.get_async_pool()
+        except OSError:
+            pass
+        pool = await async_db_connection.get_async_pool()
+        await async_db_connection.close_async_pool()
+        return pool
+
+    assert isinstance(asyncio.run(scenario()), FakePool)
+    assert len(attempts) == 2
@@ -0,0 +1,40 @@
+import random
+import sys
+import tracemalloc
+
+from helpers.customer_index import CustomerIdIndex
+
+MILLION = 1_000_000
+BUDGET_PER_MILLION = MILLION // 8 + 1  # one bit per id up to the highest id
+
+
+def test_memory_per_million_ids_is_bounded():
+    rng = random.Random(0)
+    ids = [customer_pk for customer_pk in range(1, MILLION + 1) if rng.random() > 0.02]
+    index = CustomerIdIndex(max_bytes=10 * MILLION)
+
+    tracemalloc.start()
+    index.replace(ids, ids[-1])
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert index.memory_bytes() <= BUDGET_PER_MILLION
+    assert sys.getsizeof(index._bits) <= BUDGET_PER_MILLION + 1024
+    assert traced <= BUDGET_PER_MILLION + 4096
+    assert len(index) == len(ids)
+
+
+def test_growth_by_add_stays_within_an_eighth_of_the_budget():
+    index = CustomerIdIndex(max_bytes=10 * MILLION)
+    for customer_pk in range(0, MILLION, 97):
+        index.add(customer_pk)
+    assert index.memory_bytes() <= BUDGET_PER_MILLION * 9 // 8
+
+
+def test_lookups_are_exact():
+    index = CustomerIdIndex(max_bytes=1024)
+    index.replace([1, 7, 8, 100], 100)
+    assert [customer_pk for customer_pk in range(-1, 200) if index.contains(customer_pk)] == [1, 7, 8, 100]
+    index.discard(7)
+    assert not index.contains(7) and len(index) == 3
+    assert not index.add(1024 * 8)  # beyond max_bytes
@@ -0,0 +1,13 @@
+import pytest
+
+from helpers.customer_verification import canonical_customer_number
+
+
+@pytest.mark.parametrize("raw", ["7", "007", " 7", "7 ", "+7"])
+def test_spellings_share_the_canonical_number(raw):
+    assert canonical_customer_number(raw) == "7"
+
+
+@pytest.mark.parametrize("raw", ["", "abc", "7a", "7.0", None])
+def test_non_integers_are_rejected(raw):
+    assert canonical_customer_number(raw) is None
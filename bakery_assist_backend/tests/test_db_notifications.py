@@ -0,0 +1,52 @@
+import psycopg2
+
+from utils import db_notifications
+from utils.db_notifications import DatabaseNotificationListener
+
+
+class DroppingConnection:
+    """Accepts LISTEN, then fails the first wait like a dropped socket."""
+
+    def __init__(self, error):
+        self.error = error
+        self.notifies = []
+
+    def set_isolation_level(self, level):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        pass
+
+    def fileno(self):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def run_connections(monkeypatch, errors):
+    listener = DatabaseNotificationListener("invoice_changes", poll_interval=0.01, reconnect_delay=0)
+    connects = []
+    pending = list(errors)
+
+    def connect(**kwargs):
+        if not pending:
+            listener.stop()
+            raise psycopg2.OperationalError("stopped")
+        return DroppingConnection(pending.pop(0))
+
+    monkeypatch.setattr(db_notifications.psycopg2, "connect", connect)
+    listener.subscribe(lambda payload: None, on_connect=lambda: connects.append(True))
+    listener._run()
+    return connects
+
+
+def test_every_reconnect_is_announced(monkeypatch):
+    assert len(run_connections(monkeypatch, [psycopg2.OperationalError("gone"), psycopg2.OperationalError("gone")])) == 2
+
+
+def test_socket_errors_reconnect_instead_of_ending_the_thread(monkeypatch):
+    assert len(run_connections(monkeypatch, [OSError("bad file descriptor"), OSError("bad file descriptor")])) == 2
@@ -0,0 +1,33 @@
+import pytest
+
+from helpers.intent_router import IntentRouter
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(threshold=0.8, log_path="")
+
+
+@pytest.mark.parametrize("message", [
+    "what is my outstanding balance on my invoices",
+    "show my overdue invoices",
+    "show my top products on my invoices",
+    "compare my open and overdue invoices and show my top products",
+    "show me the items on my last invoice",
+    "how much did I spend on my invoices this year",
+    "how often do I get an invoice",
+    "what is on invoice INV-100234",
+])
+def test_questions_for_other_tools_go_to_the_llm(router, message):
+    assert router.route(message) is None
+
+
+@pytest.mark.parametrize("message, arguments", [
+    ("show my last 3 invoices", {"limit": 3}),
+    ("show my most recent invoices", {}),
+    ("list my latest invoice", {"limit": 1}),
+])
+def test_plain_invoice_lists_are_routed(router, message, arguments):
+    decision = router.route(message)
+    assert decision.tool_name == "get_customer_invoices"
+    assert decision.arguments == arguments
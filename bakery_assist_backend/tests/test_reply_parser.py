@@ -0,0 +1,230 @@
+"""
+Tests for helpers/reply_parser.py: hand-written cases for tag splits, JSON strings and
+unterminated blocks, plus a seeded fuzz check that random replies parse to the same
+visible text and calls whichever way they are chunked.
+"""
+import json
+import logging
+import random
+
+import pytest
+
+from helpers.reply_parser import ReplyParser, parse_reply
+
+CALL = {"name": "get_customer_invoices", "arguments": {"limit": 3}}
+CALL_TAG = f"<function_call>{json.dumps(CALL)}</function_call>"
+
+
+@pytest.fixture(autouse=True)
+def quiet_parser_warnings():
+    logging.disable(logging.WARNING)  # malformed blocks are expected here
+    yield
+    logging.disable(logging.NOTSET)
+
+
+def every_split(reply):
+    """(first chunk, second chunk) for every position in `reply`."""
+    return [(reply[:i], reply[i:]) for i in range(len(reply) + 1)]
+
+
+TEXT_PIECES = ["Hello", " ", "\n", "total: 12.50 EUR", "{not json}", "[1, 2]", '"quoted"', "<", "<b>", "</think>",
+               "</function_call>", "<function", "<thin", "a < b", "\\", "äöü", "```"]
+STRING_PIECES = ["x", " ", "{", "}", "[", "]", "<think>", "</function_call>", "<function_call>", "\\", '"', "\n",
+                 "€", "</think>"]
+PROSE_PIECES = ["Calling the tool:", "```json", "```", "\n", " ", "ok", "then"]
+
+
+def random_text(rng, pieces, count):
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, count)))
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(6 if depth < 3 else 4)
+    if kind == 0:
+        return random_text(rng, STRING_PIECES, 6)
+    if kind == 1:
+        return rng.randint(-1000, 1000)
+    if kind == 2:
+        return rng.choice([True, False, None, 1.5])
+    if kind == 3:
+        return ""
+    if kind == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return {random_text(rng, STRING_PIECES, 4): random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))}
+
+
+def random_call(rng):
+    return {"name": rng.choice(["get_invoices", "get_invoice_items", "search_products"]),
+            "arguments": {f"arg{i}": random_value(rng) for i in range(rng.randint(0, 3))}}
+
+
+def dumps(value, rng):
+    return json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, None, 2]))
+
+
+def random_call_block(rng, last):
+    """Returns (block text, expected calls); `last` allows an unterminated block."""
+    calls, parts = [], [rng.choice(["<function_call>", "<FUNCTION_CALL>", "<Function_Call>"])]
+    for _ in range(rng.randint(0, 3)):
+        parts.append(random_text(rng, PROSE_PIECES, 3))
+        shape = rng.randrange(5)
+        if shape == 0:  # a list of calls
+            values = [random_call(rng) for _ in range(rng.randint(1, 3))]
+            calls.extend(values)
+            parts.append(dumps(values, rng))
+        elif shape == 1:  # well-formed JSON that is not a call
+            parts.append(dumps({"tool": "x", "args": random_value(rng)}, rng))
+        elif shape == 2:  # broken JSON: balanced brackets, bad content
+            parts.append('{"name": get_invoices, "arguments": {}}')
+        else:
+            value = random_call(rng)
+            calls.append(value)
+            parts.append(dumps(value, rng))
+        parts.append(random_text(rng, PROSE_PIECES, 3))
+    if last and rng.random() < 0.3:
+        if rng.random() < 0.5:
+            parts.append('{"name": "get_invoices", "arguments": {"open": ')  # cut off mid-value
+        return "".join(parts), calls
+    return "".join(parts) + rng.choice(["</function_call>", "</FUNCTION_CALL>"]), calls
+
+
+def random_reply(rng):
+    """Returns (reply, expected visible text, expected calls)."""
+    raw, visible, calls = [], [], []
+    segments = rng.randint(0, 6)
+    for index in range(segments):
+        last = index == segments - 1
+        kind = rng.randrange(3)
+        if kind == 0:
+            text = random_text(rng, TEXT_PIECES, 5)
+            # Text must not open a tag by accident when joined with what follows
+            text = text.replace("<", "&lt;") if text.endswith("<") or "<think>" in text or "<function_call>" in text else text
+            raw.append(text)
+            visible.append(text)
+        elif kind == 1:
+            open_tag = rng.choice(["<think>", "<THINK>", "<Think>"])
+            content = random_text(rng, TEXT_PIECES + ["{", '"', "<function_call>"], 6).replace("</think>", "")
+            if last and rng.random() < 0.3:
+                raw.append(open_tag + content)  # unterminated: runs to the end of the reply
+            else:
+                raw.append(open_tag + content + rng.choice(["</think>", "</THINK>"]))
+        else:
+            block, block_calls = random_call_block(rng, last)
+            raw.append(block)
+            visible.append(block)
+            calls.extend(block_calls)
+    reply = "".join(raw)
+    return reply, "".join(visible).lstrip(), calls
+
+
+def parse(reply, sizes):
+    parser = ReplyParser()
+    visible, position = [], 0
+    for size in sizes:
+        visible.append(parser.feed(reply[position:position + size]))
+        position += size
+    visible.append(parser.feed(reply[position:]))
+    visible.append(parser.finish())
+    return "".join(visible), parser.calls, parser.text
+
+
+
+# --- Tag Splits ---
+
+@pytest.mark.parametrize("reply, text, calls", [
+    (f"<think>plan {{ <function_call> }}</think>{CALL_TAG}", CALL_TAG, [CALL]),
+    (f"<THINK>x</Think>Hi <b>there</b>", "Hi <b>there</b>", []),
+    (f"Sure.{CALL_TAG}Done.", f"Sure.{CALL_TAG}Done.", [CALL]),
+    (f"a < b <function", "a < b <function", []),
+])
+def test_tags_split_at_any_position(reply, text, calls):
+    for first, second in every_split(reply):
+        visible, parsed_calls, parsed_text = parse(reply, [len(first)])
+        assert (visible, parsed_calls, parsed_text) == (text, calls, text), (first, second)
+
+
+def test_one_character_chunks():
+    reply = f"<think>{CALL_TAG}</think>{CALL_TAG} and {CALL_TAG}"
+    visible, calls, _ = parse(reply, [1] * len(reply))
+    assert calls == [CALL, CALL]
+    assert visible == f"{CALL_TAG} and {CALL_TAG}"
+
+
+# --- JSON Strings ---
+
+@pytest.mark.parametrize("value", [
+    'say \\"hi\\"', "{not a brace}", "[1, 2", "</function_call>", "<think>", "back\\slash\\", "€ ü",
+])
+def test_strings_may_hold_quotes_braces_and_tags(value):
+    call = {"name": "search_products", "arguments": {"query": value}}
+    reply = f"<function_call>{json.dumps(call)}</function_call>"
+    for first, _ in every_split(reply):
+        assert parse(reply, [len(first)])[1] == [call]
+
+
+def test_arrays_and_consecutive_objects():
+    other = {"name": "get_outstanding_balance", "arguments": {}}
+    reply = f"<function_call>```json\n{json.dumps([CALL, other])}\n```</function_call>"
+    assert parse_reply(reply).calls == [CALL, other]
+    reply = f"<function_call>{json.dumps(CALL)}\n{json.dumps(other)}</function_call>"
+    assert parse_reply(reply).calls == [CALL, other]
+
+
+def test_invalid_calls_are_skipped():
+    reply = '<function_call>{"name": get_x, "arguments": {}} {"tool": "x"} [1]</function_call>'
+    parser = parse_reply(reply)
+    assert parser.calls == []
+    assert parser.call_blocks == 1
+
+
+# --- Unterminated Blocks ---
+
+def test_unterminated_block_keeps_completed_calls():
+    parser = parse_reply(f"<function_call>{json.dumps(CALL)} {{\"name\": \"get_x\", \"arguments\": {{")
+    assert parser.calls == [CALL]
+    assert parser.unterminated
+
+
+def test_unterminated_think_hides_the_rest():
+    parser = parse_reply(f"Hello <think>{CALL_TAG}")
+    assert parser.text == "Hello "
+    assert parser.calls == []
+
+
+def test_calls_complete_once_other_text_follows():
+    parser = ReplyParser()
+    parser.feed(CALL_TAG)
+    assert not parser.calls_complete  # another call tag may follow
+    parser.feed("\n<function_")
+    assert not parser.calls_complete
+    parser.feed("call>")
+    parser.feed(json.dumps(CALL) + "</function_call> Now")
+    assert parser.calls_complete
+    assert parser.calls == [CALL, CALL]
+
+
+def test_json_only_replies():
+    parser = ReplyParser(json_only=True)
+    parser.feed(json.dumps([CALL])[:10])
+    assert not parser.calls_complete
+    parser.feed(json.dumps([CALL])[10:])
+    assert parser.calls_complete and parser.calls == [CALL]
+    empty = ReplyParser(json_only=True)
+    empty.feed("[]")
+    assert empty.calls_complete and empty.calls == []
+
+
+# --- Fuzzing ---
+
+@pytest.mark.parametrize("seed", range(300))
+def test_random_replies_parse_the_same_in_any_chunking(seed):
+    rng = random.Random(seed)
+    reply, expected_text, expected_calls = random_reply(rng)
+    chunkings = {
+        "whole": [],
+        "chars": [1] * len(reply),
+        "random": [rng.randint(1, 12) for _ in range(len(reply))],
+    }
+    for name, sizes in chunkings.items():
+        visible, calls, text = parse(reply, sizes)
+        assert (visible, text, calls) == (expected_text, expected_text, expected_calls), (name, reply)
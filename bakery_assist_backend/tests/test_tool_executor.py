@@ -0,0 +1,40 @@
+import json
+import time
+
+from function_calling.tool_executor import ToolExecutor
+from utils import config
+
+
+def slow_tool(customer_number, seconds):
+    time.sleep(seconds)
+    return json.dumps({"slept": seconds})
+
+
+def calls(*seconds):
+    return [{"name": "slow_tool", "arguments": {"seconds": s}} for s in seconds]
+
+
+def test_queue_wait_does_not_count_towards_the_timeout(monkeypatch):
+    monkeypatch.setattr(config, "TOOL_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(config, "TOOL_QUEUE_TIMEOUT_SECONDS", 5.0)
+    executor = ToolExecutor(max_workers=1)
+    # The second call waits ~0.3 s for the only worker, then runs for 0.3 s: 0.6 s after submit
+    results = executor.execute(calls(0.3, 0.3), {"slow_tool": slow_tool}, "100001")
+    assert [r.status for r in results] == ["ok", "ok"]
+    assert all(r.latency_ms < 500 for r in results)
+
+
+def test_running_calls_still_time_out(monkeypatch):
+    monkeypatch.setattr(config, "TOOL_TIMEOUT_SECONDS", 0.1)
+    results = ToolExecutor(max_workers=1).execute(calls(0.3), {"slow_tool": slow_tool}, "100001")
+    assert results[0].status == "timeout"
+
+
+def test_calls_that_never_get_a_worker_are_cancelled(monkeypatch):
+    monkeypatch.setattr(config, "TOOL_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(config, "TOOL_QUEUE_TIMEOUT_SECONDS", 0.1)
+    executor = ToolExecutor(max_workers=1)
+    busy = executor._pool.submit(time.sleep, 0.5)  # another request holds the only worker
+    results = executor.execute(calls(0.01), {"slow_tool": slow_tool}, "100001")
+    assert [r.status for r in results] == ["queue_timeout"]
+    busy.result()
@@ -0,0 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from utils import config
+
+# --- Per-event-loop Pool ---
+# asyncpg pools are bound to the loop that created them, so keep one per loop. The entry is
+# the task creating the pool, stored before it is awaited, so concurrent first requests on a
+# loop share one pool instead of each opening (and leaking) their own.
+_pools = {}
+
+
+def _create_pool():
+    return asyncpg.create_pool(
+        host=config.DB_HOST,
+        database=config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        min_size=config.DB_POOL_MIN_SIZE,
+        max_size=config.DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=config.DB_POOL_HEALTH_CHECK_INTERVAL * 10,
+    )
+
+
+async def get_async_pool():
+    """Returns the asyncpg pool for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    pool_task = _pools.get(loop)
+    if pool_task is None:
+        pool_task = _pools[loop] = loop.create_task(_create_pool())
+    try:
+        # Shielded: a cancelled request must not cancel the creation other requests wait for
+        return await asyncio.shield(pool_task)
+    except Exception:
+        if _pools.get(loop) is pool_task and pool_task.done():
+            del _pools[loop]  # let the next request try again
+        raise
+
+
+async def close_async_pool():
+    """Closes the pool belonging to the running event loop, if any."""
+    pool_task = _pools.pop(asyncio.get_running_loop(), None)
+    if pool_task is None:
+        return
+    try:
+        pool = await pool_task
+    except Exception:
+        return  # creation failed: nothing to close
+    await pool.close()
+
+
+class AsyncDataBaseConnection:
+    # --- Pooled Connection Helper ---
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        """
+        Async context manager that borrows an asyncpg connection from the loop's pool.
+
+        Usage:
+            async with AsyncDataBaseConnection().connection() as conn:
+                rows = await conn.fetch(...)
+
+        Raises:
+            asyncpg.PostgresError, OSError, asyncio.TimeoutError: If no connection could be borrowed.
+        """
+        timeout = config.DB_POOL_CHECKOUT_TIMEOUT if timeout is None else timeout
+        pool = await get_async_pool()
+        async with pool.acquire(timeout=timeout) as conn:
+            yield conn
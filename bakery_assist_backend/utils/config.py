@@ -0,0 +1,144 @@
+import json
+import os
+
+# --- Environment Helpers ---
+
+def _env_str(name, default):
+    return os.environ.get(name, default)
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _env_json(name, default):
+    value = os.environ.get(name)
+    return json.loads(value) if value not in (None, "") else default
+
+
+# --- Database Configuration ---
+DB_HOST = _env_str("BAKERY_DB_HOST", "localhost")
+DB_NAME = _env_str("BAKERY_DB_NAME", "bakery_erp_sim")
+DB_USER = _env_str("BAKERY_DB_USER", "postgres")
+DB_PASSWORD = _env_str("BAKERY_DB_PASSWORD", "1331")
+
+# --- Database Pool Configuration ---
+DB_POOL_MIN_SIZE = _env_int("BAKERY_DB_POOL_MIN_SIZE", 2)
+DB_POOL_MAX_SIZE = _env_int("BAKERY_DB_POOL_MAX_SIZE", 10)
+DB_POOL_CHECKOUT_TIMEOUT = _env_float("BAKERY_DB_POOL_CHECKOUT_TIMEOUT", 5.0)  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_INTERVAL = _env_float("BAKERY_DB_POOL_HEALTH_CHECK_INTERVAL", 30.0)  # ping connections idle longer than this
+
+# --- Customer List Configuration ---
+CUSTOMERS_PAGE_DEFAULT_LIMIT = _env_int("BAKERY_CUSTOMERS_PAGE_DEFAULT_LIMIT", 50)
+CUSTOMERS_PAGE_MAX_LIMIT = _env_int("BAKERY_CUSTOMERS_PAGE_MAX_LIMIT", 500)
+
+# --- Customer Index Configuration ---
+CUSTOMER_INDEX_ENABLED = _env_bool("BAKERY_CUSTOMER_INDEX_ENABLED", True)  # validate customer numbers from memory
+CUSTOMER_INDEX_MAX_BYTES = _env_int("BAKERY_CUSTOMER_INDEX_MAX_BYTES", 64 * 1024 * 1024)  # 1 bit per id, ~512M ids
+CUSTOMER_INDEX_REFRESH_SECONDS = _env_float("BAKERY_CUSTOMER_INDEX_REFRESH_SECONDS", 30.0)  # delta poll on updated_at
+CUSTOMER_INDEX_FULL_RELOAD_SECONDS = _env_float("BAKERY_CUSTOMER_INDEX_FULL_RELOAD_SECONDS", 3600.0)  # 0 = never
+CUSTOMER_INDEX_VERIFY_MISSES = _env_bool("BAKERY_CUSTOMER_INDEX_VERIFY_MISSES", True)  # confirm unknown ids in the DB
+
+# --- Ollama Configuration ---
+OLLAMA_BASE_URL = _env_str("BAKERY_OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = _env_str("BAKERY_OLLAMA_MODEL", "deepseek-r1")  # Make sure this model is pulled in Ollama
+OLLAMA_OPTIONS = _env_json("BAKERY_OLLAMA_OPTIONS", {})  # e.g. '{"temperature": 0.2}'
+OLLAMA_POOL_SIZE = _env_int("BAKERY_OLLAMA_POOL_SIZE", 10)  # keep-alive connections kept open to Ollama
+OLLAMA_CONNECT_TIMEOUT = _env_float("BAKERY_OLLAMA_CONNECT_TIMEOUT", 3.0)
+OLLAMA_READ_TIMEOUT = _env_float("BAKERY_OLLAMA_READ_TIMEOUT", 90.0)
+OLLAMA_CONNECT_RETRIES = _env_int("BAKERY_OLLAMA_CONNECT_RETRIES", 2)  # retried on connection errors only
+OLLAMA_RETRY_BACKOFF = _env_float("BAKERY_OLLAMA_RETRY_BACKOFF", 0.25)  # seconds, doubled per retry
+OLLAMA_KEEP_ALIVE = _env_str("BAKERY_OLLAMA_KEEP_ALIVE", "30m")  # keep the model loaded between chats
+OLLAMA_EMBED_MODEL = _env_str("BAKERY_OLLAMA_EMBED_MODEL", "nomic-embed-text")  # used by the semantic response cache
+
+# --- LLM Dispatch Configuration ---
+# Ollama generates OLLAMA_NUM_PARALLEL replies at once; keep BAKERY_LLM_MAX_CONCURRENCY equal to it (0 disables the limit)
+LLM_MAX_CONCURRENCY = _env_int("BAKERY_LLM_MAX_CONCURRENCY", _env_int("OLLAMA_NUM_PARALLEL", 4))
+LLM_MAX_QUEUE = _env_int("BAKERY_LLM_MAX_QUEUE", 64)  # calls allowed to wait for a slot; more are refused at once
+LLM_QUEUE_TIMEOUT = _env_float("BAKERY_LLM_QUEUE_TIMEOUT", 15.0)  # seconds a call may wait for a slot before a 503
+LLM_RETRY_AFTER_SECONDS = _env_int("BAKERY_LLM_RETRY_AFTER_SECONDS", 5)  # Retry-After sent with those 503s
+LLM_SINGLE_FLIGHT = _env_bool("BAKERY_LLM_SINGLE_FLIGHT", True)  # identical prompts in flight share one Ollama call
+
+# --- Response Cache Configuration ---
+RESPONSE_CACHE_ENABLED = _env_bool("BAKERY_RESPONSE_CACHE_ENABLED", True)
+RESPONSE_CACHE_TTL = _env_float("BAKERY_RESPONSE_CACHE_TTL", 600.0)  # seconds an entry stays valid
+RESPONSE_CACHE_MAX_BYTES = _env_int("BAKERY_RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+RESPONSE_CACHE_SEMANTIC = _env_bool("BAKERY_RESPONSE_CACHE_SEMANTIC", False)  # also match paraphrases via embeddings
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = _env_float("BAKERY_RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.92)  # cosine similarity
+
+# --- Conversation Memory Configuration ---
+CONVERSATION_MEMORY_ENABLED = _env_bool("BAKERY_CONVERSATION_MEMORY_ENABLED", True)  # send earlier turns of the session
+CONVERSATION_MAX_TURNS = _env_int("BAKERY_CONVERSATION_MAX_TURNS", 6)  # turns kept verbatim; older ones are summarized
+CONVERSATION_MAX_TOKENS = _env_int("BAKERY_CONVERSATION_MAX_TOKENS", 1200)  # estimated tokens of history per prompt
+CONVERSATION_SUMMARY_MAX_TOKENS = _env_int("BAKERY_CONVERSATION_SUMMARY_MAX_TOKENS", 300)  # oldest summary lines go first
+CONVERSATION_TTL_SECONDS = _env_float("BAKERY_CONVERSATION_TTL_SECONDS", 1800.0)  # idle sessions are dropped after this
+CONVERSATION_MAX_SESSIONS = _env_int("BAKERY_CONVERSATION_MAX_SESSIONS", 2000)  # sessions kept in memory
+CONVERSATION_MAX_BYTES = _env_int("BAKERY_CONVERSATION_MAX_BYTES", 32 * 1024 * 1024)
+CONVERSATION_SPILL = _env_str("BAKERY_CONVERSATION_SPILL", "sqlite")  # where evicted sessions go: sqlite, postgres or none
+CONVERSATION_SPILL_PATH = _env_str("BAKERY_CONVERSATION_SPILL_PATH", "conversation_sessions.sqlite3")
+
+# --- Tool Result Cache Configuration ---
+TOOL_CACHE_ENABLED = _env_bool("BAKERY_TOOL_CACHE_ENABLED", True)
+TOOL_CACHE_DEFAULT_TTL = _env_float("BAKERY_TOOL_CACHE_DEFAULT_TTL", 60.0)  # seconds, unless a tool sets its own
+TOOL_CACHE_MAX_BYTES = _env_int("BAKERY_TOOL_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+
+# --- Intent Router Configuration ---
+INTENT_ROUTER_ENABLED = _env_bool("BAKERY_INTENT_ROUTER_ENABLED", True)
+INTENT_ROUTER_THRESHOLD = _env_float("BAKERY_INTENT_ROUTER_THRESHOLD", 0.8)  # below this the LLM decides
+INTENT_MODEL_PATH = _env_str("BAKERY_INTENT_MODEL_PATH", "")  # optional pickled TF-IDF + logistic regression pipeline
+INTENT_LOG_PATH = _env_str("BAKERY_INTENT_LOG_PATH", "")  # JSONL of (message, tool) pairs for training, empty = off
+
+# --- Invoice Analytics Configuration ---
+ANALYTICS_REFRESH_ON_READ = _env_bool("BAKERY_ANALYTICS_REFRESH_ON_READ", True)  # recompute a dirty customer before answering
+ANALYTICS_BACKGROUND_REFRESH = _env_bool("BAKERY_ANALYTICS_BACKGROUND_REFRESH", True)
+ANALYTICS_REFRESH_SECONDS = _env_float("BAKERY_ANALYTICS_REFRESH_SECONDS", 60.0)  # background drain interval without notifications
+ANALYTICS_REFRESH_BATCH = _env_int("BAKERY_ANALYTICS_REFRESH_BATCH", 25)  # dirty customers refreshed per transaction (each holds its row lock until commit)
+
+# --- Invoice Details Configuration ---
+INVOICE_DETAILS_MAX_ITEMS = _env_int("BAKERY_INVOICE_DETAILS_MAX_ITEMS", 20)  # line items returned per invoice
+INVOICE_DETAILS_MAX_INVOICES = _env_int("BAKERY_INVOICE_DETAILS_MAX_INVOICES", 5)  # invoices per multi-invoice call
+
+# --- Tool Execution Configuration ---
+TOOL_EXECUTOR_MAX_WORKERS = _env_int("BAKERY_TOOL_EXECUTOR_MAX_WORKERS", 4)  # tool calls run concurrently per process
+TOOL_TIMEOUT_SECONDS = _env_float("BAKERY_TOOL_TIMEOUT_SECONDS", 10.0)  # default per-tool timeout
+TOOL_TIMEOUTS = _env_json("BAKERY_TOOL_TIMEOUTS", {})  # per-tool overrides, e.g. '{"get_customer_invoices": 5}'
+TOOL_QUEUE_TIMEOUT_SECONDS = _env_float("BAKERY_TOOL_QUEUE_TIMEOUT_SECONDS", 10.0)  # wait for a free worker before a call is given up
+MAX_TOOL_CALLS_PER_TURN = _env_int("BAKERY_MAX_TOOL_CALLS_PER_TURN", 5)
+TOOL_MODULES = _env_json("BAKERY_TOOL_MODULES", [])  # extra modules with @tool declarations, imported on first use
+
+# --- Tool Result Compaction Configuration ---
+TOOL_RESULT_COMPACTION_ENABLED = _env_bool("BAKERY_TOOL_RESULT_COMPACTION_ENABLED", True)  # render results as compact text
+TOOL_RESULT_MAX_TOKENS = _env_int("BAKERY_TOOL_RESULT_MAX_TOKENS", 800)  # estimated tokens per tool result in the prompt
+TOOL_RESULTS_MAX_TOKENS = _env_int("BAKERY_TOOL_RESULTS_MAX_TOKENS", 2000)  # shared by all results of one tool step
+TOOL_RESULT_SUMMARY_ROWS = _env_int("BAKERY_TOOL_RESULT_SUMMARY_ROWS", 20)  # longer tables are summarized
+TOOL_RESULT_SAMPLE_ROWS = _env_int("BAKERY_TOOL_RESULT_SAMPLE_ROWS", 10)  # rows kept next to a summary
+
+# --- Tool Retrieval Configuration ---
+TOOL_RETRIEVAL_ENABLED = _env_bool("BAKERY_TOOL_RETRIEVAL_ENABLED", True)  # describe only the tools relevant to the message
+TOOL_RETRIEVAL_TOP_K = _env_int("BAKERY_TOOL_RETRIEVAL_TOP_K", 3)  # tools described per message at most
+TOOL_RETRIEVAL_MIN_SCORE_RATIO = _env_float("BAKERY_TOOL_RETRIEVAL_MIN_SCORE_RATIO", 0.3)  # drop matches weaker than this share of the best
+
+# --- Agent Loop Configuration ---
+AGENT_MAX_STEPS = max(2, _env_int("BAKERY_AGENT_MAX_STEPS", 4))  # LLM calls per chat turn, including the final answer
+AGENT_MAX_TOKENS = _env_int("BAKERY_AGENT_MAX_TOKENS", 6000)  # estimated tokens of model output plus tool results fed back
+AGENT_MAX_SECONDS = _env_float("BAKERY_AGENT_MAX_SECONDS", 60.0)  # wall clock after which the loop stops requesting tools
+
+# --- Tool Detection Configuration ---
+# Limits for the first model step of a turn, which only has to pick tools (see helpers/tool_detection.py)
+TOOL_DETECTION_NUM_PREDICT = _env_int("BAKERY_TOOL_DETECTION_NUM_PREDICT", 0)  # token cap for the step, 0 = none
+TOOL_DETECTION_STOP = _env_bool("BAKERY_TOOL_DETECTION_STOP", False)  # stop at the first </function_call> (drops later calls)
+TOOL_DETECTION_THINK = _env_bool("BAKERY_TOOL_DETECTION_THINK", False)  # false sends "think": false: no reasoning chain before the calls
+TOOL_DETECTION_JSON = _env_bool("BAKERY_TOOL_DETECTION_JSON", False)  # constrain the step to a JSON array of calls; no-tool messages then take a second, unconstrained call
+
+# --- Logging Configuration ---
+LOG_LEVEL = _env_str("BAKERY_LOG_LEVEL", "INFO")  # DEBUG adds per-call detail (prompts sent, parsed calls, tool arguments)
+LOG_FORMAT = _env_str("BAKERY_LOG_FORMAT", "text")  # "text" or "json" (one object per line)
@@ -1,16 +1,261 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from utils import config
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# --- Pool Metrics ---
+POOL_WAIT_SECONDS = METRICS.histogram("db_pool_wait_seconds", "Time spent waiting to borrow a pooled connection")
+POOL_CHECKOUTS = METRICS.counter("db_pool_checkouts_total", "Connections borrowed from the pool")
+POOL_TIMEOUTS = METRICS.counter("db_pool_checkout_timeouts_total", "Borrow attempts that timed out")
+POOL_DISCARDED = METRICS.counter("db_pool_discarded_total", "Connections dropped because they were broken")
+POOL_IN_USE = METRICS.gauge("db_pool_connections_in_use", "Connections currently borrowed")
+POOL_OPEN = METRICS.gauge("db_pool_connections_open", "Connections currently open (idle + borrowed)")
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no pooled connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    Keeps between `min_size` and `max_size` open connections. Borrowers wait up to
+    `checkout_timeout` seconds for a free connection, and connections that sat idle
+    longer than `health_check_interval` are pinged before being handed out.
+    """
+
+    def __init__(self, min_size, max_size, checkout_timeout, health_check_interval, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+        self._idle = deque()  # (connection, returned_at) pairs, most recently used on the right
+        self._size = 0        # open connections, idle + borrowed
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def prefill(self):
+        """Opens connections until `min_size` are available. Errors are reported, not raised."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                with self._cond:
+                    self._size -= 1
+                logger.error("Database pool prefill error: %s", e)
+                return
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                POOL_OPEN.set(self._size)
+                self._cond.notify()
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _drop(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            POOL_OPEN.set(self._size)
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Borrows a connection, opening a new one if the pool has spare capacity."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("Connection pool is closed")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        POOL_TIMEOUTS.inc()
+                        raise PoolTimeoutError(f"No database connection available within {timeout:.1f}s")
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                POOL_DISCARDED.inc()
+                self._drop(conn)
+                continue
+
+            POOL_WAIT_SECONDS.observe(time.monotonic() - started)
+            POOL_CHECKOUTS.inc()
+            POOL_IN_USE.inc()
+            POOL_OPEN.set(self._size)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a borrowed connection. Broken or discarded connections are closed instead."""
+        POOL_IN_USE.dec()
+        if not discard and not conn.closed:
+            try:
+                # Never hand out a connection with a transaction still open
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            POOL_DISCARDED.inc()
+            self._drop(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                POOL_OPEN.set(self._size)
+                conn.close()
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Borrows a connection for the duration of a `with` block.
+        Commits on success, rolls back on error, and always returns the connection to the pool.
+        """
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        """Closes idle connections and stops handing out new ones."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._size -= 1
+            POOL_OPEN.set(self._size)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+# --- Process-wide Pool ---
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                min_size=config.DB_POOL_MIN_SIZE,
+                max_size=config.DB_POOL_MAX_SIZE,
+                checkout_timeout=config.DB_POOL_CHECKOUT_TIMEOUT,
+                health_check_interval=config.DB_POOL_HEALTH_CHECK_INTERVAL,
+                host=config.DB_HOST,
+                database=config.DB_NAME,
+                user=config.DB_USER,
+                password=config.DB_PASSWORD,
+            )
+            _pool_pid = pid
+            _pool.prefill()
+    return _pool
+
 
 class DataBaseConnection:
     def __init__(self):
-        # Database connection details - MODIFY THESE
-        self.DB_HOST = "localhost"
-        self.DB_NAME = "bakery_erp_sim" # Use the database name you created
-        self.DB_USER = "postgres"       # Your PostgreSQL username
-        self.DB_PASSWORD = "1331"       # Your PostgreSQL password
+        # Database connection details come from utils/config.py (overridable via environment)
+        self.DB_HOST = config.DB_HOST
+        self.DB_NAME = config.DB_NAME
+        self.DB_USER = config.DB_USER
+        self.DB_PASSWORD = config.DB_PASSWORD
+
+    # --- Pooled Connection Helper ---
+    def connection(self, timeout=None):
+        """
+        Context manager that borrows a connection from the process-wide pool.
+
+        Usage:
+            with DataBaseConnection().connection() as conn:
+                ...
+
+        Raises:
+            psycopg2.Error: If no connection could be opened or borrowed in time.
+        """
+        return get_pool().connection(timeout)
 
     # --- Database Connection Helper ---
     def get_db_connection(self):
-        """Establishes and returns a database connection."""
+        """Establishes and returns a dedicated (unpooled) database connection."""
         try:
             conn = psycopg2.connect(
                 host=self.DB_HOST,
@@ -21,6 +266,6 @@ class DataBaseConnection:
             return conn
         except psycopg2.Error as e:
             # Log the error details somewhere accessible to the server admin
-            print(f"Database connection error: {e}")
+            logger.error("Database connection error: %s", e)
             # In a real app, you might raise a custom exception or handle this differently
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,141 @@
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+from utils import config
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Channel written to by the triggers in bakery_assist_data/invoice_change_notify.sql.
+# The payload is the customer_pk whose invoices or invoice items changed.
+INVOICE_CHANGES_CHANNEL = "invoice_changes"
+# Written to by bakery_assist_data/customer_change_notify.sql: '+<customer_pk>' on insert, '-<customer_pk>' on delete.
+CUSTOMER_CHANGES_CHANNEL = "customer_changes"
+
+NOTIFICATIONS_RECEIVED = METRICS.counter("db_notifications_received_total", "LISTEN/NOTIFY messages received")
+
+
+class DatabaseNotificationListener:
+    """
+    Background LISTEN loop on a dedicated (unpooled) connection.
+
+    Subscribers are called from the listener thread with the notification payload,
+    so they must be quick and thread-safe. The connection is re-established with
+    backoff if it drops. Notifications sent while it was down are lost, so each
+    subscriber may also register an `on_connect` callback, run every time LISTEN
+    succeeds, to drop whatever state those notifications would have invalidated.
+    """
+
+    def __init__(self, channel, poll_interval=5.0, reconnect_delay=5.0):
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._subscribers = []
+        self._connect_callbacks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback, on_connect=None):
+        """
+        Registers `callback(payload)` to run for every notification on the channel.
+
+        Args:
+            on_connect (callable): Called without arguments after every (re)connect, once
+                LISTEN is in place; e.g. a cache's clear().
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            if on_connect is not None:
+                self._connect_callbacks.append(on_connect)
+
+    def start(self):
+        """Starts the listener thread once; later calls are no-ops."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"listen-{self.channel}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _dispatch(self, payload):
+        NOTIFICATIONS_RECEIVED.inc(channel=self.channel)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error("Error in '%s' notification subscriber: %s", self.channel, e)
+
+    def _connected(self):
+        with self._lock:
+            callbacks = list(self._connect_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error in '%s' connect subscriber: %s", self.channel, e)
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(
+                    host=config.DB_HOST,
+                    database=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD
+                )
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {self.channel};")
+                logger.info("Listening for '%s' notifications.", self.channel)
+                self._connected()
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+
+            except (psycopg2.Error, OSError) as e:
+                logger.error("Notification listener error on '%s': %s", self.channel, e)
+                time.sleep(self.reconnect_delay)
+            finally:
+                if conn:
+                    conn.close()
+
+
+# --- Shared Invoice Change Listener ---
+_invoice_listener = None
+_invoice_listener_lock = threading.Lock()
+
+def get_invoice_change_listener():
+    """Returns the process-wide listener for invoice/invoice item changes (not started)."""
+    global _invoice_listener
+    with _invoice_listener_lock:
+        if _invoice_listener is None:
+            _invoice_listener = DatabaseNotificationListener(INVOICE_CHANGES_CHANNEL)
+        return _invoice_listener
+
+
+# --- Shared Customer Change Listener ---
+_customer_listener = None
+_customer_listener_lock = threading.Lock()
+
+def get_customer_change_listener():
+    """Returns the process-wide listener for customer inserts/deletes (not started)."""
+    global _customer_listener
+    with _customer_listener_lock:
+        if _customer_listener is None:
+            _customer_listener = DatabaseNotificationListener(CUSTOMER_CHANGES_CHANNEL)
+        return _customer_listener
@@ -0,0 +1,64 @@
+"""
+Leveled logging for the backend.
+
+app.py and async_app.py call configure_logging() once at startup. Modules log through
+logging.getLogger(__name__) with %-style arguments, so a disabled level costs one
+level check and no string formatting; anything expensive to build (JSON dumps of
+calls or prompts) is additionally guarded with logger.isEnabledFor(). Every record
+carries the id of the request it was emitted for, or "-" outside of a request.
+"""
+import json
+import logging
+import sys
+
+from utils import config
+from utils.tracing import current_request_id
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` (from the current RequestTrace) to every record."""
+
+    def filter(self, record):
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+_configured = False
+
+def configure_logging(level=None, log_format=None):
+    """
+    Installs one stream handler on the root logger (idempotent).
+
+    Args:
+        level (str): Level name; defaults to BAKERY_LOG_LEVEL.
+        log_format (str): "text" or "json"; defaults to BAKERY_LOG_FORMAT.
+    """
+    global _configured
+    if _configured:
+        return
+    log_format = (config.LOG_FORMAT if log_format is None else log_format).lower()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel((config.LOG_LEVEL if level is None else level).upper())
+    _configured = True
@@ -0,0 +1,158 @@
+import math
+import threading
+
+# --- Default Histogram Buckets (seconds) ---
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class Counter:
+    """A monotonically increasing value, optionally split by labels."""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Cumulative bucketed observations (e.g. latencies), optionally split by labels."""
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return series[-1] if series else 0
+
+    def total(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return series[-2] if series else 0.0
+
+    def samples(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+
+class MetricsRegistry:
+    """Process-wide registry so every module reports into the same set of metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, description, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric '{name}' already registered as {type(metric).__name__}")
+            return metric
+
+    def counter(self, name, description=""):
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name, description=""):
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name, description="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def all_metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4), for GET /metrics."""
+        lines = []
+        for metric in sorted(self.all_metrics(), key=lambda m: m.name):
+            kind = "histogram" if isinstance(metric, Histogram) else "gauge" if isinstance(metric, Gauge) else "counter"
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.description)}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for key, value in sorted(metric.samples().items()):
+                if kind != "histogram":
+                    lines.append(f"{metric.name}{_render_labels(key)} {_render_value(value)}")
+                    continue
+                for bound, count in zip(metric.buckets, value):
+                    lines.append(f"{metric.name}_bucket{_render_labels(key, le=_render_value(bound))} {count}")
+                lines.append(f'{metric.name}_bucket{_render_labels(key, le="+Inf")} {value[-1]}')
+                lines.append(f"{metric.name}_sum{_render_labels(key)} {_render_value(value[-2])}")
+                lines.append(f"{metric.name}_count{_render_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+# --- Prometheus Text Format ---
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _render_labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+def _render_value(value):
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return repr(value)
+        return "NaN" if math.isnan(value) else "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if isinstance(value, bool) else str(value)
+
+
+# Shared registry instance
+METRICS = MetricsRegistry()
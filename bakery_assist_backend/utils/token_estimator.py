@@ -0,0 +1,32 @@
+import re
+
+# Approximates a BPE tokenizer (deepseek-r1/Qwen style) without loading one:
+# letters in runs of up to ~5 per token, every digit and punctuation mark on its own,
+# whitespace folded into the following token. Close enough to budget prompts with;
+# it errs on the high side for number-heavy text, which is the safe direction.
+_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+LETTERS_PER_TOKEN = 5
+
+
+def estimate_text_tokens(text):
+    """Estimated number of model tokens in `text`."""
+    tokens = 0
+    for match in _PIECE_PATTERN.finditer(text or ""):
+        piece = match.group()
+        tokens += -(-len(piece) // LETTERS_PER_TOKEN) if piece[0].isalpha() else 1
+    return tokens
+
+
+def truncate_to_tokens(text, max_tokens, marker=" ...[truncated]"):
+    """Cuts `text` so that it (plus `marker`) fits in `max_tokens` estimated tokens."""
+    if estimate_text_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - estimate_text_tokens(marker))
+    low, high = 0, len(text)
+    while low < high:  # longest prefix within budget
+        middle = (low + high + 1) // 2
+        if estimate_text_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + marker
@@ -0,0 +1,184 @@
+"""
+Request-scoped tracing for the chat pipeline.
+
+A RequestTrace is started per HTTP request with a request id (the client's X-Request-ID
+header, or a new one) and made current through a context variable, so each stage records
+its span without the trace being passed down the call chain:
+
+    with span("customer_verification"):
+        ...
+
+A span is a stage name, its start offset and duration within the request, its parent
+span and free-form attributes (tool name, Ollama token counts, ...). Span durations are
+also observed in the chat_stage_seconds histogram, labelled by stage (and tool), whether
+or not a trace is current. Context variables follow asyncio tasks on their own; work
+handed to a thread pool must be wrapped with in_current_context().
+"""
+import contextvars
+import itertools
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = METRICS.histogram("chat_stage_seconds", "Duration of request stages, by stage (and tool)")
+REQUEST_SECONDS = METRICS.histogram("http_request_seconds", "HTTP request duration, by route, method and status")
+
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a request."""
+    __slots__ = ("span_id", "name", "parent_id", "started", "ended", "attributes")
+
+    def __init__(self, span_id, name, parent_id, attributes):
+        self.span_id = span_id
+        self.name = name
+        self.parent_id = parent_id
+        self.started = time.perf_counter()
+        self.ended = None
+        self.attributes = attributes
+
+    @property
+    def seconds(self):
+        return (self.ended if self.ended is not None else time.perf_counter()) - self.started
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self, origin):
+        return {"id": self.span_id, "name": self.name, "parent": self.parent_id,
+                "start_ms": round((self.started - origin) * 1000, 2), "duration_ms": round(self.seconds * 1000, 2),
+                **self.attributes}
+
+
+class RequestTrace:
+    """The spans of one request, in the order they finished."""
+
+    def __init__(self, request_id=None, route="unknown", method=""):
+        valid = isinstance(request_id, str) and _REQUEST_ID_PATTERN.fullmatch(request_id)
+        self.request_id = request_id if valid else uuid.uuid4().hex[:16]
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self.finished = False
+
+    def new_span(self, name, parent, attributes):
+        return Span(next(self._ids), name, parent.span_id if parent is not None else None, attributes)
+
+    def stage_totals(self):
+        """Milliseconds per stage, summed over its spans (nested stages are counted in their parent too)."""
+        totals = {}
+        for finished in self.spans:
+            totals[finished.name] = totals.get(finished.name, 0.0) + finished.seconds * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def as_dict(self):
+        return {
+            "request_id": self.request_id,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": [finished.as_dict(self.started) for finished in sorted(self.spans, key=lambda s: s.started)],
+        }
+
+    def finish(self, status=0):
+        """
+        Observes the request duration and logs one line with the per-stage breakdown (once).
+        Streamed responses call this when the body is done, not when the headers are sent.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        seconds = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(seconds, route=self.route, method=self.method, status=str(status))
+        if self.spans and logger.isEnabledFor(logging.INFO):
+            breakdown = ", ".join(f"{name} {ms:.1f}" for name, ms in self.stage_totals().items())
+            logger.info("%s %s %s in %.1f ms (%s)", self.method, self.route, status, seconds * 1000, breakdown)
+
+
+def start_request(request_id=None, route="unknown", method=""):
+    """
+    Starts a trace and makes it current for the calling context.
+
+    Args:
+        request_id (str): The client's X-Request-ID; a new id is generated if missing or malformed.
+        route (str): Route template (not the raw path, to keep metric labels bounded).
+        method (str): HTTP method.
+
+    Returns:
+        RequestTrace: The new current trace.
+    """
+    trace = RequestTrace(request_id, route, method)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_request_id():
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def _reset(variable, token):
+    try:
+        variable.reset(token)
+    except ValueError:  # token from another context (e.g. a generator resumed elsewhere)
+        variable.set(None)
+
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` current inside the block, e.g. while a streamed response body is produced."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _reset(_current_trace, token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the block as stage `name`; yields the Span so attributes can be added as they become known."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    current = trace.new_span(name, parent, attributes) if trace is not None else Span(0, name, None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.ended = time.perf_counter()
+        _reset(_current_span, token)
+        if "tool" in current.attributes:
+            STAGE_SECONDS.observe(current.seconds, stage=name, tool=str(current.attributes["tool"]))
+        else:
+            STAGE_SECONDS.observe(current.seconds, stage=name)
+        if trace is not None:
+            trace.spans.append(current)
+
+
+def annotate(**attributes):
+    """Adds attributes to the innermost open span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def in_current_context(function):
+    """Wraps `function` to run in a copy of the caller's context (trace and parent span), for thread pools."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
@@ -0,0 +1,411 @@
+"""
+Bulk synthetic data generator for load testing (millions of invoices).
+
+generate_bakery_data.py inserts one row per statement, commits after every row and
+updates each invoice's totals in a second pass. This script instead:
+  - builds rows in memory-bounded batches and loads them with COPY FROM STDIN,
+  - computes invoice totals from the items before the invoice row is written,
+  - splits customers into contiguous ranges loaded by parallel worker processes,
+  - drops the secondary indexes during the load and rebuilds them afterwards.
+
+Keys come from block ID allocators (see id_allocator.py), so workers never need to
+coordinate or read back generated IDs. Every customer's rows are drawn from an RNG
+seeded with (seed, customer key), so a seed reproduces every table byte for byte
+regardless of the number of workers or the batch sizes. A dataset manifest with the
+seed, parameters, row counts and checksums is written after the load.
+
+Example (about 1.3 million invoices):
+    python bulk_generate_bakery_data.py --customers 200000 --products 500 \\
+        --max-invoices-per-customer 12 --workers 8 --seed 42 --truncate
+
+Reproduce a dataset from its manifest:
+    python bulk_generate_bakery_data.py --from-manifest dataset_manifest.json --truncate
+"""
+import argparse
+import datetime
+import decimal
+import io
+import multiprocessing
+import random
+import time
+
+from dataset_manifest import build_manifest, load_manifest, write_manifest
+from generate_bakery_data import (
+    CUSTOMER_GROUPS,
+    connect_to_db,
+    fake,
+    fake_invoice_terms,
+    fake_item_quantity,
+    fake_product_fields,
+    invoice_totals,
+    seed_generators,
+)
+from id_allocator import BlockIdAllocator
+
+GENERATOR = "bulk_generate_bakery_data.py"  # recorded in the manifest; --from-manifest only accepts its own
+
+# --- Table Layout ---
+COPY_COLUMNS = {
+    "customers": ("customer_pk", "customer_number", "customer_name", "address_street", "address_city",
+                  "address_state", "address_zip", "email", "phone_number", "customer_group"),
+    "products": ("product_pk", "material_number", "product_name", "product_description", "base_unit_of_measure",
+                 "product_category", "unit_price", "is_active"),
+    "invoices": ("invoice_pk", "invoice_number", "customer_fk", "invoice_date", "due_date", "net_amount",
+                 "tax_amount", "total_amount", "currency", "status", "payment_terms"),
+    "invoice_items": ("invoice_item_pk", "invoice_fk", "product_fk", "item_number", "quantity", "unit_of_measure",
+                      "unit_price", "item_total_amount", "description"),
+}
+LOAD_ORDER = ("customers", "invoices", "invoice_items")  # foreign keys: parents first
+
+SERIAL_KEYS = {"customers": "customer_pk", "products": "product_pk",
+               "invoices": "invoice_pk", "invoice_items": "invoice_item_pk"}
+
+# Plain secondary indexes (tables.sql, customer_list_indexes.sql, customer_change_notify.sql); the
+# ones present are dropped for the load and rebuilt once afterwards from their original definitions.
+# (UNIQUE constraints stay in place: they guard the generated business keys.)
+SECONDARY_INDEXES = (
+    "idx_customer_number", "idx_customer_name_trgm", "idx_customer_group_pk", "idx_customer_updated_at",
+    "idx_material_number", "idx_product_category",
+    "idx_invoice_number", "idx_invoice_customer_fk", "idx_invoice_status",
+    "idx_invoice_item_invoice_fk", "idx_invoice_item_product_fk",
+)
+
+MAX_CUSTOMERS = 999_999  # customer_number is CUST + 6 digits (VARCHAR(10))
+MAX_PRODUCTS = 99_999  # material_number is MAT-XXX- + 5 digits
+MAX_SERIAL = 2_147_483_647  # SERIAL columns are 32-bit
+
+
+# --- Key Layout ---
+# Customer k (1-based) owns block k-1 of the invoice key space, and invoice i owns block
+# i-1 of the item key space:
+#   invoice_pk      = (customer_pk - 1) * max_invoices + n + 1     (n = 0..max_invoices-1)
+#   invoice_item_pk = (invoice_pk - 1) * max_items + n + 1         (n = 0..max_items-1)
+# Business keys (CUST..., MAT-..., INV...) are derived from these keys, so they are unique too.
+
+class KeyLayout:
+    """The block allocators for one dataset shape."""
+
+    def __init__(self, max_invoices, max_items):
+        self.invoices = BlockIdAllocator(max_invoices)
+        self.items = BlockIdAllocator(max_items)
+
+    def invoice_pk(self, customer_pk, index):
+        return self.invoices.id_for(customer_pk - 1, index)
+
+    def invoice_item_pk(self, invoice_pk, index):
+        return self.items.id_for(invoice_pk - 1, index)
+
+    def max_item_pk(self, num_customers):
+        return self.items.max_id(self.invoices.max_id(num_customers))
+
+
+def seed_for(seed, *scope):
+    """Derives the RNG seed for one unit of work; string seeds hash the same in every process."""
+    return "/".join(str(part) for part in (seed, *scope))
+
+
+# --- COPY Helpers ---
+
+def copy_field(value):
+    """Formats one value for COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = str(value)
+    if "\\" in text or "\t" in text or "\n" in text or "\r" in text:
+        text = text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return text
+
+
+class CopyBatch:
+    """Accumulates rows per table as COPY text and writes them with COPY FROM STDIN."""
+
+    def __init__(self):
+        self.buffers = {table: io.StringIO() for table in COPY_COLUMNS}
+        self.counts = dict.fromkeys(COPY_COLUMNS, 0)
+
+    @property
+    def rows(self):
+        return sum(self.counts.values())
+
+    def add(self, table, values):
+        self.buffers[table].write("\t".join(copy_field(v) for v in values))
+        self.buffers[table].write("\n")
+        self.counts[table] += 1
+
+    def flush(self, conn, tables=LOAD_ORDER):
+        """COPYs the buffered rows in foreign-key order and commits; returns rows written per table."""
+        written = {}
+        with conn.cursor() as cur:
+            for table in tables:
+                if not self.counts[table]:
+                    continue
+                buffer = self.buffers[table]
+                buffer.seek(0)
+                cur.copy_expert(f"COPY {table} ({', '.join(COPY_COLUMNS[table])}) FROM STDIN", buffer)
+                written[table] = self.counts[table]
+        conn.commit()
+        self.buffers = {table: io.StringIO() for table in COPY_COLUMNS}
+        self.counts = dict.fromkeys(COPY_COLUMNS, 0)
+        return written
+
+
+# --- Row Generation ---
+
+def add_product_rows(batch, num_products, seed):
+    """Generates the product master data; returns the details invoice items need."""
+    seed_generators(seed_for(seed, "products"))
+    products = []
+    for product_pk in range(1, num_products + 1):
+        fields = fake_product_fields()
+        material_number = f"MAT-{fields['category'][:3].upper()}-{product_pk:05d}"
+        batch.add("products", (product_pk, material_number, fields["name"], fields["description"], fields["uom"],
+                               fields["category"], fields["price"], fields["is_active"]))
+        products.append({"pk": product_pk, "uom": fields["uom"], "price": fields["price"], "name": fields["name"]})
+    return products
+
+
+def add_customer_rows(batch, customer_pk, products, layout, seed, as_of):
+    """Generates one customer with its invoices and items, totals computed up front."""
+    seed_generators(seed_for(seed, "customer", customer_pk))
+    customer_name = fake.company() if random.random() > 0.3 else fake.name()
+    batch.add("customers", (
+        customer_pk, f"CUST{customer_pk:06d}", customer_name, fake.street_address(), fake.city(),
+        fake.state_abbr(), fake.zipcode(), f"customer{customer_pk}@{fake.free_email_domain()}",
+        fake.phone_number(), random.choice(CUSTOMER_GROUPS),
+    ))
+
+    for invoice_index in range(random.randint(1, layout.invoices.block_size)):
+        invoice_pk = layout.invoice_pk(customer_pk, invoice_index)
+        invoice_date, due_date, payment_terms, status = fake_invoice_terms(as_of)
+
+        net_amount = decimal.Decimal("0.00")
+        num_items = random.randint(1, min(layout.items.block_size, len(products)))
+        for item_index, product in enumerate(random.sample(products, num_items)):
+            quantity = fake_item_quantity(product["uom"])
+            item_total_amount = (quantity * product["price"]).quantize(decimal.Decimal("0.01"))
+            net_amount += item_total_amount
+            batch.add("invoice_items", (
+                layout.invoice_item_pk(invoice_pk, item_index), invoice_pk, product["pk"],
+                (item_index + 1) * 10, quantity, product["uom"], product["price"], item_total_amount, product["name"],
+            ))
+
+        tax_amount, total_amount = invoice_totals(net_amount)
+        batch.add("invoices", (
+            invoice_pk, f"INV{invoice_pk:010d}", customer_pk, invoice_date, due_date,
+            net_amount, tax_amount, total_amount, "USD", status, payment_terms,
+        ))
+
+
+# --- Worker Processes ---
+_worker_conn = None
+
+def _init_worker():
+    """Opens the worker's connection (RNGs are reseeded per customer, see add_customer_rows)."""
+    global _worker_conn
+    _worker_conn = connect_to_db()
+
+
+def load_customer_range(task):
+    """Generates and COPYs one contiguous customer range; returns (first, last, rows per table, seconds)."""
+    first_pk, last_pk, products, layout, seed, as_of, batch_rows = task
+    started = time.monotonic()
+    totals = dict.fromkeys(COPY_COLUMNS, 0)
+    batch = CopyBatch()
+    for customer_pk in range(first_pk, last_pk + 1):
+        add_customer_rows(batch, customer_pk, products, layout, seed, as_of)
+        if batch.rows >= batch_rows:
+            for table, count in batch.flush(_worker_conn).items():
+                totals[table] += count
+    for table, count in batch.flush(_worker_conn).items():
+        totals[table] += count
+    return first_pk, last_pk, totals, time.monotonic() - started
+
+
+def customer_ranges(num_customers, chunk_size):
+    """Splits customers 1..num_customers into contiguous (first, last) ranges, one allocator block each."""
+    chunks = BlockIdAllocator(chunk_size)
+    for block_index in range(-(-num_customers // chunk_size)):
+        block = chunks.block(block_index)
+        yield block[0], min(block[-1], num_customers)
+
+
+# --- Setup And Teardown ---
+
+def prepare_tables(conn, truncate):
+    """Empties the tables (or checks they are empty) and disables user triggers for the load."""
+    with conn.cursor() as cur:
+        if truncate:
+            # CASCADE also empties tables that reference these, e.g. the analytics summaries
+            cur.execute("TRUNCATE invoice_items, invoices, products, customers RESTART IDENTITY CASCADE")
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM customers) OR EXISTS (SELECT 1 FROM products)")
+            if cur.fetchone()[0]:
+                raise SystemExit("Tables already contain data; rerun with --truncate to replace it.")
+        # Per-row triggers (e.g. invoice and customer change notifications) would fire millions of
+        # times; the customer index picks the new customers up with its full reload instead
+        for table in LOAD_ORDER:
+            cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+    conn.commit()
+
+
+def drop_secondary_indexes(conn):
+    """Drops the secondary indexes that exist and returns their CREATE INDEX statements."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND indexname = ANY(%s)",
+            (list(SECONDARY_INDEXES),),
+        )
+        definitions = dict(cur.fetchall())
+        for index_name in definitions:
+            cur.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.commit()
+    return list(definitions.values())
+
+
+def finish_tables(conn, index_definitions):
+    """Re-enables triggers, moves the SERIAL sequences past the loaded keys, rebuilds dropped indexes and analytics."""
+    with conn.cursor() as cur:
+        for table in LOAD_ORDER:
+            cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+        for table, key in SERIAL_KEYS.items():
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{key}'), "
+                        f"COALESCE((SELECT MAX({key}) FROM {table}), 0) + 1, false)")
+        conn.commit()
+        for ddl in index_definitions:
+            cur.execute(ddl)
+        conn.commit()
+        cur.execute("ANALYZE customers, products, invoices, invoice_items")
+        conn.commit()
+        # Triggers were off during the load, so rebuild the analytics summaries (invoice_analytics.sql) in one pass
+        cur.execute("SELECT to_regprocedure('refresh_all_customer_analytics()') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT refresh_all_customer_analytics()")
+    conn.commit()
+
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else float("inf")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic bakery data with COPY.")
+    parser.add_argument("--customers", type=int, default=10_000, help="number of customers (scale factor)")
+    parser.add_argument("--products", type=int, default=200, help="number of products (scale factor)")
+    parser.add_argument("--max-invoices-per-customer", type=int, default=8,
+                        help="each customer gets 1..N invoices (scale factor)")
+    parser.add_argument("--max-items-per-invoice", type=int, default=6, help="each invoice gets 1..N items")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for reproducible data (default: random, recorded in the manifest)")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="reference date for invoice dates and statuses (YYYY-MM-DD)")
+    parser.add_argument("--from-manifest", default=None,
+                        help="take seed, scale factors and as-of date from an existing manifest")
+    parser.add_argument("--manifest", default="dataset_manifest.json", help="where to write the dataset manifest")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="parallel loader processes")
+    parser.add_argument("--chunk-customers", type=int, default=2_000,
+                        help="customers per work unit handed to a worker")
+    parser.add_argument("--batch-rows", type=int, default=50_000,
+                        help="rows buffered in memory before a COPY + commit")
+    parser.add_argument("--truncate", action="store_true", help="empty the tables before loading")
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="maintain secondary indexes during the load instead of rebuilding them afterwards")
+    args = parser.parse_args()
+
+    if args.from_manifest:
+        manifest = load_manifest(args.from_manifest)
+        if manifest.get("generator") != GENERATOR:
+            # generate_bakery_data.py draws its rows differently, so its seed would not reproduce its data here
+            parser.error(f"{args.from_manifest} was written by {manifest.get('generator')}, not {GENERATOR}")
+        parameters = manifest["parameters"]
+        args.seed = manifest["seed"]
+        args.as_of = datetime.date.fromisoformat(parameters["as_of"])
+        args.customers = parameters["customers"]
+        args.products = parameters["products"]
+        args.max_invoices_per_customer = parameters["max_invoices_per_customer"]
+        args.max_items_per_invoice = parameters["max_items_per_invoice"]
+    if args.seed is None:
+        args.seed = random.randrange(2**63)
+
+    if not 1 <= args.customers <= MAX_CUSTOMERS:
+        parser.error(f"--customers must be between 1 and {MAX_CUSTOMERS}")
+    if not 1 <= args.products <= MAX_PRODUCTS:
+        parser.error(f"--products must be between 1 and {MAX_PRODUCTS}")
+    if args.max_invoices_per_customer < 1 or args.max_items_per_invoice < 1:
+        parser.error("--max-invoices-per-customer and --max-items-per-invoice must be positive")
+    layout = KeyLayout(args.max_invoices_per_customer, args.max_items_per_invoice)
+    if layout.max_item_pk(args.customers) > MAX_SERIAL:
+        parser.error("scale factors exceed the 32-bit key space of invoice_items.invoice_item_pk")
+    return args, layout
+
+
+def dataset_parameters(args):
+    """Inputs that determine the data; together with the seed they reproduce it exactly."""
+    return {
+        "as_of": args.as_of.isoformat(),
+        "customers": args.customers,
+        "products": args.products,
+        "max_invoices_per_customer": args.max_invoices_per_customer,
+        "max_items_per_invoice": args.max_items_per_invoice,
+    }
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    args, layout = parse_args()
+    print(f"Bulk generating {args.customers} customers, {args.products} products, "
+          f"1..{args.max_invoices_per_customer} invoices per customer with {args.workers} worker(s) "
+          f"(seed {args.seed}, as of {args.as_of})...")
+
+    connection = connect_to_db()
+    if not connection:
+        raise SystemExit("Failed to connect to the database. Aborting.")
+
+    started = time.monotonic()
+    prepare_tables(connection, args.truncate)
+    index_definitions = [] if args.keep_indexes else drop_secondary_indexes(connection)
+
+    try:
+        # Products are small and referenced by every worker: load them first, in this process
+        product_batch = CopyBatch()
+        products = add_product_rows(product_batch, args.products, args.seed)
+        product_batch.flush(connection, tables=("products",))
+
+        totals = dict.fromkeys(COPY_COLUMNS, 0)
+        totals["products"] = len(products)
+        tasks = [(first_pk, last_pk, products, layout, args.seed, args.as_of, args.batch_rows)
+                 for first_pk, last_pk in customer_ranges(args.customers, args.chunk_customers)]
+
+        load_started = time.monotonic()
+        with multiprocessing.Pool(args.workers, initializer=_init_worker) as pool:
+            for first_pk, last_pk, counts, seconds in pool.imap_unordered(load_customer_range, tasks):
+                for table, count in counts.items():
+                    totals[table] += count
+                loaded = sum(totals.values())
+                print(f"  ...customers {first_pk}-{last_pk}: {sum(counts.values())} rows in {seconds:.1f}s "
+                      f"({_rate(sum(counts.values()), seconds):,.0f} rows/s); "
+                      f"{loaded:,} rows total, {_rate(loaded, time.monotonic() - load_started):,.0f} rows/s overall")
+        load_seconds = time.monotonic() - load_started
+    finally:
+        index_started = time.monotonic()
+        finish_tables(connection, index_definitions)
+        index_seconds = time.monotonic() - index_started
+
+    manifest_started = time.monotonic()
+    manifest = build_manifest(connection, GENERATOR, args.seed, dataset_parameters(args))
+    write_manifest(args.manifest, manifest)
+    manifest_seconds = time.monotonic() - manifest_started
+    connection.close()
+
+    total_rows = sum(totals.values())
+    total_seconds = time.monotonic() - started
+    print("\n--------------------------------------------------")
+    print(f"Bulk data generation complete at {datetime.datetime.now()}.")
+    for table in ("customers", "products", "invoices", "invoice_items"):
+        print(f"  {table:<14} {totals[table]:>12,} rows  checksum {manifest['tables'][table]['checksum']}")
+    print(f"Load:  {load_seconds:.1f}s ({_rate(total_rows - totals['products'], load_seconds):,.0f} rows/s)")
+    print(f"Indexes, sequences and ANALYZE: {index_seconds:.1f}s; manifest checksums: {manifest_seconds:.1f}s")
+    print(f"Total: {total_rows:,} rows in {total_seconds:.1f}s ({_rate(total_rows, total_seconds):,.0f} rows/s end to end)")
+    print("--------------------------------------------------")
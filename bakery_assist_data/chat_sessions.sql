@@ -0,0 +1,14 @@
+-- Chat session spill tier
+-- Conversation sessions pushed out of a backend process's memory (BAKERY_CONVERSATION_SPILL=postgres)
+-- are kept here until their next message loads them back, or until they have been idle
+-- longer than BAKERY_CONVERSATION_TTL_SECONDS. `data` holds the verbatim turns and the
+-- rolling summary as JSON.
+
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id      VARCHAR(64) PRIMARY KEY,
+    customer_number VARCHAR(50) NOT NULL,
+    last_active     TIMESTAMPTZ NOT NULL,
+    data            TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_active ON chat_sessions (last_active);
@@ -0,0 +1,23 @@
+-- Customer change notifications
+-- Publishes '+<customer_pk>' on insert and '-<customer_pk>' on delete on the 'customer_changes'
+-- channel, so the backend's in-memory customer index picks up new and removed customers
+-- without waiting for its periodic delta poll.
+
+CREATE OR REPLACE FUNCTION notify_customer_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('customer_changes', '-' || OLD.customer_pk::text);
+    ELSE
+        PERFORM pg_notify('customer_changes', '+' || NEW.customer_pk::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_customers_notify_change ON customers;
+CREATE TRIGGER trg_customers_notify_change
+    AFTER INSERT OR DELETE ON customers
+    FOR EACH ROW EXECUTE FUNCTION notify_customer_change();
+
+-- The index's delta poll reads `WHERE updated_at > <last seen>` every few seconds in every worker
+CREATE INDEX IF NOT EXISTS idx_customer_updated_at ON customers (updated_at);
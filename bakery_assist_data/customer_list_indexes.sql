@@ -0,0 +1,23 @@
+-- Customer list indexes
+-- Supports GET /api/customers: keyset pages ordered by customer_pk, optionally filtered by
+-- customer_group and/or a case-insensitive substring of customer_name.
+
+-- Trigram index: lets `customer_name ILIKE '%term%'` use an index instead of scanning every row
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_customer_name_trgm ON customers USING gin (customer_name gin_trgm_ops);
+
+-- Group filter + keyset order in one index: WHERE customer_group = $1 AND customer_pk > $2 ORDER BY customer_pk
+CREATE INDEX IF NOT EXISTS idx_customer_group_pk ON customers (customer_group, customer_pk);
+
+-- Keep updated_at current on edits; the endpoint derives Last-Modified from it
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_customers_touch_updated_at ON customers;
+CREATE TRIGGER trg_customers_touch_updated_at
+    BEFORE UPDATE ON customers
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
@@ -0,0 +1,107 @@
+"""
+Dataset manifests: a JSON record of how a dataset was generated (seed, parameters) and
+what ended up in the database (row counts, content checksums), so benchmark runs can
+check they ran against the same data.
+
+Verify the current database against a manifest with:
+    python dataset_manifest.py verify dataset_manifest.json
+"""
+import datetime
+import json
+import sys
+
+# Generated columns per table. Audit timestamps (created_at, updated_at) are left out
+# because they record load time, not content.
+CHECKSUM_COLUMNS = {
+    "customers": ("customer_pk", "customer_number", "customer_name", "address_street", "address_city",
+                  "address_state", "address_zip", "email", "phone_number", "customer_group"),
+    "products": ("product_pk", "material_number", "product_name", "product_description", "base_unit_of_measure",
+                 "product_category", "unit_price", "is_active"),
+    "invoices": ("invoice_pk", "invoice_number", "customer_fk", "invoice_date", "due_date", "net_amount",
+                 "tax_amount", "total_amount", "currency", "status", "payment_terms"),
+    "invoice_items": ("invoice_item_pk", "invoice_fk", "product_fk", "item_number", "quantity", "unit_of_measure",
+                      "unit_price", "item_total_amount", "description"),
+}
+CHECKSUM_METHOD = "sum of 60-bit md5 prefixes of ROW(columns)::text"  # order independent, computed in Postgres
+
+
+def table_checksums(conn):
+    """Returns {table: {"rows": n, "checksum": "..."}} computed server-side over the generated columns."""
+    checksums = {}
+    with conn.cursor() as cur:
+        for table, columns in CHECKSUM_COLUMNS.items():
+            cur.execute(
+                f"SELECT count(*), COALESCE(sum(('x' || left(md5(ROW({', '.join(columns)})::text), 15))::bit(60)::bigint), 0) "
+                f"FROM {table}"
+            )
+            rows, checksum = cur.fetchone()
+            checksums[table] = {"rows": rows, "checksum": str(checksum)}
+    conn.commit()
+    return checksums
+
+
+def build_manifest(conn, generator, seed, parameters):
+    """
+    Assembles a manifest for the data currently in the database.
+
+    Args:
+        conn: psycopg2 connection to the generated database.
+        generator (str): Script that produced the data.
+        seed: Seed the data was generated from.
+        parameters (dict): Every other input that shapes the data (scale factors, as-of date, ...).
+    """
+    return {
+        "generator": generator,
+        "seed": seed,
+        "parameters": parameters,
+        "tables": table_checksums(conn),
+        "checksum_method": CHECKSUM_METHOD,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def write_manifest(path, manifest):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Dataset manifest written to {path}")
+
+
+def load_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_manifest(conn, manifest):
+    """Returns a list of human-readable differences between the database and `manifest` (empty if identical)."""
+    differences = []
+    actual = table_checksums(conn)
+    for table, expected in manifest["tables"].items():
+        found = actual.get(table)
+        if found is None:
+            differences.append(f"{table}: not checksummed")
+        elif found["rows"] != expected["rows"]:
+            differences.append(f"{table}: {found['rows']} rows, manifest has {expected['rows']}")
+        elif found["checksum"] != expected["checksum"]:
+            differences.append(f"{table}: same row count but contents differ")
+    return differences
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "verify":
+        print("Usage: python dataset_manifest.py verify <dataset_manifest.json>")
+        sys.exit(1)
+
+    from generate_bakery_data import connect_to_db
+
+    connection = connect_to_db()
+    if not connection:
+        sys.exit(2)
+    problems = verify_manifest(connection, load_manifest(sys.argv[2]))
+    connection.close()
+    if problems:
+        print("Database does NOT match the manifest:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("Database matches the manifest.")
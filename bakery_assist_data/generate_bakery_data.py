@@ -1,8 +1,10 @@
+import argparse
 import psycopg2
 from faker import Faker
 import datetime
 import random
 import decimal # Use Decimal for currency precision
+from dataset_manifest import build_manifest, write_manifest
 
 # --- Configuration ---
 # Database connection details - MODIFY THESE
@@ -45,6 +47,11 @@ fake = Faker('en_US')
 # Ensure unique numbers are generated across different calls if needed within a single run
 fake.unique.clear()
 
+def seed_generators(seed):
+    """Seeds both `random` and the shared Faker instance; the same seed reproduces the same values."""
+    random.seed(seed)
+    fake.seed_instance(seed)
+
 # --- Database Connection ---
 def connect_to_db():
     """Establishes connection to the PostgreSQL database."""
@@ -96,8 +103,8 @@ def create_fake_customer(conn):
         conn.rollback()
         return None
 
-def create_fake_product(conn):
-    """Generates and inserts a single fake bakery product."""
+def fake_product_fields():
+    """Generates the attributes of a fake bakery product (everything except its material number)."""
     category = random.choice(list(BAKERY_PRODUCT_TYPES.keys()))
     base = random.choice(BAKERY_PRODUCT_BASES)
     type_name = random.choice(BAKERY_PRODUCT_TYPES[category])
@@ -114,10 +121,6 @@ def create_fake_product(conn):
 
     product_name = product_name.replace("  ", " ").strip() # Clean up potential double spaces
 
-    # Generate a unique material number (simplified SAP-like)
-    cat_code = category[:3].upper()
-    mat_num = f"MAT-{cat_code}-{fake.unique.random_number(digits=4, fix_len=True)}"
-
     product_description = fake.sentence(nb_words=10)
 
     # Assign UOM and Price based on category
@@ -146,6 +149,17 @@ def create_fake_product(conn):
     unit_price = price.quantize(decimal.Decimal("0.01")) # Round to 2 decimal places
     is_active = random.random() > 0.05 # 95% chance of being active
 
+    return {"name": product_name, "description": product_description, "uom": uom,
+            "category": category, "price": unit_price, "is_active": is_active}
+
+def create_fake_product(conn):
+    """Generates and inserts a single fake bakery product."""
+    fields = fake_product_fields()
+
+    # Generate a unique material number (simplified SAP-like)
+    cat_code = fields["category"][:3].upper()
+    mat_num = f"MAT-{cat_code}-{fake.unique.random_number(digits=4, fix_len=True)}"
+
     try:
         cur = conn.cursor()
         cur.execute(
@@ -154,36 +168,44 @@ def create_fake_product(conn):
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             RETURNING product_pk, base_unit_of_measure, unit_price
             """,
-            (mat_num, product_name, product_description, uom, category, unit_price, is_active),
+            (mat_num, fields["name"], fields["description"], fields["uom"], fields["category"], fields["price"], fields["is_active"]),
         )
         product_pk, base_uom, price = cur.fetchone()
         conn.commit()
         cur.close()
         # print(f"Created Product: {mat_num} - {product_name} (PK: {product_pk})")
         # Return details needed for invoice items
-        return {"pk": product_pk, "uom": base_uom, "price": price, "name": product_name}
+        return {"pk": product_pk, "uom": base_uom, "price": price, "name": fields["name"]}
     except psycopg2.Error as e:
         print(f"Error inserting product {mat_num}: {e}")
         conn.rollback()
         return None
 
-def create_fake_invoice(conn, customer_fk):
-    """Generates and inserts a single fake invoice header."""
-    invoice_number = f"INV{datetime.date.today().year}{fake.unique.random_number(digits=7, fix_len=True)}"
-    invoice_date = fake.date_between(start_date="-2y", end_date="today")
+def fake_invoice_terms(as_of=None):
+    """
+    Generates invoice dates, payment terms and a status consistent with those dates.
+    Dates fall in the two years before `as_of` (default: today); pin it for reproducible data.
+    """
+    today = as_of or datetime.date.today()
+    invoice_date = fake.date_between(start_date=today - datetime.timedelta(days=730), end_date=today)
     days_to_due = random.choice([0, 15, 30, 45, 60])
     due_date = invoice_date + datetime.timedelta(days=days_to_due)
     payment_terms = f"Net {days_to_due}" if days_to_due > 0 else "Due on Receipt"
-    currency = "USD"
     status = random.choice(INVOICE_STATUSES)
     # Adjust status based on dates for more realism
-    if status == "Open" and due_date < datetime.date.today():
+    if status == "Open" and due_date < today:
         status = "Overdue"
-    if status == "Overdue" and invoice_date > datetime.date.today() - datetime.timedelta(days=10): # Less likely recent invoices are overdue
+    if status == "Overdue" and invoice_date > today - datetime.timedelta(days=10): # Less likely recent invoices are overdue
          status = "Open"
-    if status == "Paid" and invoice_date > datetime.date.today() - datetime.timedelta(days=5): # Less likely very recent invoices are paid
+    if status == "Paid" and invoice_date > today - datetime.timedelta(days=5): # Less likely very recent invoices are paid
          status = "Open"
+    return invoice_date, due_date, payment_terms, status
 
+def create_fake_invoice(conn, customer_fk, as_of=None):
+    """Generates and inserts a single fake invoice header."""
+    invoice_number = f"INV{(as_of or datetime.date.today()).year}{fake.unique.random_number(digits=7, fix_len=True)}"
+    invoice_date, due_date, payment_terms, status = fake_invoice_terms(as_of)
+    currency = "USD"
 
     # Initialize amounts to 0, will be updated after items are added
     net_amount = decimal.Decimal('0.00')
@@ -210,6 +232,21 @@ def create_fake_invoice(conn, customer_fk):
         conn.rollback()
         return None, None
 
+def fake_item_quantity(unit_of_measure):
+    """Generates a plausible invoice quantity for a unit of measure."""
+    if unit_of_measure == "DZ":
+        return decimal.Decimal(random.randint(1, 10)) # 1 to 10 dozens
+    elif unit_of_measure in ["KG", "LB"]:
+        return decimal.Decimal(random.uniform(0.5, 5.0)).quantize(decimal.Decimal("0.1")) # 0.5 to 5.0 kg/lb
+    else: # "EA"
+        return decimal.Decimal(random.randint(1, 50)) # 1 to 50 individual items
+
+def invoice_totals(net_amount):
+    """Returns (tax_amount, total_amount) for an invoice net amount."""
+    tax_amount = (net_amount * TAX_RATE).quantize(decimal.Decimal("0.01"))
+    total_amount = (net_amount + tax_amount).quantize(decimal.Decimal("0.01"))
+    return tax_amount, total_amount
+
 def create_fake_invoice_item(conn, invoice_fk, item_number, product_details):
     """Generates and inserts a single fake invoice item."""
     product_fk = product_details["pk"]
@@ -218,14 +255,7 @@ def create_fake_invoice_item(conn, invoice_fk, item_number, product_details):
     unit_price = product_details["price"]
     description = product_details["name"] # Use product name as description
 
-    # Generate quantity based on UOM
-    if unit_of_measure == "DZ":
-        quantity = decimal.Decimal(random.randint(1, 10)) # 1 to 10 dozens
-    elif unit_of_measure in ["KG", "LB"]:
-        quantity = decimal.Decimal(random.uniform(0.5, 5.0)).quantize(decimal.Decimal("0.1")) # 0.5 to 5.0 kg/lb
-    else: # "EA"
-        quantity = decimal.Decimal(random.randint(1, 50)) # 1 to 50 individual items
-
+    quantity = fake_item_quantity(unit_of_measure)
     item_total_amount = (quantity * unit_price).quantize(decimal.Decimal("0.01"))
 
     try:
@@ -249,8 +279,7 @@ def create_fake_invoice_item(conn, invoice_fk, item_number, product_details):
 
 def update_invoice_totals(conn, invoice_pk, net_amount):
     """Calculates tax and total amount and updates the invoice header."""
-    tax_amount = (net_amount * TAX_RATE).quantize(decimal.Decimal("0.01"))
-    total_amount = (net_amount + tax_amount).quantize(decimal.Decimal("0.01"))
+    tax_amount, total_amount = invoice_totals(net_amount)
 
     try:
         cur = conn.cursor()
@@ -273,8 +302,17 @@ def update_invoice_totals(conn, invoice_pk, net_amount):
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate fake bakery data row by row.")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data (default: random, recorded in the manifest)")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="reference date for invoice dates and statuses (YYYY-MM-DD)")
+    parser.add_argument("--manifest", default="dataset_manifest.json", help="where to write the dataset manifest")
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.randrange(2**63)
+    seed_generators(seed)
+
     start_time = datetime.datetime.now()
-    print(f"Starting fake data generation at {start_time}...")
+    print(f"Starting fake data generation at {start_time} (seed {seed}, as of {args.as_of})...")
 
     connection = connect_to_db()
     if connection:
@@ -305,7 +343,7 @@ if __name__ == "__main__":
                 num_invoices_for_customer = random.randint(1, MAX_INVOICES_PER_CUSTOMER)
                 # print(f"  Generating {num_invoices_for_customer} invoices for Customer PK {customer_pk}...")
                 for _ in range(num_invoices_for_customer):
-                    invoice_pk, invoice_number = create_fake_invoice(connection, customer_pk)
+                    invoice_pk, invoice_number = create_fake_invoice(connection, customer_pk, args.as_of)
                     if invoice_pk:
                         total_invoices_created += 1
                         invoice_net_amount = decimal.Decimal('0.00')
@@ -344,6 +382,15 @@ if __name__ == "__main__":
                 if (i + 1) % 20 == 0: print(f"  ...processed invoices for {i+1} customers")
 
 
+        # Keys come from SERIAL columns, so the same seed only reproduces the data on freshly created tables
+        manifest = build_manifest(connection, "generate_bakery_data.py", seed, {
+            "as_of": args.as_of.isoformat(),
+            "customers": NUM_CUSTOMERS,
+            "products": NUM_PRODUCTS,
+            "max_invoices_per_customer": MAX_INVOICES_PER_CUSTOMER,
+            "max_items_per_invoice": MAX_ITEMS_PER_INVOICE,
+        })
+        write_manifest(args.manifest, manifest)
         connection.close()
         end_time = datetime.datetime.now()
         print(f"\n--------------------------------------------------")
@@ -0,0 +1,31 @@
+class BlockIdAllocator:
+    """
+    Coordination-free ID allocator for parallel generators.
+
+    The key space is cut into fixed-size blocks and block k always covers the same
+    IDs: [start + k * block_size, start + (k + 1) * block_size). A worker that owns a
+    block index (e.g. a customer, or a range of customers) can mint IDs for it without
+    asking anyone else, and two workers can never collide. Unused IDs in a block are
+    simply left as gaps.
+    """
+
+    def __init__(self, block_size, start=1):
+        if block_size < 1:
+            raise ValueError("block_size must be positive")
+        self.block_size = block_size
+        self.start = start
+
+    def block(self, block_index):
+        """Returns the range of IDs owned by block `block_index` (0-based)."""
+        first = self.start + block_index * self.block_size
+        return range(first, first + self.block_size)
+
+    def id_for(self, block_index, offset):
+        """Returns the `offset`-th ID (0-based) of block `block_index`."""
+        if not 0 <= offset < self.block_size:
+            raise ValueError(f"offset {offset} outside block of size {self.block_size}")
+        return self.start + block_index * self.block_size + offset
+
+    def max_id(self, num_blocks):
+        """Highest ID that `num_blocks` blocks can hand out (used to check the key space)."""
+        return self.start + num_blocks * self.block_size - 1
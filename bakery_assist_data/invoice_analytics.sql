@@ -0,0 +1,210 @@
+-- Invoice analytics summary tables
+-- Per-customer aggregates behind the analytics tools (spend by period, outstanding balance,
+-- top products, order frequency), so a chat reads a handful of pre-aggregated rows instead
+-- of scanning the customer's invoices and invoice items.
+--
+-- Refresh is incremental per customer: triggers on invoices/invoice_items only mark the
+-- customer in analytics_dirty_customers, and refresh_customer_analytics() recomputes that
+-- one customer's rows. The backend refreshes dirty customers in the background (woken by
+-- the 'invoice_changes' notifications) and before answering an analytics tool call for a
+-- dirty customer, so answers never lag behind the invoices.
+-- After a bulk load (which runs with triggers disabled) call refresh_all_customer_analytics().
+
+-- Spend and order counts per customer and calendar month
+CREATE TABLE IF NOT EXISTS customer_monthly_spend (
+    customer_fk INTEGER NOT NULL REFERENCES customers(customer_pk) ON DELETE CASCADE,
+    month DATE NOT NULL, -- first day of the month
+    invoice_count INTEGER NOT NULL,
+    net_amount NUMERIC(14, 2) NOT NULL,
+    tax_amount NUMERIC(14, 2) NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL,
+    first_invoice_date DATE NOT NULL,
+    last_invoice_date DATE NOT NULL,
+    PRIMARY KEY (customer_fk, month)
+);
+
+-- Unpaid invoices per customer, due date and status; "overdue" is decided at read time
+-- because an Open invoice becomes overdue without any row changing
+CREATE TABLE IF NOT EXISTS customer_open_balances (
+    customer_fk INTEGER NOT NULL REFERENCES customers(customer_pk) ON DELETE CASCADE,
+    due_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL,
+    PRIMARY KEY (customer_fk, due_date, status)
+);
+
+-- Lifetime quantity and revenue per customer and product
+CREATE TABLE IF NOT EXISTS customer_product_totals (
+    customer_fk INTEGER NOT NULL REFERENCES customers(customer_pk) ON DELETE CASCADE,
+    product_fk INTEGER NOT NULL REFERENCES products(product_pk) ON DELETE CASCADE,
+    quantity NUMERIC(14, 2) NOT NULL,
+    revenue NUMERIC(14, 2) NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    last_invoice_date DATE NOT NULL,
+    PRIMARY KEY (customer_fk, product_fk)
+);
+
+-- Customers whose summary rows are stale
+CREATE TABLE IF NOT EXISTS analytics_dirty_customers (
+    customer_fk INTEGER PRIMARY KEY,
+    marked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Cancelled invoices are not spend; everything else counts
+CREATE OR REPLACE FUNCTION refresh_customer_analytics(p_customer INTEGER) RETURNS void AS $$
+BEGIN
+    -- Serializes concurrent refreshes of the same customer (background worker vs. tool call)
+    PERFORM pg_advisory_xact_lock(hashtext('customer_analytics'), p_customer);
+    DELETE FROM analytics_dirty_customers WHERE customer_fk = p_customer;
+
+    DELETE FROM customer_monthly_spend WHERE customer_fk = p_customer;
+    INSERT INTO customer_monthly_spend
+    SELECT customer_fk, date_trunc('month', invoice_date)::date, COUNT(*),
+           SUM(net_amount), SUM(tax_amount), SUM(total_amount), MIN(invoice_date), MAX(invoice_date)
+    FROM invoices
+    WHERE customer_fk = p_customer AND status <> 'Cancelled'
+    GROUP BY customer_fk, date_trunc('month', invoice_date);
+
+    DELETE FROM customer_open_balances WHERE customer_fk = p_customer;
+    INSERT INTO customer_open_balances
+    SELECT customer_fk, due_date, status, COUNT(*), SUM(total_amount)
+    FROM invoices
+    WHERE customer_fk = p_customer AND status IN ('Open', 'Overdue')
+    GROUP BY customer_fk, due_date, status;
+
+    DELETE FROM customer_product_totals WHERE customer_fk = p_customer;
+    INSERT INTO customer_product_totals
+    SELECT inv.customer_fk, item.product_fk, SUM(item.quantity), SUM(item.item_total_amount),
+           COUNT(DISTINCT inv.invoice_pk), MAX(inv.invoice_date)
+    FROM invoices inv
+    JOIN invoice_items item ON item.invoice_fk = inv.invoice_pk
+    WHERE inv.customer_fk = p_customer AND inv.status <> 'Cancelled'
+    GROUP BY inv.customer_fk, item.product_fk;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refreshes `p_customer` only if it is marked dirty; cheap (one PK probe) when it is not
+CREATE OR REPLACE FUNCTION refresh_customer_analytics_if_dirty(p_customer INTEGER) RETURNS boolean AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM analytics_dirty_customers WHERE customer_fk = p_customer) THEN
+        PERFORM refresh_customer_analytics(p_customer);
+        RETURN true;
+    END IF;
+    RETURN false;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refreshes up to `p_limit` dirty customers, oldest first; returns how many were refreshed.
+-- Takes the locks in the same order as refresh_customer_analytics_if_dirty (advisory lock,
+-- then the dirty row, which refresh_customer_analytics deletes), so a drain and a tool read
+-- cannot deadlock. Customers another session is refreshing right now are skipped. Keep
+-- `p_limit` small: the whole batch is one transaction, and its row locks hold up the
+-- dirty-marking triggers of concurrent invoice writes for those customers.
+CREATE OR REPLACE FUNCTION refresh_dirty_customer_analytics(p_limit INTEGER DEFAULT 25) RETURNS integer AS $$
+DECLARE
+    dirty_customer INTEGER;
+    refreshed INTEGER := 0;
+BEGIN
+    FOR dirty_customer IN
+        SELECT customer_fk FROM analytics_dirty_customers
+        ORDER BY marked_at
+        LIMIT p_limit
+    LOOP
+        -- Re-check after locking: a concurrent refresh may have cleaned the customer meanwhile
+        IF pg_try_advisory_xact_lock(hashtext('customer_analytics'), dirty_customer)
+           AND EXISTS (SELECT 1 FROM analytics_dirty_customers WHERE customer_fk = dirty_customer) THEN
+            PERFORM refresh_customer_analytics(dirty_customer);
+            refreshed := refreshed + 1;
+        END IF;
+    END LOOP;
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Full rebuild with set-based inserts (one pass over each table), e.g. after a bulk load
+CREATE OR REPLACE FUNCTION refresh_all_customer_analytics() RETURNS void AS $$
+BEGIN
+    TRUNCATE customer_monthly_spend, customer_open_balances, customer_product_totals, analytics_dirty_customers;
+
+    INSERT INTO customer_monthly_spend
+    SELECT customer_fk, date_trunc('month', invoice_date)::date, COUNT(*),
+           SUM(net_amount), SUM(tax_amount), SUM(total_amount), MIN(invoice_date), MAX(invoice_date)
+    FROM invoices
+    WHERE status <> 'Cancelled'
+    GROUP BY customer_fk, date_trunc('month', invoice_date);
+
+    INSERT INTO customer_open_balances
+    SELECT customer_fk, due_date, status, COUNT(*), SUM(total_amount)
+    FROM invoices
+    WHERE status IN ('Open', 'Overdue')
+    GROUP BY customer_fk, due_date, status;
+
+    INSERT INTO customer_product_totals
+    SELECT inv.customer_fk, item.product_fk, SUM(item.quantity), SUM(item.item_total_amount),
+           COUNT(DISTINCT inv.invoice_pk), MAX(inv.invoice_date)
+    FROM invoices inv
+    JOIN invoice_items item ON item.invoice_fk = inv.invoice_pk
+    WHERE inv.status <> 'Cancelled'
+    GROUP BY inv.customer_fk, item.product_fk;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Statement-level triggers: one dirty mark per customer per statement, however many rows changed
+CREATE OR REPLACE FUNCTION mark_invoice_customers_dirty() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'invoices' THEN
+        INSERT INTO analytics_dirty_customers (customer_fk)
+        SELECT customer_fk FROM changed_rows
+        ON CONFLICT (customer_fk) DO NOTHING;
+    ELSE
+        INSERT INTO analytics_dirty_customers (customer_fk)
+        SELECT DISTINCT inv.customer_fk
+        FROM changed_rows item
+        JOIN invoices inv ON inv.invoice_pk = item.invoice_fk
+        ON CONFLICT (customer_fk) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_invoices_analytics_insert ON invoices;
+CREATE TRIGGER trg_invoices_analytics_insert
+    AFTER INSERT ON invoices REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+DROP TRIGGER IF EXISTS trg_invoices_analytics_update_new ON invoices;
+CREATE TRIGGER trg_invoices_analytics_update_new
+    AFTER UPDATE ON invoices REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+-- An invoice moved to another customer changes the old customer's aggregates too
+DROP TRIGGER IF EXISTS trg_invoices_analytics_update_old ON invoices;
+CREATE TRIGGER trg_invoices_analytics_update_old
+    AFTER UPDATE ON invoices REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+DROP TRIGGER IF EXISTS trg_invoices_analytics_delete ON invoices;
+CREATE TRIGGER trg_invoices_analytics_delete
+    AFTER DELETE ON invoices REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+DROP TRIGGER IF EXISTS trg_invoice_items_analytics_insert ON invoice_items;
+CREATE TRIGGER trg_invoice_items_analytics_insert
+    AFTER INSERT ON invoice_items REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+DROP TRIGGER IF EXISTS trg_invoice_items_analytics_update ON invoice_items;
+CREATE TRIGGER trg_invoice_items_analytics_update
+    AFTER UPDATE ON invoice_items REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+-- Items deleted by ON DELETE CASCADE from a deleted invoice are covered by the invoice trigger
+DROP TRIGGER IF EXISTS trg_invoice_items_analytics_delete ON invoice_items;
+CREATE TRIGGER trg_invoice_items_analytics_delete
+    AFTER DELETE ON invoice_items REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_invoice_customers_dirty();
+
+SELECT refresh_all_customer_analytics();
@@ -0,0 +1,41 @@
+-- Invoice change notifications
+-- Publishes the affected customer_pk on the 'invoice_changes' channel whenever invoices or
+-- invoice items are written, so the backend can invalidate cached replies and tool results.
+-- Postgres folds identical payloads within one transaction into a single notification.
+
+CREATE OR REPLACE FUNCTION notify_invoice_change() RETURNS trigger AS $$
+DECLARE
+    changed_customer INTEGER;
+BEGIN
+    IF TG_TABLE_NAME = 'invoices' THEN
+        IF TG_OP = 'DELETE' THEN
+            changed_customer := OLD.customer_fk;
+        ELSE
+            changed_customer := NEW.customer_fk;
+            -- An invoice moved to another customer changes both customers' data
+            IF TG_OP = 'UPDATE' AND OLD.customer_fk IS DISTINCT FROM NEW.customer_fk THEN
+                PERFORM pg_notify('invoice_changes', OLD.customer_fk::text);
+            END IF;
+        END IF;
+    ELSE
+        SELECT customer_fk INTO changed_customer
+        FROM invoices
+        WHERE invoice_pk = CASE WHEN TG_OP = 'DELETE' THEN OLD.invoice_fk ELSE NEW.invoice_fk END;
+    END IF;
+
+    IF changed_customer IS NOT NULL THEN
+        PERFORM pg_notify('invoice_changes', changed_customer::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_invoices_notify_change ON invoices;
+CREATE TRIGGER trg_invoices_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON invoices
+    FOR EACH ROW EXECUTE FUNCTION notify_invoice_change();
+
+DROP TRIGGER IF EXISTS trg_invoice_items_notify_change ON invoice_items;
+CREATE TRIGGER trg_invoice_items_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON invoice_items
+    FOR EACH ROW EXECUTE FUNCTION notify_invoice_change();
@@ -58,6 +58,8 @@ export default function ChatPage() {
   const [error, setError] = useState(null);
 
   const messagesEndRef = useRef(null);
+  // Conversation session issued by the backend; sent back so follow-up questions have context
+  const sessionIdRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -86,15 +88,17 @@ export default function ChatPage() {
     try {
       const apiUrlWithParam = `${CHAT_API_BASE_ENDPOINT}?customer_number=${encodeURIComponent(
         customerId
-      )}`;
+      )}&stream=true`;
 
       const response = await fetch(apiUrlWithParam, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          Accept: "text/event-stream",
         },
         body: JSON.stringify({
           message: trimmedInput,
+          ...(sessionIdRef.current ? { session_id: sessionIdRef.current } : {}),
         }),
       });
 
@@ -106,24 +110,72 @@ export default function ChatPage() {
         );
       }
 
-      const data = await response.json();
-
-      // --- MODIFIED: Check for 'reply' field instead of 'response' ---
-      if (!data || typeof data.reply !== "string") {
-        // Updated check
-        throw new Error(
-          "Invalid response format received from the server (expected 'reply' field)." // Updated error message
+      // --- Render tokens as they arrive (Server-Sent Events) ---
+      const botMessageId = `bot-${Date.now()}`;
+      let botMessageAdded = false;
+
+      const appendToBotMessage = (text) => {
+        if (!botMessageAdded) {
+          botMessageAdded = true;
+          setIsLoading(false); // Replace the typing indicator with the reply
+          setMessages((prevMessages) => [
+            ...prevMessages,
+            { id: botMessageId, sender: "bot", text },
+          ]);
+          return;
+        }
+        setMessages((prevMessages) =>
+          prevMessages.map((msg) =>
+            msg.id === botMessageId ? { ...msg, text: msg.text + text } : msg
+          )
         );
-      }
+      };
 
-      const botMessage = {
-        id: `bot-${Date.now()}`,
-        sender: "bot",
-        // --- MODIFIED: Use data.reply ---
-        text: data.reply, // Use the 'reply' field from the JSON
+      const handleEvent = (rawEvent) => {
+        let eventName = "message";
+        let data = "";
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event:")) eventName = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (!data) return;
+        const payload = JSON.parse(data);
+
+        if (eventName === "error") {
+          throw new Error(payload.error || "Streaming error from the server.");
+        } else if (eventName === "done") {
+          if (typeof payload.session_id === "string") {
+            sessionIdRef.current = payload.session_id;
+          }
+          if (!botMessageAdded && typeof payload.reply === "string") {
+            appendToBotMessage(payload.reply);
+          }
+        } else if (typeof payload.token === "string") {
+          appendToBotMessage(payload.token);
+        }
       };
 
-      setMessages((prevMessages) => [...prevMessages, botMessage]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+          handleEvent(buffer.slice(0, boundary));
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf("\n\n");
+        }
+      }
+      if (buffer.trim()) handleEvent(buffer);
+
+      if (!botMessageAdded) {
+        throw new Error("Empty response received from the server.");
+      }
     } catch (err) {
       console.error("Failed to send message or get response:", err);
       setError(err.message || "An unexpected error occurred.");
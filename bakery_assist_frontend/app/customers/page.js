@@ -1,7 +1,7 @@
 "use client";
 
 import { useRouter } from "next/navigation"; // Import useRouter for navigation
-import { useEffect, useState } from "react"; // Import hooks for client-side data fetching
+import { useCallback, useEffect, useState } from "react"; // Import hooks for client-side data fetching
 import {
   Table,
   TableBody,
@@ -39,47 +39,100 @@ function CustomerTableSkeleton() {
   );
 }
 
+// --- API ---
+const CUSTOMERS_API_ENDPOINT = "http://127.0.0.1:5000/api/customers";
+const PAGE_SIZE = 50;
+const CUSTOMER_GROUPS = ["Retail", "Wholesale", "Cafe", "Online Order", "Event Catering"];
+
+// Builds the URL of one keyset page: `after` is the last customer_pk already shown
+function customersPageUrl({ after, search, group }) {
+  const params = new URLSearchParams({
+    limit: String(PAGE_SIZE),
+    fields: "customer_pk,customer_name,customer_group",
+  });
+  if (after) params.set("after", String(after));
+  if (search) params.set("q", search);
+  if (group) params.set("group", group);
+  return `${CUSTOMERS_API_ENDPOINT}?${params.toString()}`;
+}
+
 // --- Main Component ---
 export default function Customers() {
   // --- State for data, loading, and error ---
   // Since this is now a Client Component, we manage state with useState
   const [customers, setCustomers] = useState(null);
+  const [nextAfter, setNextAfter] = useState(null); // cursor of the next page, null when no more pages
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
+  // --- Filters (search is debounced so typing doesn't fire a request per key) ---
+  const [searchInput, setSearchInput] = useState("");
+  const [search, setSearch] = useState("");
+  const [group, setGroup] = useState("");
+
   // --- useRouter hook ---
   const router = useRouter(); // Initialize the router
 
+  useEffect(() => {
+    const timer = setTimeout(() => setSearch(searchInput.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchInput]);
+
   // --- Data Fetching Logic ---
-  // Use useEffect to fetch data when the component mounts
+  // The browser revalidates with If-None-Match, so unchanged pages come back as 304s
+  const fetchPage = useCallback(
+    async (after) => {
+      const res = await fetch(customersPageUrl({ after, search, group }));
+      if (!res.ok) {
+        throw new Error(`Failed to fetch: ${res.status} ${res.statusText}`);
+      }
+      return res.json(); // { customers: [...], next_after: <customer_pk or null> }
+    },
+    [search, group]
+  );
+
+  // First page: runs on mount and whenever the filters change
   useEffect(() => {
-    async function fetchCustomers() {
+    let cancelled = false;
+    async function fetchFirstPage() {
       setIsLoading(true); // Start loading
       setError(null); // Reset error
-      const apiUrl = "http://127.0.0.1:5000/api/customers";
-
       try {
-        // Optional: Simulate network delay
-        // await new Promise(resolve => setTimeout(resolve, 1500));
-
-        const res = await fetch(apiUrl);
-
-        if (!res.ok) {
-          throw new Error(`Failed to fetch: ${res.status} ${res.statusText}`);
-        }
-
-        const data = await res.json();
-        setCustomers(data); // Set fetched data
+        const data = await fetchPage(null);
+        if (cancelled) return;
+        setCustomers(data.customers);
+        setNextAfter(data.next_after);
       } catch (err) {
+        if (cancelled) return;
         console.error("Failed to fetch customers:", err);
         setError(err.message || "Network error or failed to fetch");
       } finally {
-        setIsLoading(false); // Stop loading regardless of success/error
+        if (!cancelled) setIsLoading(false); // Stop loading regardless of success/error
       }
     }
 
-    fetchCustomers();
-  }, []); // Empty dependency array means this runs once on mount
+    fetchFirstPage();
+    return () => {
+      cancelled = true; // ignore responses for filters that are no longer current
+    };
+  }, [fetchPage]);
+
+  // Next page: appends to the rows already shown
+  const handleLoadMore = async () => {
+    if (!nextAfter || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const data = await fetchPage(nextAfter);
+      setCustomers((previous) => [...(previous || []), ...data.customers]);
+      setNextAfter(data.next_after);
+    } catch (err) {
+      console.error("Failed to fetch more customers:", err);
+      setError(err.message || "Network error or failed to fetch");
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
   // --- Click Handler ---
   const handleRowClick = (customerId) => {
@@ -96,6 +149,27 @@ export default function Customers() {
           <p className="text-sm text-gray-500 mt-1">
             A list of all registered customers. Click a row to chat.
           </p>
+          <div className="mt-4 flex flex-col sm:flex-row gap-3">
+            <input
+              type="search"
+              value={searchInput}
+              onChange={(e) => setSearchInput(e.target.value)}
+              placeholder="Search by name..."
+              className="flex-1 rounded-md border border-gray-300 px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-orange-300"
+            />
+            <select
+              value={group}
+              onChange={(e) => setGroup(e.target.value)}
+              className="rounded-md border border-gray-300 px-3 py-2 text-sm text-gray-700 focus:outline-none focus:ring-2 focus:ring-orange-300"
+            >
+              <option value="">All groups</option>
+              {CUSTOMER_GROUPS.map((customerGroup) => (
+                <option key={customerGroup} value={customerGroup}>
+                  {customerGroup}
+                </option>
+              ))}
+            </select>
+          </div>
         </div>
 
         <div className="p-0">
@@ -150,8 +224,20 @@ export default function Customers() {
           )}
         </div>
         {!error && customers && customers.length > 0 && (
-          <div className="p-4 border-t border-gray-200 bg-gray-50/50 text-xs text-gray-500">
-            Total Customers: {customers.length}
+          <div className="p-4 border-t border-gray-200 bg-gray-50/50 text-xs text-gray-500 flex items-center justify-between">
+            <span>
+              Showing {customers.length} customers{nextAfter ? "" : " (all loaded)"}
+            </span>
+            {nextAfter && (
+              <button
+                type="button"
+                onClick={handleLoadMore}
+                disabled={isLoadingMore}
+                className="rounded-md bg-orange-500 px-3 py-1.5 text-xs font-medium text-white hover:bg-orange-600 disabled:opacity-50"
+              >
+                {isLoadingMore ? "Loading..." : "Load more"}
+              </button>
+            )}
           </div>
         )}
       </div>